@@ -1,10 +1,12 @@
 resource "aws_cloudwatch_metric_alarm" "idle_runners_low" {
+  count = local.alarm_scaling_enabled ? 1 : 0
+
   alarm_name          = "IdleRunnersTooLow-${aws_autoscaling_group.actions-runner.name}"
   comparison_operator = "LessThanThreshold"
-  evaluation_periods  = max(1, ceil(var.autoscaling_scaleout_evaluation_period / 60))
+  evaluation_periods  = max(1, ceil(var.autoscaling_scaleout_evaluation_period / var.runner_metrics_period))
   metric_name         = "IdleRunners"
   namespace           = "GitHubRunners"
-  period              = 60
+  period              = var.runner_metrics_period
   statistic           = "Average"
   threshold           = var.idle_runners_target_count
   alarm_description   = "Idle runners below safe threshold"
@@ -12,10 +14,12 @@ resource "aws_cloudwatch_metric_alarm" "idle_runners_low" {
     asg_name = aws_autoscaling_group.actions-runner.name
   }
 
-  alarm_actions = [aws_autoscaling_policy.scale_out.arn]
+  alarm_actions = [aws_autoscaling_policy.scale_out[0].arn]
 }
 
 resource "aws_cloudwatch_metric_alarm" "idle_runners_high" {
+  count = local.alarm_scaling_enabled ? 1 : 0
+
   alarm_name          = "IdleRunnersTooHigh-${aws_autoscaling_group.actions-runner.name}"
   comparison_operator = "GreaterThanThreshold"
   evaluation_periods  = 3
@@ -29,10 +33,34 @@ resource "aws_cloudwatch_metric_alarm" "idle_runners_high" {
     asg_name = aws_autoscaling_group.actions-runner.name
   }
 
-  alarm_actions = [aws_autoscaling_policy.scale_in.arn]
+  alarm_actions = [aws_autoscaling_policy.scale_in[0].arn]
+}
+
+# Scales out on backlog: jobs waiting for a runner show up here before
+# the idle runner count hits zero and stays there long enough to alarm.
+resource "aws_cloudwatch_metric_alarm" "queued_jobs_high" {
+  count = local.alarm_scaling_enabled && local.queued_jobs_enabled && var.queued_jobs_scaleout_threshold != null ? 1 : 0
+
+  alarm_name          = "QueuedJobsTooHigh-${aws_autoscaling_group.actions-runner.name}"
+  comparison_operator = "GreaterThanOrEqualToThreshold"
+  evaluation_periods  = 1
+  metric_name         = "QueuedJobs"
+  namespace           = "GitHubRunners"
+  period              = 60
+  statistic           = "Maximum"
+  threshold           = var.queued_jobs_scaleout_threshold
+  alarm_description   = "Jobs are waiting for a runner"
+  dimensions = {
+    asg_name = aws_autoscaling_group.actions-runner.name
+  }
+  treat_missing_data = "notBreaching"
+
+  alarm_actions = [aws_autoscaling_policy.scale_out[0].arn]
 }
 
 resource "aws_autoscaling_policy" "scale_out" {
+  count = local.alarm_scaling_enabled ? 1 : 0
+
   name                   = "scale-out-idle-runners"
   scaling_adjustment     = var.autoscaling_step
   adjustment_type        = "ChangeInCapacity"
@@ -42,6 +70,8 @@ resource "aws_autoscaling_policy" "scale_out" {
 }
 
 resource "aws_autoscaling_policy" "scale_in" {
+  count = local.alarm_scaling_enabled ? 1 : 0
+
   name                   = "scale-in-idle-runners"
   scaling_adjustment     = -var.autoscaling_step
   adjustment_type        = "ChangeInCapacity"
@@ -49,3 +79,23 @@ resource "aws_autoscaling_policy" "scale_in" {
   autoscaling_group_name = aws_autoscaling_group.actions-runner.name
   policy_type            = "SimpleScaling"
 }
+
+moved {
+  from = aws_cloudwatch_metric_alarm.idle_runners_low
+  to   = aws_cloudwatch_metric_alarm.idle_runners_low[0]
+}
+
+moved {
+  from = aws_cloudwatch_metric_alarm.idle_runners_high
+  to   = aws_cloudwatch_metric_alarm.idle_runners_high[0]
+}
+
+moved {
+  from = aws_autoscaling_policy.scale_out
+  to   = aws_autoscaling_policy.scale_out[0]
+}
+
+moved {
+  from = aws_autoscaling_policy.scale_in
+  to   = aws_autoscaling_policy.scale_in[0]
+}
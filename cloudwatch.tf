@@ -272,6 +272,21 @@ module "record_metric" {
   }
   github_app_id = var.github_app_id
 
+  metric_sample_count    = 60 / var.runner_metrics_period
+  metric_sample_interval = var.runner_metrics_period
+  metrics_emitter        = var.runner_metrics_emitter
+
+  queued_jobs_repositories = var.queued_jobs_repositories
+  queued_jobs_source       = local.webhook_enabled ? "webhook" : "github"
+  runner_labels            = concat(local.runner_default_labels, local.runner_labels)
+  state_table_name         = aws_dynamodb_table.state.name
+  state_table_arn          = aws_dynamodb_table.state.arn
+
+  autoscaling_mode          = var.autoscaling_mode
+  idle_runners_target_count = var.idle_runners_target_count
+  protect_busy_runners      = var.autoscaling_protect_busy_runners
+  scale_in_damping          = var.autoscaling_scalein_damping
+
   alarm_emails         = var.alarm_emails
   error_rate_threshold = var.error_rate_threshold
 
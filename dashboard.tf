@@ -8,14 +8,18 @@ locals {
       aws_cloudwatch_metric_alarm.asg_zero_in_service.arn,
       aws_cloudwatch_metric_alarm.asg_launch_stuck.arn,
       aws_cloudwatch_metric_alarm.runner_registration_gap.arn,
-      aws_cloudwatch_metric_alarm.idle_runners_low.arn,
-      aws_cloudwatch_metric_alarm.idle_runners_high.arn,
     ],
+    aws_cloudwatch_metric_alarm.idle_runners_low[*].arn,
+    aws_cloudwatch_metric_alarm.idle_runners_high[*].arn,
     aws_cloudwatch_metric_alarm.asg_at_max[*].arn,
     aws_cloudwatch_metric_alarm.asg_saturated_at_max[*].arn,
     aws_cloudwatch_metric_alarm.warm_pool_empty[*].arn,
+    aws_cloudwatch_metric_alarm.queued_jobs_high[*].arn,
   )
 
+  # Lambdas that publish the PhaseDuration metric, one dashboard widget each.
+  dashboard_phase_functions = ["record_metric", "registration", "deregistration"]
+
   dashboard_identity_line = join(" · ", compact([
     "**env:** ${var.environment}",
     length(var.extra_labels) > 0 ? "**labels:** ${join(", ", var.extra_labels)}" : "",
@@ -79,13 +83,14 @@ locals {
         width  = 12
         height = 6
         properties = {
-          title  = "Runners (Idle / Busy) with scale thresholds"
+          title  = "Runners (Idle / Busy / Queued jobs) with scale thresholds"
           view   = "timeSeries"
           region = local.dashboard_region
           period = 60
           metrics = [
             ["GitHubRunners", "IdleRunners", "asg_name", local.asg_name, { label = "Idle", stat = "Average" }],
             [".", "BusyRunners", ".", ".", { label = "Busy", stat = "Average" }],
+            [".", "QueuedJobs", ".", ".", { label = "Queued jobs", stat = "Maximum" }],
           ]
           annotations = {
             horizontal = [
@@ -182,6 +187,7 @@ locals {
             [".", "WarmPoolWarmedCapacity", ".", ".", { label = "Warmed", stat = "Average" }],
             [".", "WarmPoolPendingCapacity", ".", ".", { label = "Pending", stat = "Average" }],
             [".", "WarmPoolTerminatingCapacity", ".", ".", { label = "Terminating", stat = "Average" }],
+            ["GitHubRunners", "WarmPoolTargetSize", "asg_name", local.asg_name, { label = "Tuner target", stat = "Maximum" }],
           ]
           yAxis = {
             left = { min = 0 }
@@ -213,6 +219,96 @@ locals {
         type   = "metric"
         x      = 0
         y      = 27
+        width  = 12
+        height = 6
+        properties = {
+          title  = "Launch to runner online (s)"
+          view   = "timeSeries"
+          region = local.dashboard_region
+          period = 300
+          metrics = [
+            ["GitHubRunners", "LaunchLatency", "asg_name", local.asg_name, "stage", "runner_online", "launch_type", "cold", { label = "Cold p50", stat = "p50" }],
+            ["...", { label = "Cold p90", stat = "p90" }],
+            ["...", { label = "Cold p99", stat = "p99" }],
+            ["GitHubRunners", "LaunchLatency", "asg_name", local.asg_name, "stage", "runner_online", "launch_type", "resume", { label = "Resume p50", stat = "p50" }],
+            ["...", { label = "Resume p90", stat = "p90" }],
+            ["...", { label = "Resume p99", stat = "p99" }],
+          ]
+          yAxis = {
+            left = { min = 0, label = "s" }
+          }
+        }
+      },
+      {
+        type   = "metric"
+        x      = 12
+        y      = 27
+        width  = 12
+        height = 6
+        properties = {
+          title  = "Launch to in service (s)"
+          view   = "timeSeries"
+          region = local.dashboard_region
+          period = 300
+          metrics = [
+            ["GitHubRunners", "LaunchLatency", "asg_name", local.asg_name, "stage", "in_service", "launch_type", "cold", { label = "Cold p50", stat = "p50" }],
+            ["...", { label = "Cold p90", stat = "p90" }],
+            ["...", { label = "Cold p99", stat = "p99" }],
+            ["GitHubRunners", "LaunchLatency", "asg_name", local.asg_name, "stage", "in_service", "launch_type", "resume", { label = "Resume p50", stat = "p50" }],
+            ["...", { label = "Resume p90", stat = "p90" }],
+            ["...", { label = "Resume p99", stat = "p99" }],
+          ]
+          yAxis = {
+            left = { min = 0, label = "s" }
+          }
+        }
+      },
+      {
+        type   = "metric"
+        x      = 0
+        y      = 33
+        width  = 12
+        height = 6
+        properties = {
+          title  = "Job wait for a runner (s)"
+          view   = "timeSeries"
+          region = local.dashboard_region
+          period = 300
+          metrics = [
+            ["GitHubRunners", "JobWaitTime", "asg_name", local.asg_name, { label = "p50", stat = "p50" }],
+            ["...", { label = "p90", stat = "p90" }],
+            ["...", { label = "p99", stat = "p99" }],
+          ]
+          yAxis = {
+            left = { min = 0, label = "s" }
+          }
+        }
+      },
+      {
+        type   = "metric"
+        x      = 12
+        y      = 33
+        width  = 12
+        height = 6
+        properties = {
+          title  = "Job duration (s)"
+          view   = "timeSeries"
+          region = local.dashboard_region
+          period = 300
+          metrics = [
+            ["GitHubRunners", "JobDuration", "asg_name", local.asg_name, { label = "p50", stat = "p50" }],
+            ["...", { label = "p90", stat = "p90" }],
+            ["...", { label = "p99", stat = "p99" }],
+          ]
+          yAxis = {
+            left = { min = 0, label = "s" }
+          }
+        }
+      },
+      {
+        type   = "metric"
+        x      = 0
+        y      = 39
         width  = 24
         height = 6
         properties = {
@@ -236,7 +332,7 @@ locals {
       {
         type   = "text"
         x      = 0
-        y      = 33
+        y      = 45
         width  = 24
         height = 1
         properties = {
@@ -246,7 +342,7 @@ locals {
       {
         type   = "metric"
         x      = 0
-        y      = 34
+        y      = 46
         width  = 8
         height = 6
         properties = {
@@ -267,7 +363,7 @@ locals {
       {
         type   = "metric"
         x      = 8
-        y      = 34
+        y      = 46
         width  = 8
         height = 6
         properties = {
@@ -288,7 +384,7 @@ locals {
       {
         type   = "metric"
         x      = 16
-        y      = 34
+        y      = 46
         width  = 8
         height = 6
         properties = {
@@ -309,7 +405,7 @@ locals {
       {
         type   = "metric"
         x      = 0
-        y      = 40
+        y      = 52
         width  = 24
         height = 6
         properties = {
@@ -328,6 +424,32 @@ locals {
         }
       },
     ],
+    [
+      for index, function in local.dashboard_phase_functions : {
+        type   = "metric"
+        x      = 8 * index
+        y      = 58
+        width  = 8
+        height = 6
+        properties = {
+          title  = "${function} p95 phase duration"
+          view   = "timeSeries"
+          region = local.dashboard_region
+          period = 60
+          metrics = [
+            [
+              {
+                expression = "SEARCH('{GitHubRunners,asg_name,function,phase} MetricName=\"PhaseDuration\" asg_name=\"${local.asg_name}\" function=\"${function}\"', 'p95', 60)"
+                id         = "phases"
+              }
+            ],
+          ]
+          yAxis = {
+            left = { min = 0, label = "ms" }
+          }
+        }
+      }
+    ],
   )
 }
 
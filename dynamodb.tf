@@ -0,0 +1,25 @@
+# Small, pay-per-request table for state the Lambdas share: webhook job
+# states and counters. Items that are only useful for a while carry an
+# expires_at timestamp and are removed by the DynamoDB TTL.
+resource "aws_dynamodb_table" "state" {
+  #checkov:skip=CKV_AWS_119:Holds claims, job states, counters and runner snapshots, no secrets; the registration token is kept in Secrets Manager
+  name         = "${local.asg_name}-state"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  point_in_time_recovery {
+    enabled = true
+  }
+
+  tags = local.default_module_tags
+}
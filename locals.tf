@@ -36,6 +36,28 @@ locals {
   deregistration_hookname          = "deregistration"
   bootstrap_hookname               = "bootstrap"
 
+  runner_labels = concat(
+    [
+      "aws_region:${data.aws_region.current.name}",
+      "aws_account:${data.aws_caller_identity.current.account_id}",
+      "installation_id:${random_uuid.installation-id.result}",
+    ],
+    var.extra_labels
+  )
+  # Labels GitHub assigns to every self-hosted runner on top of the custom ones.
+  runner_default_labels = [
+    "self-hosted",
+    "linux",
+    contains(data.aws_ec2_instance_type.this.supported_architectures, "arm64") ? "arm64" : "x64",
+  ]
+
+  webhook_enabled     = var.webhook_secret_arn != null
+  queued_jobs_enabled = local.webhook_enabled || length(var.queued_jobs_repositories) > 0
+
+  # In the controller mode the record_metric Lambda owns the desired capacity,
+  # so the alarm-driven scaling policies would only fight it.
+  alarm_scaling_enabled = var.autoscaling_mode == "alarms"
+
   all_alarm_topic_arns = concat(
     [aws_sns_topic.alarms.arn],
     var.alarm_topic_arns,
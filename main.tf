@@ -49,14 +49,7 @@ module "userdata" {
   extra_files = var.extra_files
   extra_repos = var.extra_repos
   custom_facts = {
-    labels : concat(
-      [
-        "aws_region:${data.aws_region.current.name}",
-        "aws_account:${data.aws_caller_identity.current.account_id}",
-        "installation_id:${random_uuid.installation-id.result}",
-      ],
-      var.extra_labels
-    )
+    labels : local.runner_labels
     registration_token_secret_prefix : local.registration_token_secret_prefix
     bootstrap_hookname : local.bootstrap_hookname
     deregistration_hookname : local.deregistration_hookname
@@ -214,8 +207,8 @@ resource "aws_autoscaling_group" "actions-runner" {
     for_each = var.on_demand_base_capacity == null ? [1] : []
     content {
       pool_state                  = "Hibernated"
-      min_size                    = local.warm_pool_min
-      max_group_prepared_capacity = local.warm_pool_max
+      min_size                    = local.warm_pool_tuner_enabled ? local.warm_pool_tuned_size : local.warm_pool_min
+      max_group_prepared_capacity = local.warm_pool_tuner_enabled ? local.warm_pool_tuned_size : local.warm_pool_max
       instance_reuse_policy {
         reuse_on_scale_in = false
       }
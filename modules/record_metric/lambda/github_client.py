@@ -0,0 +1,214 @@
+"""
+GitHub API client that reuses its connections across Lambda invocations.
+
+infrahouse_core's ``GitHubActions`` sends every request with ``requests.get()``
+and friends, so every request opens a new TCP connection and TLS session to
+api.github.com. ``GitHubClient`` sends the same requests through a module-scope
+``requests.Session`` instead. A warm Lambda keeps the pooled keep-alive
+connections, and only the first request after a cold start pays the handshakes.
+
+Importing ``infrahouse_core.github`` loads PyGithub, PyJWT, and cryptography,
+which takes longer than loading the rest of a Lambda. ``GitHubClient`` covers
+the part of ``GitHubActions`` the Lambdas use without them, and ``app_token()``
+imports them only when a GitHub App token is needed. A Lambda that
+authenticates with a personal access token never loads them.
+
+The session retries connection errors and 5xx responses with a backoff. Rate
+limiting (403, 429) is left to the callers, which know whether waiting is worth it.
+
+``GITHUB_API_URL`` in the environment points the client to another API
+endpoint, e.g. a fake GitHub server in tests.
+
+Every Lambda of the module is packaged from its own directory, so this file
+is copied verbatim into each Lambda that uses it. Edit all copies together;
+``tests/test_github_client.py`` fails if they differ.
+"""
+
+from datetime import datetime
+from os import environ
+from time import time
+from typing import Iterator, List, Optional, Tuple
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+GITHUB_API_URL = environ.get("GITHUB_API_URL", "https://api.github.com")
+
+# (connect, read) timeouts in seconds. A connection to GitHub is up in well
+# under a second; the read timeout covers a slow page of runners.
+TIMEOUT = (3.05, 10)
+# Up to 20 threads of the deregistration sweep share the pool.
+POOL_SIZE = 20
+# How long a registration token is valid if GitHub doesn't say.
+REGISTRATION_TOKEN_LIFETIME = 3600
+
+_session = None
+_client = None
+
+
+def session() -> Session:
+    """
+    The module-scope session, created on the first call.
+    """
+    global _session
+    if _session is None:
+        adapter = HTTPAdapter(
+            pool_maxsize=POOL_SIZE,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=("GET", "POST", "DELETE"),
+                # Let raise_for_status() raise the usual HTTPError.
+                raise_on_status=False,
+            ),
+        )
+        _session = Session()
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def github_actions(token, org) -> "GitHubClient":
+    """
+    A ``GitHubClient`` for ``org``, reused until the token changes.
+    """
+    global _client
+    if _client is None or (_client.token, _client.org) != (token, org):
+        _client = GitHubClient(token, org)
+    return _client
+
+
+def app_token(app_id, pem_key_secret, org) -> str:
+    """
+    A GitHub App installation token for ``org``.
+
+    :param app_id: GitHub App ID.
+    :param pem_key_secret: Secret with the app's private key.
+    """
+    # Signing the app's JWT is the only use of PyGithub and PyJWT.
+    from infrahouse_core.github import get_tmp_token
+
+    return get_tmp_token(int(app_id), pem_key_secret, org)
+
+
+def headers(token) -> dict:
+    """
+    Headers of a GitHub REST API request.
+    """
+    return {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+
+
+class GitHubRunner:
+    """
+    A self-hosted runner as listed by the GitHub API, with the attributes
+    of infrahouse_core's ``GitHubActionsRunner`` that the Lambdas use.
+    """
+
+    def __init__(self, runner_data: dict):
+        self._runner_data = runner_data
+
+    @property
+    def runner_id(self) -> int:
+        return self._runner_data["id"]
+
+    @property
+    def name(self) -> str:
+        return self._runner_data["name"]
+
+    @property
+    def status(self) -> str:
+        return self._runner_data["status"]
+
+    @property
+    def busy(self) -> bool:
+        return self._runner_data["busy"]
+
+    @property
+    def labels(self) -> List[str]:
+        return [label["name"] for label in self._runner_data["labels"]]
+
+    @property
+    def instance_id(self) -> Optional[str]:
+        return next(
+            (
+                label.split(":", 1)[1]
+                for label in self.labels
+                if label.startswith("instance_id:")
+            ),
+            None,
+        )
+
+
+class GitHubClient:
+    """
+    The runner calls of infrahouse_core's ``GitHubActions``,
+    sent through the pooled session.
+    """
+
+    def __init__(self, token, org):
+        self.token = token
+        self.org = org
+
+    @property
+    def runners(self) -> Iterator[GitHubRunner]:
+        """
+        Iterate over all self-hosted runners of the organization,
+        one page of the listing at a time.
+        """
+        return (GitHubRunner(data) for data in self._get_github_runners())
+
+    def find_runner_by_label(self, label) -> Optional[GitHubRunner]:
+        return next(self.find_runners_by_label(label), None)
+
+    def find_runners_by_label(self, label) -> Iterator[GitHubRunner]:
+        return (runner for runner in self.runners if label in runner.labels)
+
+    def create_registration_token(self) -> Tuple[str, float]:
+        """
+        Create a registration token.
+
+        :return: The token and when it expires, in Unix time.
+        """
+        response = session().post(
+            f"{GITHUB_API_URL}/orgs/{self.org}/actions/runners/registration-token",
+            headers=headers(self.token),
+            timeout=TIMEOUT,
+        )
+        response.raise_for_status()
+        data = response.json()
+        expires_at = (
+            datetime.fromisoformat(
+                data["expires_at"].replace("Z", "+00:00")
+            ).timestamp()
+            if data.get("expires_at")
+            else time() + REGISTRATION_TOKEN_LIFETIME
+        )
+        return data["token"], expires_at
+
+    def deregister_runner(self, runner):
+        response = session().delete(
+            f"{GITHUB_API_URL}/orgs/{self.org}/actions/runners/{runner.runner_id}",
+            headers=headers(self.token),
+            timeout=TIMEOUT,
+        )
+        response.raise_for_status()
+
+    def _get_github_runners(self) -> Iterator[dict]:
+        url = f"{GITHUB_API_URL}/orgs/{self.org}/actions/runners"
+        # GitHub returns 30 runners per page by default.
+        params = {"per_page": 100}
+        while url:
+            response = session().get(
+                url, headers=headers(self.token), params=params, timeout=TIMEOUT
+            )
+            response.raise_for_status()
+            yield from response.json()["runners"]
+            url = response.links.get("next", {}).get("url")
+            # The next page link already carries the query string.
+            params = None
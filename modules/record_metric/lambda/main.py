@@ -1,14 +1,30 @@
+from time import monotonic
+
+# When the cold start began loading the module, see emf.record_init().
+_INIT_STARTED_AT = monotonic()
+
+import json
 import logging
 from collections import Counter
+from math import ceil
+from datetime import datetime, timezone
 from os import environ
+from time import sleep, time
+from typing import Iterator, Tuple
 
 from infrahouse_core.timeout import timeout
 
-from infrahouse_core.github import get_tmp_token, GitHubAuth, GitHubActions
-
 from infrahouse_core.aws import get_secret
 
 import boto3
+from botocore.exceptions import ClientError
+from requests import HTTPError
+
+import emf
+import github_client
+import launch_timing
+import runner_snapshot
+import state_store
 
 LOG = logging.getLogger()
 LOG.setLevel(level=logging.INFO)
@@ -18,6 +34,32 @@ LOG.setLevel(level=logging.INFO)
 # inside the handler's SIGALRM-bounded timeout window.
 _secretsmanager = boto3.client("secretsmanager")
 _cloudwatch = boto3.client("cloudwatch")
+_autoscaling = boto3.client("autoscaling")
+emf.record_init(_INIT_STARTED_AT)
+
+# GitHub App installation tokens expire one hour after they are minted.
+# github_client.app_token() doesn't return the expiry, so count the hour from the moment
+# we asked for the token. PATs don't expire on their own; re-read them every
+# GITHUB_PAT_TTL seconds anyway so a rotated secret is picked up without
+# waiting for a cold start.
+GITHUB_APP_TOKEN_TTL = 3600
+GITHUB_PAT_TTL = 900
+# Refresh a cached token this many seconds before it expires, so it never
+# goes stale in the middle of an invocation.
+GITHUB_TOKEN_REFRESH_MARGIN = 300
+
+# SetInstanceProtection accepts up to 50 instance IDs per call.
+INSTANCE_PROTECTION_BATCH_SIZE = 50
+
+# Seconds to reserve for taking and publishing one sample. The sampling loop
+# stops early rather than start a sample the Lambda timeout would cut short.
+SAMPLE_TIME_BUDGET = 10
+
+# Module-scope credential cache: survives across warm invocations, so most
+# runs skip the Secrets Manager round trip (and, for a GitHub App, the JWT
+# signature and the installation token exchange).
+_github_token = None
+_github_token_expires_at = 0.0
 
 
 def lambda_handler(event, context):
@@ -27,6 +69,33 @@ def lambda_handler(event, context):
     This function retrieves the status of GitHub runners associated with the instances in the ASG,
     counts the number of idle and busy runners, and sends these metrics to AWS CloudWatch.
 
+    Queued jobs are counted by listing workflow runs of ``QUEUED_JOBS_REPOSITORIES``
+    or, when ``QUEUED_JOBS_SOURCE`` is ``webhook``, read from the counters
+    the ``webhook_receiver`` Lambda keeps in the state table.
+
+    In the ``controller`` ``AUTOSCALING_MODE``, every sample also sets the ASG desired
+    capacity, see ``_adjust_capacity()``.
+
+    With ``PROTECT_BUSY_RUNNERS`` set to ``true``, every sample also protects
+    the instances of busy runners from scale-in and unprotects the rest,
+    see ``_protect_busy_runners()``.
+
+    Every sample also saves the listed runners to the state table for the
+    lifecycle Lambdas, see ``runner_snapshot``.
+
+    Every sample also publishes how long ago the instances of runners
+    that came online since the previous sample were launched,
+    see ``launch_timing``.
+
+    By default, it takes one sample and publishes standard-resolution metrics.
+    When ``METRIC_SAMPLE_COUNT`` is greater than one, the invocation takes that many
+    samples ``METRIC_SAMPLE_INTERVAL`` seconds apart and publishes each of them as
+    a high-resolution (1-second storage resolution) datapoint, so alarms can evaluate
+    10- or 30-second periods.
+
+    How long the GitHub and AWS API calls took is published at the end
+    of the invocation as the ``PhaseDuration`` EMF metric.
+
     :param event: The event data passed to the Lambda function.
     :type event: dict
     :param context: The context object providing runtime information about the Lambda function.
@@ -35,47 +104,445 @@ def lambda_handler(event, context):
     """
     LOG.info(f"{event = }")
     asg_name = environ["ASG_NAME"]
-    github = GitHubAuth(
-        _get_github_token(environ["GITHUB_ORG_NAME"]), environ["GITHUB_ORG_NAME"]
-    )
-    gha = GitHubActions(github)
+    sample_count = int(environ.get("METRIC_SAMPLE_COUNT", "1"))
+    # The alarms read the runner metrics at the configured resolution,
+    # whichever run published them.
+    storage_resolution = 1 if sample_count > 1 else 60
+    if event.get("source") == "webhook_receiver":
+        # An extra run on top of the schedule: one fresh sample is enough.
+        sample_count = 1
+    sample_interval = int(environ.get("METRIC_SAMPLE_INTERVAL", "60"))
 
-    status_counts = Counter()
-    for runner in gha.find_runners_by_label(
-        f"installation_id:{environ['INSTALLATION_ID']}"
-    ):
-        if runner and runner.status == "online":
-            status_counts["busy" if runner.busy else "idle"] += 1
+    try:
+        started_at = monotonic()
+        # Queued jobs are counted on the first sample only; the controller
+        # keeps using that count on the later samples.
+        last_queued = 0
+        for sample in range(sample_count):
+            if sample:
+                next_sample_at = started_at + sample * sample_interval
+                if (
+                    context is not None
+                    and context.get_remaining_time_in_millis()
+                    < (next_sample_at - monotonic() + SAMPLE_TIME_BUDGET) * 1000
+                ):
+                    LOG.warning(
+                        "Not enough time left for sample %d of %d; stopping early.",
+                        sample + 1,
+                        sample_count,
+                    )
+                    break
+                sleep(max(0.0, next_sample_at - monotonic()))
 
-    LOG.info(f"{status_counts['idle'] = }, {status_counts['busy'] = }")
+            org = environ["GITHUB_ORG_NAME"]
+            installation_id = environ["INSTALLATION_ID"]
+            runners = _call_github(_list_runners, org, installation_id)
+            if environ.get("STATE_TABLE"):
+                with emf.phase("state_table_put_item"):
+                    runner_snapshot.save(runners, installation_id)
+            runners = [runner for runner in runners if runner.status == "online"]
+            if environ.get("STATE_TABLE"):
+                launch_timing.record_online(asg_name, runners)
+            status_counts = _count_runners(runners)
+            LOG.info(f"{status_counts['idle'] = }, {status_counts['busy'] = }")
 
-    _cloudwatch.put_metric_data(
-        Namespace="GitHubRunners",
-        MetricData=[
-            {
-                "MetricName": "BusyRunners",
-                "Dimensions": [
-                    {"Name": "asg_name", "Value": asg_name},
-                ],
-                "Value": status_counts["busy"],
-                "Unit": "Count",
-            },
+            queued_jobs = None
+            repositories = json.loads(environ.get("QUEUED_JOBS_REPOSITORIES", "[]"))
+            if environ.get("QUEUED_JOBS_SOURCE", "github") == "webhook":
+                queued_jobs = (_read_webhook_queued_jobs(), None)
+            # Listing workflow runs costs several GitHub API calls per repository,
+            # so queued jobs are counted once per invocation, not on every sample.
+            elif sample == 0 and repositories:
+                queued_jobs = _call_github(
+                    _count_queued_jobs,
+                    org,
+                    repositories,
+                    json.loads(environ["RUNNER_LABELS"]),
+                )
+                LOG.info("Queued jobs: %d, oldest is %.0f seconds old.", *queued_jobs)
+
+            if queued_jobs:
+                last_queued = queued_jobs[0]
+            _put_runner_metrics(
+                asg_name, status_counts, storage_resolution, queued_jobs
+            )
+
+            if environ.get("PROTECT_BUSY_RUNNERS", "false") == "true":
+                _protect_busy_runners(asg_name, runners)
+
+            if environ.get("AUTOSCALING_MODE", "alarms") == "controller":
+                _adjust_capacity(asg_name, status_counts, last_queued)
+    finally:
+        emf.emit_phases(asg_name, "record_metric")
+
+
+def _call_github(func, *args):
+    """
+    Call ``func(*args)``, retrying once with a new token if GitHub rejects the cached one.
+    """
+    try:
+        return func(*args)
+    except HTTPError as err:
+        if err.response is None or err.response.status_code != 401:
+            raise
+        # The cached token was revoked or expired earlier than we assumed.
+        LOG.warning("GitHub rejected the cached token: %s. Fetching a new one.", err)
+        _invalidate_github_token()
+        return func(*args)
+
+
+def _put_runner_metrics(
+    asg_name, status_counts, storage_resolution=60, queued_jobs=None
+):
+    """
+    Publish BusyRunners and IdleRunners and, if given, QueuedJobs and OldestQueuedJobAge.
+
+    With ``METRICS_EMITTER=emf`` the metrics are written as Embedded Metric Format
+    log lines instead of a ``PutMetricData`` call.
+
+    :param asg_name: Value of the ``asg_name`` dimension.
+    :param status_counts: Counter with ``busy`` and ``idle`` keys.
+    :param storage_resolution: 60 for standard-resolution metrics,
+        1 for high-resolution ones.
+    :param queued_jobs: A tuple of the queued jobs count and the age of the oldest
+        queued job in seconds, as returned by ``_count_queued_jobs()``.
+        The age may be None if unknown. Polled counts are published with
+        standard resolution, webhook counts with ``storage_resolution``.
+    """
+    timestamp = datetime.now(tz=timezone.utc)
+    metric_data = [
+        _metric_datum(
+            "BusyRunners",
+            status_counts["busy"],
+            "Count",
+            asg_name,
+            timestamp,
+            storage_resolution,
+        ),
+        _metric_datum(
+            "IdleRunners",
+            status_counts["idle"],
+            "Count",
+            asg_name,
+            timestamp,
+            storage_resolution,
+        ),
+    ]
+    if queued_jobs is not None:
+        queued, oldest_age = queued_jobs
+        if oldest_age is None:
+            metric_data.append(
+                _metric_datum(
+                    "QueuedJobs",
+                    queued,
+                    "Count",
+                    asg_name,
+                    timestamp,
+                    storage_resolution,
+                )
+            )
+        else:
+            metric_data += [
+                _metric_datum("QueuedJobs", queued, "Count", asg_name, timestamp),
+                _metric_datum(
+                    "OldestQueuedJobAge", oldest_age, "Seconds", asg_name, timestamp
+                ),
+            ]
+    with emf.phase("put_metric_data"):
+        if environ.get("METRICS_EMITTER", "api") == "emf":
+            _emit_metric_data(asg_name, timestamp, metric_data)
+        else:
+            _cloudwatch.put_metric_data(
+                Namespace="GitHubRunners", MetricData=metric_data
+            )
+
+
+def _emit_metric_data(asg_name, timestamp, metric_data):
+    """
+    Write ``PutMetricData`` datums as EMF log lines, one per storage resolution.
+    """
+    for resolution in sorted({datum["StorageResolution"] for datum in metric_data}):
+        emf.emit(
             {
-                "MetricName": "IdleRunners",
-                "Dimensions": [
-                    {"Name": "asg_name", "Value": asg_name},
-                ],
-                "Value": status_counts["idle"],
-                "Unit": "Count",
+                datum["MetricName"]: (datum["Value"], datum["Unit"])
+                for datum in metric_data
+                if datum["StorageResolution"] == resolution
             },
+            {"asg_name": asg_name},
+            timestamp=timestamp,
+            storage_resolution=resolution,
+        )
+
+
+def _metric_datum(name, value, unit, asg_name, timestamp, storage_resolution=60):
+    return {
+        "MetricName": name,
+        "Dimensions": [
+            {"Name": "asg_name", "Value": asg_name},
         ],
+        "Timestamp": timestamp,
+        "Value": value,
+        "Unit": unit,
+        "StorageResolution": storage_resolution,
+    }
+
+
+def _adjust_capacity(asg_name, status_counts, queued):
+    """
+    Set the ASG desired capacity to what the counted runners and jobs call for.
+
+    :param asg_name: Autoscaling group to adjust.
+    :param status_counts: Counter with ``busy`` and ``idle`` keys.
+    :param queued: Number of queued jobs, zero if unknown.
+    """
+    with emf.phase("describe_auto_scaling_groups"):
+        asg = _autoscaling.describe_auto_scaling_groups(
+            AutoScalingGroupNames=[asg_name]
+        )["AutoScalingGroups"][0]
+    current = asg["DesiredCapacity"]
+    desired = _desired_capacity(
+        current,
+        asg["MinSize"],
+        asg["MaxSize"],
+        status_counts["busy"],
+        status_counts["idle"],
+        queued,
+        int(environ["IDLE_RUNNERS_TARGET_COUNT"]),
+        float(environ.get("SCALE_IN_DAMPING", "0.5")),
     )
+    if desired == current:
+        return
 
+    LOG.info(
+        "Changing desired capacity of %s from %d to %d.", asg_name, current, desired
+    )
+    # The controller is the only thing that scales the group, so it doesn't
+    # need cooldowns to keep out of its own way. Damping slows down scale-in.
+    with emf.phase("set_desired_capacity"):
+        _autoscaling.set_desired_capacity(
+            AutoScalingGroupName=asg_name, DesiredCapacity=desired, HonorCooldown=False
+        )
 
-def _get_github_token(org):
-    with timeout(5):
-        return (
-            get_secret(_secretsmanager, environ["GITHUB_SECRET"])
-            if environ["GITHUB_SECRET_TYPE"] == "token"
-            else get_tmp_token(int(environ["GH_APP_ID"]), environ["GITHUB_SECRET"], org)
+
+def _desired_capacity(
+    current, min_size, max_size, busy, idle, queued, idle_target, damping
+) -> int:
+    """
+    Compute the ASG desired capacity.
+
+    The group needs a runner for every busy runner and queued job plus
+    ``idle_target`` spare ones. Scale-out goes to that number in one step.
+    Scale-in only removes runners that are actually idle beyond the target,
+    and only the ``damping`` fraction of them at a time, so the capacity
+    converges without oscillating. Instances that are still booting aren't
+    idle runners yet, so they are never scaled in before they register.
+
+    :return: The new desired capacity, clamped to ``[min_size, max_size]``.
+    """
+    target = busy + queued + idle_target
+    if target > current:
+        desired = target
+    else:
+        surplus = min(current - target, idle - idle_target)
+        desired = current - ceil(surplus * damping) if surplus > 0 else current
+    return max(min_size, min(max_size, desired))
+
+
+def _list_runners(org, installation_id) -> list:
+    """
+    List runners labeled ``installation_id:<installation_id>``, online or not.
+
+    :raise HTTPError: If GitHub rejects the request, e.g. with a 401
+        when the cached token is no longer valid.
+    """
+    gha = github_client.github_actions(_get_github_token(org), org)
+    with emf.phase("github_list_runners"):
+        return list(gha.find_runners_by_label(f"installation_id:{installation_id}"))
+
+
+def _count_runners(runners) -> Counter:
+    """
+    Count busy and idle runners.
+
+    :return: Counter with ``busy`` and ``idle`` keys.
+    """
+    status_counts = Counter()
+    for runner in runners:
+        status_counts["busy" if runner.busy else "idle"] += 1
+    return status_counts
+
+
+def _protect_busy_runners(asg_name, runners):
+    """
+    Protect in-service instances of busy runners from scale-in and remove
+    the protection from the other in-service instances.
+
+    The ASG then only picks idle runners when it scales in, and a busy runner
+    doesn't sit in ``Terminating:Wait`` until its job finishes.
+    A job that starts between the runner listing and this call is unprotected
+    until the next sample; the graceful drain on scale-in still covers it.
+
+    :param asg_name: Autoscaling group of the runners.
+    :param runners: Online runners.
+    """
+    busy = {runner.instance_id for runner in runners if runner.busy}
+    with emf.phase("describe_auto_scaling_groups"):
+        instances = _autoscaling.describe_auto_scaling_groups(
+            AutoScalingGroupNames=[asg_name]
+        )["AutoScalingGroups"][0]["Instances"]
+    changes = {True: [], False: []}
+    for instance in instances:
+        if instance["LifecycleState"] != "InService":
+            continue
+        protect = instance["InstanceId"] in busy
+        if instance["ProtectedFromScaleIn"] != protect:
+            changes[protect].append(instance["InstanceId"])
+
+    for protect, instance_ids in changes.items():
+        for start in range(0, len(instance_ids), INSTANCE_PROTECTION_BATCH_SIZE):
+            batch = instance_ids[start : start + INSTANCE_PROTECTION_BATCH_SIZE]
+            LOG.info(
+                "%s scale-in protection of %s.",
+                "Enabling" if protect else "Disabling",
+                ", ".join(batch),
+            )
+            try:
+                with emf.phase("set_instance_protection"):
+                    _autoscaling.set_instance_protection(
+                        AutoScalingGroupName=asg_name,
+                        InstanceIds=batch,
+                        ProtectedFromScaleIn=protect,
+                    )
+            except ClientError as err:
+                if err.response["Error"]["Code"] != "ValidationError":
+                    raise
+                # An instance of the batch left InService after we looked.
+                # The next sample retries the others.
+                LOG.warning("Couldn't change scale-in protection: %s", err)
+
+
+def _count_queued_jobs(org, repositories, runner_labels) -> Tuple[int, float]:
+    """
+    Count workflow jobs waiting for a runner from this installation.
+
+    GitHub has no organization-wide list of queued jobs, so this walks the
+    queued and in-progress workflow runs of each repository (an in-progress
+    run may still have queued jobs) and picks jobs whose requested labels
+    all belong to this installation's runners.
+
+    :param org: GitHub organization name.
+    :param repositories: Repository names in the organization to inspect.
+    :param runner_labels: Labels of the runners in this installation.
+    :return: Number of queued jobs and the age of the oldest one, in seconds.
+    :raise HTTPError: If GitHub rejects a request.
+    """
+    token = _get_github_token(org)
+    pool_labels = {label.lower() for label in runner_labels}
+    now = datetime.now(tz=timezone.utc)
+    queued = 0
+    oldest_age = 0.0
+    with emf.phase("github_queued_jobs"):
+        for repository in repositories:
+            for status in ("queued", "in_progress"):
+                for run in _github_paginate(
+                    f"{github_client.GITHUB_API_URL}/repos/{org}/{repository}/actions/runs",
+                    "workflow_runs",
+                    token,
+                    params={"status": status, "per_page": 100},
+                ):
+                    for job in _github_paginate(
+                        run["jobs_url"],
+                        "jobs",
+                        token,
+                        params={"filter": "latest", "per_page": 100},
+                    ):
+                        if job["status"] == "queued" and _job_targets_pool(
+                            job, pool_labels
+                        ):
+                            queued += 1
+                            age = (
+                                now - _parse_github_time(job["created_at"])
+                            ).total_seconds()
+                            oldest_age = max(oldest_age, age)
+    return queued, oldest_age
+
+
+def _read_webhook_queued_jobs() -> int:
+    """
+    Read the number of queued jobs from the counters the ``webhook_receiver``
+    Lambda keeps in the state table.
+    """
+    with emf.phase("state_table_get_item"):
+        counters = state_store.get_counters("webhook#counters")
+    # A lost webhook delivery can leave the counter off by one; never report
+    # a negative backlog.
+    return max(0, counters.get("queued", 0))
+
+
+def _job_targets_pool(job, pool_labels) -> bool:
+    """
+    A job can run on this installation's runners if every label
+    in its ``runs-on`` is one of the runner labels. GitHub matches
+    labels case-insensitively; ``pool_labels`` must be lowercase.
+    """
+    job_labels = {label.lower() for label in job["labels"]}
+    return bool(job_labels) and job_labels <= pool_labels
+
+
+def _parse_github_time(value) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _github_paginate(url, key, token, params=None) -> Iterator[dict]:
+    """
+    Yield items under ``key`` from a paginated GitHub API list endpoint.
+    """
+    headers = github_client.headers(token)
+    while url:
+        response = github_client.session().get(
+            url, headers=headers, params=params, timeout=github_client.TIMEOUT
         )
+        response.raise_for_status()
+        yield from response.json()[key]
+        url = response.links.get("next", {}).get("url")
+        # The next page link already carries the query string.
+        params = None
+
+
+def _get_github_token(org):
+    """
+    Return a GitHub token, reusing the cached one while it's fresh.
+
+    A new token is fetched when there is none cached or the cached one is
+    within GITHUB_TOKEN_REFRESH_MARGIN seconds of its expiry.
+    """
+    global _github_token, _github_token_expires_at
+
+    now = time()
+    if (
+        _github_token is not None
+        and now < _github_token_expires_at - GITHUB_TOKEN_REFRESH_MARGIN
+    ):
+        return _github_token
+
+    with emf.phase("github_token"), timeout(5):
+        if environ["GITHUB_SECRET_TYPE"] == "token":
+            token = get_secret(_secretsmanager, environ["GITHUB_SECRET"])
+            ttl = GITHUB_PAT_TTL
+        else:
+            token = github_client.app_token(
+                environ["GH_APP_ID"], environ["GITHUB_SECRET"], org
+            )
+            ttl = GITHUB_APP_TOKEN_TTL
+
+    _github_token = token
+    _github_token_expires_at = now + ttl
+    return _github_token
+
+
+def _invalidate_github_token():
+    """Drop the cached GitHub token so the next call fetches a new one."""
+    global _github_token, _github_token_expires_at
+
+    _github_token = None
+    _github_token_expires_at = 0.0
@@ -0,0 +1,101 @@
+"""
+Snapshot of the installation's runners in the module's DynamoDB state table.
+
+``record_metric`` lists the installation's runners every minute anyway. It
+saves their IDs, names, instances, statuses, and busy flags, so the lifecycle
+Lambdas can look a runner up with one DynamoDB read instead of paging through
+all runners of the organization in GitHub.
+
+Without ``STATE_TABLE`` in the environment nothing is saved and
+there is never a snapshot to load.
+
+Every Lambda of the module is packaged from its own directory, so this file
+is copied verbatim into each Lambda that uses it. Edit all copies together;
+``tests/test_runner_snapshot.py`` fails if they differ.
+"""
+
+import json
+from time import time
+from typing import List, NamedTuple, Optional, Tuple
+
+import state_store
+
+SNAPSHOT_KEY = "runners#snapshot"
+# Readers want a snapshot a minute or two old at most.
+SNAPSHOT_TTL = 600
+
+
+class SnapshotRunner(NamedTuple):
+    """
+    A runner as saved in the snapshot, with the attributes of
+    ``github_client.GitHubRunner`` that the Lambdas use.
+    """
+
+    runner_id: int
+    name: str
+    instance_id: Optional[str]
+    status: str
+    busy: bool
+    labels: Tuple[str, ...]
+
+
+def save(runners, installation_id):
+    """
+    Save the runners labeled ``installation_id:<installation_id>``.
+
+    :param runners: All runners of the installation, online or not.
+    """
+    state_store.put(
+        SNAPSHOT_KEY,
+        {
+            "installation_id": installation_id,
+            "runners": json.dumps(
+                [
+                    [
+                        runner.runner_id,
+                        runner.name,
+                        runner.instance_id,
+                        runner.status,
+                        runner.busy,
+                    ]
+                    for runner in runners
+                ]
+            ),
+            "taken_at": str(time()),
+        },
+        SNAPSHOT_TTL,
+    )
+
+
+def load(max_age) -> Optional[Tuple[List[SnapshotRunner], float]]:
+    """
+    Load the snapshot if it's at most ``max_age`` seconds old.
+
+    The runners only have the ``instance_id`` and ``installation_id`` labels.
+
+    :return: The runners and the snapshot's age in seconds,
+        or None if there is no fresh enough snapshot.
+    """
+    item = state_store.get(SNAPSHOT_KEY)
+    if item is None:
+        return None
+    age = time() - float(item["taken_at"])
+    if age > max_age:
+        return None
+
+    installation_label = f"installation_id:{item['installation_id']}"
+    return [
+        SnapshotRunner(
+            runner_id,
+            name,
+            instance_id,
+            status,
+            busy,
+            (
+                (installation_label, f"instance_id:{instance_id}")
+                if instance_id
+                else (installation_label,)
+            ),
+        )
+        for runner_id, name, instance_id, status, busy in json.loads(item["runners"])
+    ], age
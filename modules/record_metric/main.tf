@@ -16,6 +16,40 @@ data "aws_iam_policy_document" "record_metric_permissions" {
       "*"
     ]
   }
+  dynamic "statement" {
+    for_each = var.autoscaling_mode == "controller" ? [1] : []
+    content {
+      actions = [
+        "autoscaling:SetDesiredCapacity",
+      ]
+      resources = [
+        "arn:aws:autoscaling:*:*:autoScalingGroup:*:autoScalingGroupName/${var.asg_name}"
+      ]
+    }
+  }
+  dynamic "statement" {
+    for_each = var.protect_busy_runners ? [1] : []
+    content {
+      actions = [
+        "autoscaling:SetInstanceProtection",
+      ]
+      resources = [
+        "arn:aws:autoscaling:*:*:autoScalingGroup:*:autoScalingGroupName/${var.asg_name}"
+      ]
+    }
+  }
+  dynamic "statement" {
+    for_each = var.state_table_arn != null ? [1] : []
+    content {
+      actions = [
+        "dynamodb:BatchGetItem",
+        "dynamodb:DeleteItem",
+        "dynamodb:GetItem",
+        "dynamodb:PutItem",
+      ]
+      resources = [var.state_table_arn]
+    }
+  }
   statement {
     actions = [
       "cloudwatch:PutMetricData"
@@ -51,6 +85,11 @@ resource "aws_iam_policy" "record_metric_permissions" {
   )
 }
 
+locals {
+  # In sampling mode one invocation stays alive for most of the minute.
+  lambda_timeout = var.lambda_timeout + (var.metric_sample_count - 1) * var.metric_sample_interval
+}
+
 # Lambda function with monitoring using terraform-aws-lambda-monitored module
 module "lambda_monitored" {
   source  = "registry.infrahouse.com/infrahouse/lambda-monitored/aws"
@@ -60,7 +99,7 @@ module "lambda_monitored" {
   lambda_source_dir                    = "${path.module}/lambda"
   architecture                         = var.architecture
   python_version                       = var.python_version
-  timeout                              = var.lambda_timeout
+  timeout                              = local.lambda_timeout
   memory_size                          = 512
   memory_utilization_threshold_percent = 80
   cloudwatch_log_retention_days        = var.cloudwatch_log_group_retention
@@ -70,12 +109,23 @@ module "lambda_monitored" {
   additional_iam_policy_arns           = [aws_iam_policy.record_metric_permissions.arn]
 
   environment_variables = {
-    ASG_NAME           = var.asg_name
-    GITHUB_ORG_NAME    = var.github_org_name
-    GITHUB_SECRET      = var.github_credentials.secret
-    GITHUB_SECRET_TYPE = var.github_credentials.type
-    GH_APP_ID          = var.github_app_id
-    INSTALLATION_ID    = var.installation_id
+    ASG_NAME                  = var.asg_name
+    AUTOSCALING_MODE          = var.autoscaling_mode
+    GITHUB_ORG_NAME           = var.github_org_name
+    GITHUB_SECRET             = var.github_credentials.secret
+    GITHUB_SECRET_TYPE        = var.github_credentials.type
+    GH_APP_ID                 = var.github_app_id
+    IDLE_RUNNERS_TARGET_COUNT = var.idle_runners_target_count
+    INSTALLATION_ID           = var.installation_id
+    METRIC_SAMPLE_COUNT       = var.metric_sample_count
+    METRIC_SAMPLE_INTERVAL    = var.metric_sample_interval
+    METRICS_EMITTER           = var.metrics_emitter
+    PROTECT_BUSY_RUNNERS      = tostring(var.protect_busy_runners)
+    QUEUED_JOBS_REPOSITORIES  = jsonencode(var.queued_jobs_repositories)
+    QUEUED_JOBS_SOURCE        = var.queued_jobs_source
+    RUNNER_LABELS             = jsonencode(var.runner_labels)
+    SCALE_IN_DAMPING          = var.scale_in_damping
+    STATE_TABLE               = var.state_table_name != null ? var.state_table_name : ""
   }
 
   tags = merge(
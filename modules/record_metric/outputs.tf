@@ -1,3 +1,7 @@
 output "lambda_name" {
   value = module.lambda_monitored.lambda_function_name
 }
+
+output "lambda_arn" {
+  value = module.lambda_monitored.lambda_function_arn
+}
@@ -9,6 +9,16 @@ variable "asg_name" {
   type        = string
 }
 
+variable "autoscaling_mode" {
+  description = "How the ASG scales: `alarms` only publishes metrics for CloudWatch alarms; `controller` also sets the desired capacity."
+  type        = string
+  default     = "alarms"
+  validation {
+    condition     = contains(["alarms", "controller"], var.autoscaling_mode)
+    error_message = "autoscaling_mode must be either 'alarms' or 'controller'"
+  }
+}
+
 variable "cloudwatch_log_group_retention" {
   description = "Number of days you want to retain log events in the log group."
   default     = 365
@@ -35,6 +45,12 @@ variable "github_app_id" {
   type        = string
 }
 
+variable "idle_runners_target_count" {
+  description = "In the controller mode, how many idle runners to keep on top of busy runners and queued jobs."
+  type        = number
+  default     = 1
+}
+
 variable "installation_id" {
   description = "Unique identifier of runners created by the action-runner module. Each runner has a label 'installation_id:<installation_id>'."
   type        = string
@@ -46,12 +62,92 @@ variable "lambda_timeout" {
   default     = 30
 }
 
+variable "metrics_emitter" {
+  description = "How to publish metrics: `api` calls PutMetricData; `emf` writes CloudWatch Embedded Metric Format log lines."
+  type        = string
+  default     = "api"
+  validation {
+    condition     = contains(["api", "emf"], var.metrics_emitter)
+    error_message = "metrics_emitter must be either 'api' or 'emf'"
+  }
+}
+
+variable "metric_sample_count" {
+  description = "How many samples of BusyRunners/IdleRunners to take per invocation. More than one publishes high-resolution metrics."
+  type        = number
+  default     = 1
+  validation {
+    condition     = var.metric_sample_count >= 1
+    error_message = "metric_sample_count must be at least 1"
+  }
+}
+
+variable "metric_sample_interval" {
+  description = "Seconds between two samples taken by one invocation. metric_sample_count * metric_sample_interval must not exceed the 60 second schedule."
+  type        = number
+  default     = 60
+  validation {
+    condition     = var.metric_sample_interval >= 1 && var.metric_sample_interval <= 60
+    error_message = "metric_sample_interval must be between 1 and 60 seconds"
+  }
+}
+
+variable "queued_jobs_repositories" {
+  description = "Repositories in the GitHub organization whose queued jobs to count. Empty list disables the QueuedJobs and OldestQueuedJobAge metrics."
+  type        = list(string)
+  default     = []
+}
+
+variable "queued_jobs_source" {
+  description = "Where queued jobs come from: `github` lists workflow runs of queued_jobs_repositories; `webhook` reads the webhook_receiver counters from the state table."
+  type        = string
+  default     = "github"
+  validation {
+    condition     = contains(["github", "webhook"], var.queued_jobs_source)
+    error_message = "queued_jobs_source must be either 'github' or 'webhook'"
+  }
+}
+
+variable "runner_labels" {
+  description = "All labels of the runners in this installation. A queued job is counted if all its labels are in this list."
+  type        = list(string)
+  default     = []
+}
+
+variable "protect_busy_runners" {
+  description = "If true, protect instances of busy runners from scale-in and unprotect idle ones on every sample."
+  type        = bool
+  default     = false
+}
+
 variable "python_version" {
   description = "Python version to run lambda on. Must one of https://docs.aws.amazon.com/lambda/latest/dg/lambda-runtimes.html"
   type        = string
   default     = "python3.12"
 }
 
+variable "scale_in_damping" {
+  description = "In the controller mode, the fraction of surplus idle runners to remove in one step."
+  type        = number
+  default     = 0.5
+  validation {
+    condition     = var.scale_in_damping > 0 && var.scale_in_damping <= 1
+    error_message = "scale_in_damping must be greater than 0 and at most 1"
+  }
+}
+
+variable "state_table_arn" {
+  description = "ARN of the module's DynamoDB state table. The webhook job counters are read there, and a snapshot of the runners is saved there for the lifecycle Lambdas."
+  type        = string
+  default     = null
+}
+
+variable "state_table_name" {
+  description = "Name of the module's DynamoDB state table."
+  type        = string
+  default     = null
+}
+
 variable "tags" {
   description = "A map of tags to assign to resources."
   type        = map(string)
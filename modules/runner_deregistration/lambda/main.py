@@ -1,11 +1,25 @@
+from time import monotonic
+
+# When the cold start began loading the module, see emf.record_init().
+_INIT_STARTED_AT = monotonic()
+
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from os import environ
+from threading import Lock
+from time import sleep, time
 from botocore.exceptions import ClientError
 from infrahouse_core.aws.asg_instance import ASGInstance
-from infrahouse_core.github import GitHubActions, get_tmp_token, GitHubAuth
 from infrahouse_core.aws import get_secret
+from infrahouse_core.aws.secretsmanager import Secret
 
 import boto3
+from requests import HTTPError
+
+import emf
+import github_client
+import runner_index
+import state_store
 
 LOG = logging.getLogger()
 LOG.setLevel(level=logging.INFO)
@@ -18,46 +32,107 @@ _session = boto3.Session()
 _secretsmanager = _session.client("secretsmanager")
 _ssm = _session.client("ssm")
 _autoscaling = _session.client("autoscaling")
+_ec2 = _session.client("ec2")
+emf.record_init(_INIT_STARTED_AT)
 
 HOOK_DEREGISTRATION = "deregistration"
 
+# Maximum number of values in a DescribeInstances filter.
+DESCRIBE_INSTANCES_BATCH_SIZE = 200
+
+# How many times to try deregistering a runner that GitHub rate-limits,
+# and the longest pause between attempts. A runner the sweep gives up on
+# is picked up again by the next sweep.
+DEREGISTRATION_ATTEMPTS = 4
+DEREGISTRATION_MAX_BACKOFF = 30
+
+# Results of deregistering a runner, as reported by _deregister_runner().
+RESULT_DEREGISTERED = "deregistered"
+RESULT_NOT_FOUND = "not_found"
+RESULT_FAILED = "failed"
+
+# When GitHub rate-limits one deregistration thread, all of them pause until
+# _rate_limited_until (a time() value), so they don't keep hammering the API.
+_rate_limit_lock = Lock()
+_rate_limited_until = 0.0
+
 
 def lambda_handler(event, context):
     LOG.info(f"{event = }")
-    github = GitHubAuth(
-        _get_github_token(environ["GITHUB_ORG_NAME"]), environ["GITHUB_ORG_NAME"]
-    )
-    gha = GitHubActions(github)
-
-    if event["detail"].get("LifecycleHookName") == HOOK_DEREGISTRATION:
-        """
-        Received when an instance is entering Terminating:Wait (either a
-        regular scale-in / ASG termination, or a warm-pool trim).
-        """
-        instance_id = event["detail"]["EC2InstanceId"]
-        # Safety-net cleanup of the registration token secret. Puppet deletes
-        # it right after register (fast path); this call is idempotent and
-        # covers the case where Puppet never converged (crash during bootstrap,
-        # instance killed before agent run, etc).
-        gha.ensure_registration_token(
-            f"{environ['REGISTRATION_TOKEN_SECRET_PREFIX']}-{instance_id}",
-            present=False,
-        )
-        _handle_deregistration_hook(instance_id)
-    else:
+    try:
+        _handle_event(event)
+    finally:
+        # How long the GitHub and AWS API calls took.
+        emf.emit_phases(environ["ASG_NAME"], "deregistration")
+
+
+def _handle_event(event):
+    if event["detail"].get("LifecycleHookName") != HOOK_DEREGISTRATION:
         # Fall back to sweeping unused runners if no lifecycle hook is present
-        _clean_runners(gha, environ["INSTALLATION_ID"])
+        _clean_runners(_github_actions(), environ["INSTALLATION_ID"])
+        return
+
+    # EventBridge may deliver the event more than once; act on it once.
+    claim_key = state_store.lifecycle_key(event["detail"])
+    with emf.phase("state_table_claim"):
+        claimed = state_store.claim(claim_key, state_store.lifecycle_lease_ttl())
+    if not claimed:
+        LOG.info("Lifecycle action %s is already handled, skipping.", claim_key)
+        emf.emit_lifecycle_hook(event, HOOK_DEREGISTRATION, emf.RESULT_DUPLICATE)
+        return
+
+    try:
+        result = _handle_lifecycle_action(event)
+    except Exception:
+        # Let a retry of the event run the hook again.
+        state_store.release(claim_key)
+        raise
+    # The lifecycle action is complete, or handed over to the instance:
+    # skip any later delivery of the event.
+    with emf.phase("state_table_claim"):
+        state_store.extend(claim_key, state_store.LIFECYCLE_CLAIM_TTL)
+    emf.emit_lifecycle_hook(event, HOOK_DEREGISTRATION, result)
 
 
-def _handle_deregistration_hook(instance_id):
+def _handle_lifecycle_action(event) -> str:
+    """
+    Received when an instance is entering Terminating:Wait (either a
+    regular scale-in / ASG termination, or a warm-pool trim).
+    """
+    instance_id = event["detail"]["EC2InstanceId"]
+    # Safety-net cleanup of the registration token secret. Puppet deletes
+    # it right after register (fast path); this call is idempotent and
+    # covers the case where Puppet never converged (crash during bootstrap,
+    # instance killed before agent run, etc).
+    with emf.phase("registration_token"):
+        Secret(
+            f"{environ['REGISTRATION_TOKEN_SECRET_PREFIX']}-{instance_id}",
+            session=_session,
+        ).ensure_absent(force=True)
+    return _handle_deregistration_hook(instance_id)
+
+
+def _github_actions() -> github_client.GitHubClient:
+    with emf.phase("github_token"):
+        token = _get_github_token(environ["GITHUB_ORG_NAME"])
+    return github_client.github_actions(token, environ["GITHUB_ORG_NAME"])
+
+
+def _handle_deregistration_hook(
+    instance_id, gha: github_client.GitHubClient = None
+) -> str:
     """Fire-and-forget scale-in helper.
 
-    Two paths:
+    Three paths:
 
     - ``Warmed:Terminating:Wait``: warm-pool trim. No runner service is
       running on a hibernated warm-pool instance, so there's nothing to
       stop. Complete the lifecycle hook immediately.
-    - ``Terminating:Wait``: dispatch an SSM
+    - ``Terminating:Wait`` and GitHub reports the runner online and idle:
+      deregister the runner from GitHub and complete the lifecycle hook
+      immediately. GitHub refuses to delete a runner that has picked up
+      a job in the meantime; then the next path is taken.
+    - ``Terminating:Wait`` otherwise: dispatch an SSM
       ``systemctl stop actions-runner.service`` command and return. We
       do NOT wait for SSM to deliver the command, and we do NOT complete
       the lifecycle action — the on-host ``ExecStopPost`` script owns
@@ -67,29 +142,57 @@ def _handle_deregistration_hook(instance_id):
 
     Any other lifecycle state is unexpected for a deregistration event;
     the SSM stop still fires but is effectively a no-op.
+
+    :param gha: GitHubClient to look the runner up with. If None, it's built
+        on the paths that need GitHub, so a warm-pool trim fetches no GitHub token.
+
+    :return: ``CONTINUE`` if the lifecycle action was completed here,
+        ``emf.RESULT_DEFERRED`` if the instance will complete it.
     """
     asg_instance = ASGInstance(instance_id=instance_id, session=_session)
-    asg_name = asg_instance.asg_name
-
-    if asg_instance.lifecycle_state == "Warmed:Terminating:Wait":
-        _autoscaling.complete_lifecycle_action(
-            LifecycleHookName=HOOK_DEREGISTRATION,
-            AutoScalingGroupName=asg_name,
-            InstanceId=instance_id,
-            LifecycleActionResult="CONTINUE",
-        )
+    with emf.phase("asg_instance_lookup"):
+        asg_name = asg_instance.asg_name
+        lifecycle_state = asg_instance.lifecycle_state
+
+    if lifecycle_state == "Warmed:Terminating:Wait":
+        with emf.phase("complete_lifecycle_action"):
+            _autoscaling.complete_lifecycle_action(
+                LifecycleHookName=HOOK_DEREGISTRATION,
+                AutoScalingGroupName=asg_name,
+                InstanceId=instance_id,
+                LifecycleActionResult="CONTINUE",
+            )
         LOG.info(
             "Warm-pool trim for %s — completed lifecycle hook immediately.",
             instance_id,
         )
-        return
+        return "CONTINUE"
 
-    try:
-        _ssm.send_command(
-            InstanceIds=[instance_id],
-            DocumentName="AWS-RunShellScript",
-            Parameters={"commands": ["/usr/bin/systemctl stop actions-runner.service"]},
+    if gha is None:
+        gha = _github_actions()
+    if _deregister_idle_runner(instance_id, gha):
+        with emf.phase("complete_lifecycle_action"):
+            _autoscaling.complete_lifecycle_action(
+                LifecycleHookName=HOOK_DEREGISTRATION,
+                AutoScalingGroupName=asg_name,
+                InstanceId=instance_id,
+                LifecycleActionResult="CONTINUE",
+            )
+        LOG.info(
+            "Runner on %s was idle — deregistered it and completed lifecycle hook immediately.",
+            instance_id,
         )
+        return "CONTINUE"
+
+    try:
+        with emf.phase("send_command"):
+            _ssm.send_command(
+                InstanceIds=[instance_id],
+                DocumentName="AWS-RunShellScript",
+                Parameters={
+                    "commands": ["/usr/bin/systemctl stop actions-runner.service"]
+                },
+            )
     except ClientError as err:
         if err.response["Error"]["Code"] == "InvalidInstanceId":
             # The SSM agent hasn't registered yet (cold-start race: the instance
@@ -104,13 +207,14 @@ def _handle_deregistration_hook(instance_id):
                 "deregistration hook with CONTINUE instead of hanging until timeout.",
                 instance_id,
             )
-            _autoscaling.complete_lifecycle_action(
-                LifecycleHookName=HOOK_DEREGISTRATION,
-                AutoScalingGroupName=asg_name,
-                InstanceId=instance_id,
-                LifecycleActionResult="CONTINUE",
-            )
-            return
+            with emf.phase("complete_lifecycle_action"):
+                _autoscaling.complete_lifecycle_action(
+                    LifecycleHookName=HOOK_DEREGISTRATION,
+                    AutoScalingGroupName=asg_name,
+                    InstanceId=instance_id,
+                    LifecycleActionResult="CONTINUE",
+                )
+            return "CONTINUE"
         LOG.error(
             "Failed to send SSM stop to %s: %s. "
             "Lifecycle hook will time out after heartbeat_timeout and ABANDON.",
@@ -123,53 +227,231 @@ def _handle_deregistration_hook(instance_id):
         "ExecStopPost will complete the lifecycle hook.",
         instance_id,
     )
+    return emf.RESULT_DEFERRED
+
+
+def _deregister_idle_runner(instance_id, gha: github_client.GitHubClient) -> bool:
+    """
+    Deregister the runner of an instance from GitHub if it's online and not busy.
+
+    :return: True if the runner was idle and is now deregistered.
+    """
+    with emf.phase("runner_lookup"):
+        runner = runner_index.find_runner(gha, f"instance_id:{instance_id}")
+    if runner is None or runner.status != "online" or runner.busy:
+        return False
+
+    try:
+        with emf.phase("deregister_runner"):
+            gha.deregister_runner(runner)
+        runner_index.forget(runner)
+    except HTTPError as err:
+        # For instance, 422 if the runner picked up a job after we looked.
+        LOG.warning(
+            "Couldn't deregister runner %s: %s. Will stop it over SSM.",
+            runner.name,
+            err,
+        )
+        return False
+    return True
 
 
 def _get_github_token(org):
     return (
         get_secret(_secretsmanager, environ["GITHUB_SECRET"])
         if environ["GITHUB_SECRET_TYPE"] == "token"
-        else get_tmp_token(int(environ["GH_APP_ID"]), environ["GITHUB_SECRET"], org)
+        else github_client.app_token(
+            environ["GH_APP_ID"], environ["GITHUB_SECRET"], org
+        )
     )
 
 
-def _clean_runners(gha: GitHubActions, installation_id: str):
+def _clean_runners(gha: github_client.GitHubClient, installation_id: str):
     """
     Deregister GitHub Actions runners that are not running anymore (e.g. terminated).
-    Deregister only runners labeled with 'installation_id:<installation_id>'.
+    Deregister only runners labeled with 'installation_id:<installation_id>'
+    and with an 'instance_id:<instance_id>' label.
+
+    The states of all runner instances are resolved up front with a few batched
+    ``DescribeInstances`` calls rather than one lookup per runner. The stale runners
+    are then deregistered on up to ``DEREGISTRATION_CONCURRENCY`` threads.
 
-    :param gha: GitHubActions object
+    :param gha: GitHubClient object
     :param installation_id: unique ID of the runners installed by the module.
         Each runner has a label 'installation_id:<installation_id>'.
+    :return: Runner name to the result of its deregistration mapping,
+        see ``_deregister_runner()``.
+    :rtype: dict
     """
-    for runner in gha.find_runners_by_label(f"installation_id:{installation_id}"):
+    stale = []
+    with emf.phase("runner_lookup"):
+        runners = runner_index.find_runners(gha, f"installation_id:{installation_id}")
+    with emf.phase("describe_instances"):
+        states = _instance_states(
+            [runner.instance_id for runner in runners if runner.instance_id]
+        )
+    for runner in runners:
         LOG.info("Found runner %s", runner.name)
-        try:
-            if (
-                ASGInstance(instance_id=runner.instance_id, session=_session).state
-                == "terminated"
-            ):
-                LOG.info(
-                    "Instance %s is terminated. Will deregister the runner %s.",
-                    runner.instance_id,
-                    runner.name,
-                )
-                gha.deregister_runner(runner)
-        except IndexError:
+        if not runner.instance_id:
+            # Without an instance_id label there's no instance to check,
+            # e.g. a runner registered by hand with the installation label.
+            LOG.warning(
+                "Runner %s has no instance_id label, leaving it alone.", runner.name
+            )
+            continue
+        state = states.get(runner.instance_id)
+        if state is None:
+            # EC2 forgets terminated instances after about an hour.
             LOG.info(
-                "ASG lookup failed for instance %s (likely terminated). Will deregister the runner %s.",
+                "Instance %s doesn't exist. Will deregister the runner %s.",
                 runner.instance_id,
                 runner.name,
             )
-            gha.deregister_runner(runner)
+        elif state == "terminated":
+            LOG.info(
+                "Instance %s is terminated. Will deregister the runner %s.",
+                runner.instance_id,
+                runner.name,
+            )
+        else:
+            continue
+        stale.append(runner)
 
-        except ClientError as e:
-            if e.response["Error"]["Code"] == "InvalidInstanceID.NotFound":
-                LOG.info(
-                    "Instance %s doesn't exist. Will deregister the runner %s.",
-                    runner.instance_id,
-                    runner.name,
-                )
+    concurrency = int(environ.get("DEREGISTRATION_CONCURRENCY", "1"))
+    results = {}
+    if stale:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(stale))) as executor:
+            for runner, result in zip(
+                stale,
+                executor.map(lambda runner: _deregister_runner(gha, runner), stale),
+            ):
+                results[runner.name] = result
+
+    emf.emit(
+        {
+            "RunnersDeregistered": (
+                sum(result != RESULT_FAILED for result in results.values()),
+                "Count",
+            ),
+            "RunnerDeregistrationFailures": (
+                sum(result == RESULT_FAILED for result in results.values()),
+                "Count",
+            ),
+        },
+        {"asg_name": environ["ASG_NAME"]},
+        properties={"results": results},
+    )
+    return results
+
+
+def _deregister_runner(gha: github_client.GitHubClient, runner) -> str:
+    """
+    Deregister a runner, backing off when GitHub rate-limits the requests.
+
+    GitHub answers 403 or 429 when a client trips its secondary rate limits,
+    e.g. by deleting many runners at once. The request is then retried after
+    the delay GitHub asks for (or an exponential backoff), up to
+    ``DEREGISTRATION_ATTEMPTS`` times. Any other 403, e.g. a missing
+    permission, fails at once, see ``_is_rate_limited()``.
+
+    :return: ``RESULT_DEREGISTERED``, ``RESULT_NOT_FOUND`` if GitHub had already
+        removed the runner, or ``RESULT_FAILED``.
+    """
+    for attempt in range(DEREGISTRATION_ATTEMPTS):
+        sleep(max(0.0, _rate_limited_until - time()))
+        try:
+            with emf.phase("deregister_runner"):
                 gha.deregister_runner(runner)
-            else:
-                raise  # re-raise for other unexpected errors
+            runner_index.forget(runner)
+            LOG.info("Deregistered runner %s.", runner.name)
+            return RESULT_DEREGISTERED
+
+        except HTTPError as err:
+            status_code = err.response.status_code if err.response is not None else None
+            if status_code == 404:
+                runner_index.forget(runner)
+                LOG.info("Runner %s is already deregistered.", runner.name)
+                return RESULT_NOT_FOUND
+            delay = _retry_delay(err.response, attempt)
+            if (
+                not _is_rate_limited(err.response)
+                or attempt == DEREGISTRATION_ATTEMPTS - 1
+                or delay > DEREGISTRATION_MAX_BACKOFF
+            ):
+                LOG.error("Failed to deregister runner %s: %s", runner.name, err)
+                return RESULT_FAILED
+
+            LOG.warning(
+                "GitHub rate-limited deregistration of %s, retrying in %.0f seconds.",
+                runner.name,
+                delay,
+            )
+            _pause_deregistrations(delay)
+
+    return RESULT_FAILED
+
+
+def _is_rate_limited(response) -> bool:
+    """
+    Whether GitHub refused a request because of a rate limit.
+
+    A 429 always is. A 403 is only if it says so in ``Retry-After`` or with
+    ``X-RateLimit-Remaining: 0``; otherwise it's a permission error,
+    and retrying won't help.
+    """
+    if response is None:
+        return False
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and (
+        "Retry-After" in response.headers
+        or response.headers.get("X-RateLimit-Remaining") == "0"
+    )
+
+
+def _retry_delay(response, attempt) -> float:
+    """
+    Seconds to wait before retrying a rate-limited GitHub request.
+
+    Honors ``Retry-After``, then ``X-RateLimit-Reset`` when no requests
+    are left, and falls back to an exponential backoff.
+    """
+    headers = response.headers if response is not None else {}
+    if "Retry-After" in headers:
+        return float(headers["Retry-After"])
+    if headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in headers:
+        return max(0.0, float(headers["X-RateLimit-Reset"]) - time())
+    return float(2**attempt)
+
+
+def _pause_deregistrations(delay):
+    """Make every deregistration thread wait at least ``delay`` seconds."""
+    global _rate_limited_until
+
+    with _rate_limit_lock:
+        _rate_limited_until = max(_rate_limited_until, time() + delay)
+
+
+def _instance_states(instance_ids) -> dict:
+    """
+    Look up the states of EC2 instances.
+
+    The IDs are passed as an ``instance-id`` filter rather than ``InstanceIds``:
+    an unknown ID then is just missing from the result instead of failing
+    the whole request with ``InvalidInstanceID.NotFound``.
+
+    :param instance_ids: EC2 instance IDs.
+    :return: Instance ID to state name (``running``, ``terminated``, ...) mapping.
+        Instances EC2 doesn't know about are not in it.
+    """
+    states = {}
+    paginator = _ec2.get_paginator("describe_instances")
+    for start in range(0, len(instance_ids), DESCRIBE_INSTANCES_BATCH_SIZE):
+        batch = instance_ids[start : start + DESCRIBE_INSTANCES_BATCH_SIZE]
+        for page in paginator.paginate(
+            Filters=[{"Name": "instance-id", "Values": batch}]
+        ):
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    states[instance["InstanceId"]] = instance["State"]["Name"]
+    return states
@@ -0,0 +1,101 @@
+"""
+Index of the organization's GitHub runners by label.
+
+``GitHubClient.find_runner_by_label()`` pages through every runner of the
+organization on each lookup. The index lists them once and maps each label,
+e.g. ``instance_id:i-...`` or ``installation_id:...``, to its runners. Lookups
+are answered from memory until the index is ``INDEX_TTL`` seconds old. The
+index lives in module scope, so a warm Lambda reuses it across invocations
+during a scale event.
+
+If the index is stale, it's rebuilt from the snapshot ``record_metric`` keeps
+in the state table (see ``runner_snapshot``), provided the snapshot isn't older
+than the lookup accepts, and from a GitHub listing otherwise. A snapshot only
+has the installation's runners and their ``instance_id`` and ``installation_id``
+labels, which are the only labels the Lambdas look up.
+
+A lookup that must not miss a runner registered a moment ago passes a smaller
+``max_age``. After deregistering a runner, ``forget()`` drops it from the index.
+
+Every Lambda of the module is packaged from its own directory, so this file
+is copied verbatim into each Lambda that uses it. Edit all copies together;
+``tests/test_runner_index.py`` fails if they differ.
+"""
+
+from threading import Lock
+from time import monotonic
+
+import runner_snapshot
+
+# How many seconds old runners may be to answer a lookup. The lifecycle hooks
+# tolerate that: a busy runner that looks idle fails to deregister and is
+# stopped over SSM, a runner registered since is looked up again when it
+# matters, e.g. by the bootstrap readiness polling, and a runner deregistered
+# since is confirmed in GitHub before acting on it, e.g. by the registration hook.
+INDEX_TTL = 90
+
+_lock = Lock()
+_runners_by_label = {}
+_built_at = None
+
+
+def find_runners(gha, label, max_age=INDEX_TTL) -> list:
+    """
+    Runners that have ``label``.
+
+    :param gha: GitHubClient to list the runners with if the index is stale.
+    :param label: Runner label.
+    :param max_age: Rebuild the index if it's older than this many seconds.
+    """
+    with _lock:
+        if _built_at is None or monotonic() - _built_at > max_age:
+            _build(gha, max_age)
+        return list(_runners_by_label.get(label, []))
+
+
+def find_runner(gha, label, max_age=INDEX_TTL):
+    """
+    The first runner that has ``label``, or None.
+
+    See ``find_runners()``.
+    """
+    return next(iter(find_runners(gha, label, max_age=max_age)), None)
+
+
+def forget(runner):
+    """
+    Drop a deregistered runner from the index.
+    """
+    with _lock:
+        for label in runner.labels:
+            runners = _runners_by_label.get(label, [])
+            if runner in runners:
+                runners.remove(runner)
+
+
+def invalidate():
+    """
+    Drop the index, so the next lookup lists the runners in GitHub.
+    """
+    global _built_at
+    with _lock:
+        _built_at = None
+        _runners_by_label.clear()
+
+
+def _build(gha, max_age):
+    global _built_at
+    # If the listing fails halfway, the next lookup starts over.
+    _built_at = None
+    _runners_by_label.clear()
+    snapshot = runner_snapshot.load(max_age)
+    if snapshot:
+        runners, age = snapshot
+        built_at = monotonic() - age
+    else:
+        runners = gha.runners
+        built_at = monotonic()
+    for runner in runners:
+        for label in runner.labels:
+            _runners_by_label.setdefault(label, []).append(runner)
+    _built_at = built_at
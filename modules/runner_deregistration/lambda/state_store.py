@@ -0,0 +1,208 @@
+"""
+Claims and short-lived values in the module's DynamoDB state table.
+
+EventBridge delivers an event at least once. A Lambda claims a key derived
+from the event before acting on it, and skips the event if the key is
+already claimed, so a duplicate delivery doesn't repeat the GitHub and AWS
+calls. A lifecycle action is claimed for a short lease while it's handled,
+and for ``LIFECYCLE_CLAIM_TTL`` once it's done, see ``extend()``.
+
+Values that several Lambda invocations share, e.g. the runner snapshot, are
+kept with ``put()`` and ``get()``. Claims and values expire through the
+table's ``expires_at`` TTL attribute. Counters that never expire, e.g. the
+webhook job counters, are read with ``get_counters()``.
+
+Without ``STATE_TABLE`` in the environment every claim succeeds
+and no value is kept.
+
+Every Lambda of the module is packaged from its own directory, so this file
+is copied verbatim into each Lambda that uses it. Edit all copies together;
+``tests/test_state_store.py`` fails if they differ.
+"""
+
+from os import environ
+from time import time
+from typing import Optional
+
+import boto3
+from botocore.exceptions import ClientError
+
+_dynamodb = boto3.client("dynamodb")
+
+# A lifecycle action lives at most 48 hours, the lifecycle hook global timeout.
+LIFECYCLE_CLAIM_TTL = 48 * 3600
+# The longest a Lambda runs, if LAMBDA_TIMEOUT isn't in the environment.
+LAMBDA_MAX_TIMEOUT = 900
+# BatchGetItem reads up to 100 items per request.
+BATCH_GET_SIZE = 100
+
+
+def lifecycle_key(detail) -> str:
+    """
+    Claim key of a lifecycle action.
+
+    :param detail: ``detail`` of an EventBridge lifecycle action event.
+    """
+    return f"lifecycle#{detail['LifecycleActionToken']}#{detail['EC2InstanceId']}"
+
+
+def lifecycle_lease_ttl() -> int:
+    """
+    How long a Lambda claims a lifecycle action it's handling: its timeout,
+    ``LAMBDA_TIMEOUT`` in the environment. If the Lambda times out or runs
+    out of memory, the claim outlives it by no more than that, so a retry
+    of the event isn't skipped.
+    """
+    return int(environ.get("LAMBDA_TIMEOUT", LAMBDA_MAX_TIMEOUT))
+
+
+def claim(key, ttl) -> bool:
+    """
+    Claim ``key`` for ``ttl`` seconds.
+
+    :return: True if the key was free (or its claim expired) and is now
+        claimed, False if somebody else holds it.
+    """
+    table = environ.get("STATE_TABLE")
+    if not table:
+        return True
+
+    now = int(time())
+    try:
+        _dynamodb.put_item(
+            TableName=table,
+            Item={"pk": {"S": key}, "expires_at": {"N": str(now + ttl)}},
+            # DynamoDB deletes expired items lazily, up to a couple of days late.
+            ConditionExpression="attribute_not_exists(pk) OR expires_at < :now",
+            ExpressionAttributeValues={":now": {"N": str(now)}},
+        )
+    except ClientError as err:
+        if err.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return False
+    return True
+
+
+def extend(key, ttl):
+    """
+    Hold the claim on ``key`` for ``ttl`` more seconds,
+    e.g. once the work it guarded is done.
+    """
+    table = environ.get("STATE_TABLE")
+    if table:
+        _dynamodb.put_item(
+            TableName=table,
+            Item={"pk": {"S": key}, "expires_at": {"N": str(int(time()) + ttl)}},
+        )
+
+
+def release(key):
+    """
+    Drop the claim on ``key``, e.g. when the work it guarded failed
+    and a retry of the event must not be skipped.
+    """
+    delete(key)
+
+
+def delete(key):
+    """
+    Delete the claim or value kept under ``key``.
+    """
+    table = environ.get("STATE_TABLE")
+    if table:
+        _dynamodb.delete_item(TableName=table, Key={"pk": {"S": key}})
+
+
+def get(key) -> Optional[dict]:
+    """
+    Read a value kept with ``put()``.
+
+    :return: The value's attributes and its ``expires_at`` (Unix time),
+        or None if there is no such value or it has expired.
+    """
+    table = environ.get("STATE_TABLE")
+    if not table:
+        return None
+
+    item = _dynamodb.get_item(
+        TableName=table, Key={"pk": {"S": key}}, ConsistentRead=True
+    ).get("Item")
+    return _value(item) if item else None
+
+
+def get_counters(key) -> dict:
+    """
+    Read the number attributes of an item kept without a TTL,
+    e.g. the job counters ``webhook_receiver`` updates.
+
+    :return: The counters by name, empty if there is no such item.
+    """
+    table = environ.get("STATE_TABLE")
+    if not table:
+        return {}
+
+    item = _dynamodb.get_item(
+        TableName=table, Key={"pk": {"S": key}}, ConsistentRead=True
+    ).get("Item", {})
+    return {name: int(value["N"]) for name, value in item.items() if "N" in value}
+
+
+def get_many(keys) -> dict:
+    """
+    Read the values kept under ``keys`` with ``put()``,
+    ``BATCH_GET_SIZE`` keys per request.
+
+    :return: The values that exist and haven't expired, by key,
+        as ``get()`` returns them.
+    """
+    table = environ.get("STATE_TABLE")
+    if not table:
+        return {}
+
+    keys = list(keys)
+    values = {}
+    for start in range(0, len(keys), BATCH_GET_SIZE):
+        request = {
+            table: {
+                "Keys": [
+                    {"pk": {"S": key}} for key in keys[start : start + BATCH_GET_SIZE]
+                ],
+                "ConsistentRead": True,
+            }
+        }
+        while request:
+            response = _dynamodb.batch_get_item(RequestItems=request)
+            for item in response["Responses"].get(table, []):
+                value = _value(item)
+                if value is not None:
+                    values[item["pk"]["S"]] = value
+            # Keys DynamoDB didn't get to, e.g. when throttled.
+            request = response.get("UnprocessedKeys")
+    return values
+
+
+def put(key, values, ttl):
+    """
+    Keep string ``values`` under ``key`` for ``ttl`` seconds.
+
+    :type values: dict
+    """
+    table = environ.get("STATE_TABLE")
+    if table:
+        _dynamodb.put_item(
+            TableName=table,
+            Item={
+                **{name: {"S": value} for name, value in values.items()},
+                "pk": {"S": key},
+                "expires_at": {"N": str(int(time()) + ttl)},
+            },
+        )
+
+
+def _value(item) -> Optional[dict]:
+    if int(item["expires_at"]["N"]) <= time():
+        return None
+    return {
+        **{name: value["S"] for name, value in item.items() if "S" in value},
+        "expires_at": int(item["expires_at"]["N"]),
+    }
@@ -73,6 +73,17 @@ data "aws_iam_policy_document" "runner_deregistration_permissions" {
       )
     ]
   }
+  dynamic "statement" {
+    for_each = var.state_table_arn != null ? [1] : []
+    content {
+      actions = [
+        "dynamodb:DeleteItem",
+        "dynamodb:GetItem",
+        "dynamodb:PutItem",
+      ]
+      resources = [var.state_table_arn]
+    }
+  }
 }
 
 resource "aws_iam_policy" "runner_deregistration_permissions" {
@@ -111,12 +122,15 @@ module "lambda_monitored" {
 
   environment_variables = {
     ASG_NAME                         = var.asg_name
+    DEREGISTRATION_CONCURRENCY       = var.deregistration_concurrency
     REGISTRATION_TOKEN_SECRET_PREFIX = var.registration_token_secret_prefix
     GITHUB_ORG_NAME                  = var.github_org_name
+    LAMBDA_TIMEOUT                   = var.lambda_timeout
     GITHUB_SECRET                    = var.github_credentials.secret
     GITHUB_SECRET_TYPE               = var.github_credentials.type
     GH_APP_ID                        = var.github_app_id
     INSTALLATION_ID                  = var.installation_id
+    STATE_TABLE                      = var.state_table_name != null ? var.state_table_name : ""
   }
 
   tags = merge(
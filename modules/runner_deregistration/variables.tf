@@ -24,6 +24,19 @@ variable "cloudwatch_log_group_retention" {
   type        = number
 }
 
+variable "deregistration_concurrency" {
+  description = <<-EOT
+    How many runners the scheduled sweep deregisters from GitHub in parallel.
+    The sweep backs off on all threads when GitHub rate-limits the requests.
+  EOT
+  type        = number
+  default     = 4
+  validation {
+    condition     = var.deregistration_concurrency >= 1 && var.deregistration_concurrency <= 20
+    error_message = "deregistration_concurrency must be between 1 and 20"
+  }
+}
+
 variable "error_rate_threshold" {
   description = "Error rate threshold percentage for threshold-based alerting."
   type        = number
@@ -81,6 +94,18 @@ variable "security_group_ids" {
   type        = list(string)
 }
 
+variable "state_table_arn" {
+  description = "ARN of the module's DynamoDB state table. Duplicate lifecycle events are detected there, and the runner snapshot of `record_metric` is read there."
+  type        = string
+  default     = null
+}
+
+variable "state_table_name" {
+  description = "Name of the module's DynamoDB state table."
+  type        = string
+  default     = null
+}
+
 variable "subnet_ids" {
   description = "List of subnet ids where the actions runner instances will be created."
   type        = list(string)
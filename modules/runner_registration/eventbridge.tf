@@ -23,14 +23,59 @@ resource "aws_cloudwatch_event_rule" "scale" {
   )
 }
 
-resource "aws_cloudwatch_event_target" "scale-in-out" {
+# Launch activities that succeeded, for the in_service stage of the
+# LaunchLatency metric. They go to the Lambda directly, not through the
+# SQS buffer: handling one takes no GitHub calls.
+resource "aws_cloudwatch_event_rule" "launch_successful" {
+  name_prefix = substr("${var.asg_name}-launched-", 0, 38)
+  description = "ASG instance launched"
+  event_pattern = jsonencode(
+    {
+      "source" : ["aws.autoscaling"],
+      "detail-type" : [
+        "EC2 Instance Launch Successful",
+      ],
+      "detail" : {
+        "AutoScalingGroupName" : [
+          var.asg_name
+        ]
+      }
+    }
+  )
+  tags = merge(
+    var.tags,
+    {
+      "asg_name" : var.asg_name
+    }
+  )
+}
+
+resource "aws_cloudwatch_event_target" "launch_successful" {
   arn  = module.lambda_monitored.lambda_function_arn
+  rule = aws_cloudwatch_event_rule.launch_successful.name
+}
+
+resource "aws_lambda_permission" "allow_cloudwatch_launch_successful" {
+  action        = "lambda:InvokeFunction"
+  function_name = module.lambda_monitored.lambda_function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.launch_successful.arn
+}
+
+resource "aws_cloudwatch_event_target" "scale-in-out" {
+  arn  = var.sqs_buffer_enabled ? aws_sqs_queue.lifecycle[0].arn : module.lambda_monitored.lambda_function_arn
   rule = aws_cloudwatch_event_rule.scale.name
 }
 
 resource "aws_lambda_permission" "allow_cloudwatch_asg_lifecycle_hook" {
+  count         = var.sqs_buffer_enabled ? 0 : 1
   action        = "lambda:InvokeFunction"
   function_name = module.lambda_monitored.lambda_function_name
   principal     = "events.amazonaws.com"
   source_arn    = aws_cloudwatch_event_rule.scale.arn
 }
+
+moved {
+  from = aws_lambda_permission.allow_cloudwatch_asg_lifecycle_hook
+  to   = aws_lambda_permission.allow_cloudwatch_asg_lifecycle_hook[0]
+}
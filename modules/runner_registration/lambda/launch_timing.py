@@ -0,0 +1,151 @@
+"""
+Launch-to-ready latency of the ASG's instances.
+
+After the ASG launches an instance, or wakes one up from the warm pool,
+the instance goes through these stages:
+
+- ``registration_hook``: the registration Lambda completed the
+  ``registration`` lifecycle hook;
+- ``in_service``: the launch succeeded, i.e. the ``bootstrap`` hook
+  was completed by the Lambda or by the instance;
+- ``runner_online``: ``record_metric`` saw the instance's runner online for
+  the first time. It samples the runners every ``METRIC_SAMPLE_INTERVAL``
+  seconds, so this stage is up to that much late.
+
+The ``LaunchLatency`` EMF metric is the seconds from the launch to each stage,
+with ``stage`` and ``launch_type`` dimensions. The launch type is ``cold`` for
+an instance booted from its AMI and ``resume`` for one woken up from the
+warm pool. Launches into the warm pool aren't measured: no job waits for them.
+
+The registration Lambda keeps the launch time in the state table until
+``record_metric`` sees the runner online. Without ``STATE_TABLE`` in the
+environment, the ``runner_online`` stage isn't measured.
+
+Every Lambda of the module is packaged from its own directory, so this file
+is copied verbatim into each Lambda that uses it. Edit all copies together;
+``tests/test_launch_timing.py`` fails if they differ.
+"""
+
+from datetime import datetime
+from time import time
+from typing import Optional
+
+import emf
+import state_store
+
+LAUNCH_KEY_PREFIX = "launch#"
+# A cold launch may wait up to 20 minutes for each of its two lifecycle hooks.
+LAUNCH_TTL = 3600
+
+LAUNCH_TYPE_COLD = "cold"
+LAUNCH_TYPE_RESUME = "resume"
+
+STAGE_REGISTRATION_HOOK = "registration_hook"
+STAGE_IN_SERVICE = "in_service"
+STAGE_RUNNER_ONLINE = "runner_online"
+
+# Instances whose runners record_metric saw online in its previous sample.
+_online_instance_ids = set()
+
+
+def launch_type(detail) -> Optional[str]:
+    """
+    ``cold`` or ``resume``, or None for a launch into the warm pool.
+
+    :param detail: ``detail`` of a launch lifecycle action or launch activity event.
+    """
+    if detail.get("Destination") == "WarmPool":
+        return None
+    return (
+        LAUNCH_TYPE_RESUME if detail.get("Origin") == "WarmPool" else LAUNCH_TYPE_COLD
+    )
+
+
+def record_registration(event):
+    """
+    Publish the ``registration_hook`` stage of a launch, and keep
+    its launch time for ``record_online()``.
+
+    :param event: The EventBridge launch lifecycle action event
+        whose ``registration`` hook was completed.
+    """
+    detail = event["detail"]
+    kind = launch_type(detail)
+    if kind is None or "time" not in event:
+        return
+    launched_at = _parse_time(event["time"])
+    with emf.phase("state_table_put_item"):
+        state_store.put(
+            f"{LAUNCH_KEY_PREFIX}{detail['EC2InstanceId']}",
+            {"launched_at": str(launched_at), "launch_type": kind},
+            LAUNCH_TTL,
+        )
+    _emit(
+        detail["AutoScalingGroupName"],
+        STAGE_REGISTRATION_HOOK,
+        kind,
+        time() - launched_at,
+    )
+
+
+def record_in_service(detail):
+    """
+    Publish the ``in_service`` stage of a launch.
+
+    :param detail: ``detail`` of an ``EC2 Instance Launch Successful`` event.
+    """
+    kind = launch_type(detail)
+    if kind is None:
+        return
+    _emit(
+        detail["AutoScalingGroupName"],
+        STAGE_IN_SERVICE,
+        kind,
+        _parse_time(detail["EndTime"]) - _parse_time(detail["StartTime"]),
+    )
+
+
+def record_online(asg_name, runners):
+    """
+    Publish the ``runner_online`` stage of the launches whose runners
+    came online since the previous call.
+
+    After a cold start of ``record_metric``, every online runner looks new.
+    Their launches were already published and forgotten, so that costs
+    one state table read per 100 runners and publishes nothing.
+
+    :param asg_name: Value of the ``asg_name`` dimension.
+    :param runners: The installation's online runners.
+    """
+    global _online_instance_ids
+    online = {runner.instance_id for runner in runners if runner.instance_id}
+    new = online - _online_instance_ids
+    _online_instance_ids = online
+    if not new:
+        return
+
+    with emf.phase("state_table_get_item"):
+        launches = state_store.get_many(
+            [f"{LAUNCH_KEY_PREFIX}{instance_id}" for instance_id in sorted(new)]
+        )
+    for key, launch in launches.items():
+        _emit(
+            asg_name,
+            STAGE_RUNNER_ONLINE,
+            launch["launch_type"],
+            time() - float(launch["launched_at"]),
+        )
+        with emf.phase("state_table_delete_item"):
+            state_store.delete(key)
+
+
+def _emit(asg_name, stage, kind, seconds):
+    emf.emit(
+        # The clocks of EventBridge and the Lambda may disagree a little.
+        {"LaunchLatency": (max(seconds, 0.0), "Seconds")},
+        {"asg_name": asg_name, "stage": stage, "launch_type": kind},
+    )
+
+
+def _parse_time(value) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
@@ -1,14 +1,26 @@
+from time import monotonic
+
+# When the cold start began loading the module, see emf.record_init().
+_INIT_STARTED_AT = monotonic()
+
+import json
 import logging
 from os import environ
-
-from infrahouse_core.github import get_tmp_token, GitHubActions, GitHubAuth
+from time import sleep, time
 
 from botocore.exceptions import ClientError, BotoCoreError
 from infrahouse_core.aws import get_secret
 from infrahouse_core.aws.asg import ASG
 from infrahouse_core.aws.asg_instance import ASGInstance
+from infrahouse_core.aws.exceptions import IHSecretNotFound
+from infrahouse_core.aws.secretsmanager import Secret
 import boto3
-from github import GithubException
+
+import emf
+import github_client
+import launch_timing
+import runner_index
+import state_store
 
 LOG = logging.getLogger()
 LOG.setLevel(level=logging.INFO)
@@ -19,10 +31,45 @@ LOG.setLevel(level=logging.INFO)
 # AWS clients share a single credential chain and endpoint cache.
 _session = boto3.Session()
 _secretsmanager = _session.client("secretsmanager")
+emf.record_init(_INIT_STARTED_AT)
 
 HOOK_REGISTRATION = "registration"
 HOOK_BOOTSTRAP = "bootstrap"
 
+# Event of a launch activity that succeeded, i.e. an instance that went in service.
+LAUNCH_SUCCESSFUL = "EC2 Instance Launch Successful"
+
+# A GitHub registration token is valid for an hour and registers any number
+# of runners. It's handed out while GitHub's expires_at is at least
+# REGISTRATION_TOKEN_MIN_LIFETIME seconds away: an instance that gets it may
+# take a cold boot and the 20 minutes of the bootstrap hook to register.
+REGISTRATION_TOKEN_MIN_LIFETIME = 25 * 60
+# The shared token is kept in the secret REGISTRATION_TOKEN_SECRET_PREFIX.pool.
+# The instances may read and delete the REGISTRATION_TOKEN_SECRET_PREFIX-*
+# secrets, their own tokens, but not this one. The lock held while minting
+# the token is a claim in the state table.
+REGISTRATION_TOKEN_POOL_SUFFIX = ".pool"
+REGISTRATION_TOKEN_LOCK_KEY = "registration-token#lock"
+# How many seconds to wait for a token another invocation is minting.
+REGISTRATION_TOKEN_LOCK_WAIT = 10
+
+# The bootstrap hook polls GitHub for the instance's runner every
+# BOOTSTRAP_POLL_INITIAL_DELAY seconds, doubling the delay up to
+# BOOTSTRAP_POLL_MAX_DELAY, for at most BOOTSTRAP_POLL_TIMEOUT seconds.
+BOOTSTRAP_POLL_INITIAL_DELAY = 2
+BOOTSTRAP_POLL_MAX_DELAY = 30
+# A poll accepts runners listed since the previous poll, or at most this many
+# seconds ago, so it reuses record_metric's snapshot when one was taken in the
+# meantime, and the early, short delays don't each list all runners in GitHub.
+BOOTSTRAP_POLL_MIN_AGE = 10
+# Seconds of the Lambda timeout kept for completing the hook after polling.
+BOOTSTRAP_POLL_MARGIN = 30
+
+# Module-scope cache of the shared registration token, so a warm Lambda
+# handling a burst of launches doesn't even read the pooled secret.
+_registration_token = None
+_registration_token_expires_at = 0.0
+
 
 def lambda_handler(event, context):
     """
@@ -37,18 +84,103 @@ def lambda_handler(event, context):
     :param context: The context object providing runtime information about the Lambda function.
     :type context: LambdaContext
 
-    :return: None
+    With the SQS buffer, the event is a batch of SQS messages, each holding
+    one lifecycle event. See ``_handle_batch()``.
+
+    A duplicate delivery of a lifecycle event is skipped, see ``state_store``.
+
+    A successful launch activity and a completed ``registration`` hook are
+    published as stages of the ``LaunchLatency`` metric, see ``launch_timing``.
+
+    How long the GitHub and AWS API calls took is published
+    as the ``PhaseDuration`` EMF metric.
+
+    :return: None, or the partial batch response for an SQS batch.
     """
     LOG.info(f"{event = }")
+    try:
+        if "Records" in event:
+            return _handle_batch(event["Records"])
+        _handle_event(event)
+    finally:
+        emf.emit_phases(environ["ASG_NAME"], "registration")
+
+
+def _handle_batch(records) -> dict:
+    """
+    Handle a batch of lifecycle events from the SQS buffer.
+
+    The GitHub runners are listed once, and every instance of the batch is
+    looked up in that listing. The messages that failed are reported
+    in ``batchItemFailures``, so SQS redelivers only them.
+    """
+    gha = _github_actions()
+    with emf.phase("github_list_runners"):
+        runners = {runner.instance_id: runner for runner in gha.runners}
+
+    failures = []
+    for record in records:
+        try:
+            _handle_event(json.loads(record["body"]), gha=gha, runners=runners)
+        except Exception:
+            LOG.exception("Failed to handle message %s.", record["messageId"])
+            failures.append({"itemIdentifier": record["messageId"]})
+    return {"batchItemFailures": failures}
+
+
+def _handle_event(event, gha=None, runners=None):
+    if event.get("detail-type") == LAUNCH_SUCCESSFUL:
+        _handle_launch_successful(event["detail"])
+        return
+
     hook_name = event["detail"]["LifecycleHookName"]
     LOG.info(f"{hook_name = }")
+    if hook_name not in (HOOK_REGISTRATION, HOOK_BOOTSTRAP):
+        LOG.info(f"Ignoring hook {hook_name}")
+        return
+
+    claim_key = state_store.lifecycle_key(event["detail"])
+    with emf.phase("state_table_claim"):
+        claimed = state_store.claim(claim_key, state_store.lifecycle_lease_ttl())
+    if not claimed:
+        LOG.info("Lifecycle action %s is already handled, skipping.", claim_key)
+        emf.emit_lifecycle_hook(event, hook_name, emf.RESULT_DUPLICATE)
+        return
+
+    try:
+        result = _handle_lifecycle_action(event, hook_name, gha, runners)
+    except Exception:
+        # Let a retry of the event run the hook again.
+        state_store.release(claim_key)
+        raise
+    # The lifecycle action is complete: skip any later delivery of the event.
+    with emf.phase("state_table_claim"):
+        state_store.extend(claim_key, state_store.LIFECYCLE_CLAIM_TTL)
+    emf.emit_lifecycle_hook(event, hook_name, result)
+    if hook_name == HOOK_REGISTRATION and result == "CONTINUE":
+        launch_timing.record_registration(event)
+
+
+def _handle_launch_successful(detail):
+    with emf.phase("state_table_claim"):
+        claimed = state_store.claim(
+            f"activity#{detail['ActivityId']}", launch_timing.LAUNCH_TTL
+        )
+    if claimed:
+        launch_timing.record_in_service(detail)
+
+
+def _handle_lifecycle_action(event, hook_name, gha=None, runners=None) -> str:
+    """
+    :param gha: GitHubClient shared by a batch of events. Built if None.
+    :param runners: Runners by instance id, listed once for a batch of events.
+        If None, the runner of the instance is looked up in GitHub.
+    """
     asg_instance = ASGInstance(
         instance_id=event["detail"]["EC2InstanceId"], session=_session
     )
-    github = GitHubAuth(
-        _get_github_token(environ["GITHUB_ORG_NAME"]), environ["GITHUB_ORG_NAME"]
-    )
-    gha = GitHubActions(github)
+    if gha is None:
+        gha = _github_actions()
 
     if hook_name == HOOK_REGISTRATION:
         """
@@ -58,9 +190,9 @@ def lambda_handler(event, context):
         The goal of this lifecycle action is to ensure a registration token
         is obtained and stored in a secret.
         """
-        _handle_registration_hook(asg_instance, hook_name, gha)
+        return _handle_registration_hook(asg_instance, hook_name, gha, runners)
 
-    elif hook_name == HOOK_BOOTSTRAP:
+    else:
         """
         This hook is received either at instance start or when the instance
         comes back from hibernation.
@@ -68,77 +200,124 @@ def lambda_handler(event, context):
         action after a successful puppet run
         When the instance comes back from the hibernation, it's already registered,
         thus known for the GitHubActions() class.
-        """
-        wait_timeout = int(environ["LAMBDA_TIMEOUT"])
-        _handle_bootstrap_hook(asg_instance, hook_name, gha, wait_timeout=wait_timeout)
 
-    else:
-        LOG.info(f"Ignoring hook {hook_name}")
+        With BOOTSTRAP_POLL_TIMEOUT, the Lambda waits that long for the runner
+        to come online and completes the hook itself. A batch of events isn't
+        polled, the events would wait for each other.
+        """
+        wait_timeout = (
+            0
+            if runners is not None
+            else min(
+                int(environ.get("BOOTSTRAP_POLL_TIMEOUT", 0)),
+                int(environ["LAMBDA_TIMEOUT"]) - BOOTSTRAP_POLL_MARGIN,
+            )
+        )
+        return _handle_bootstrap_hook(
+            asg_instance, hook_name, gha, wait_timeout=wait_timeout, runners=runners
+        )
 
 
 def _handle_registration_hook(
-    asg_instance: ASGInstance, hook_name: str, gha: GitHubActions
-):
-    asg = ASG(asg_name=asg_instance.asg_name, session=_session)
+    asg_instance: ASGInstance,
+    hook_name: str,
+    gha: github_client.GitHubClient,
+    runners=None,
+) -> str:
+    with emf.phase("asg_instance_lookup"):
+        asg = ASG(asg_name=asg_instance.asg_name, session=_session)
     instance_id = asg_instance.instance_id
     try:
         registration_token_secret_prefix = environ["REGISTRATION_TOKEN_SECRET_PREFIX"]
         registration_token_secret = f"{registration_token_secret_prefix}-{instance_id}"
-        # if the instance is already registered, we don't need the token
-        gha.ensure_registration_token(
-            registration_token_secret,
-            present=gha.find_runner_by_label(f"instance_id:{instance_id}") is None,
-        )
-        asg.complete_lifecycle_action(hook_name=hook_name, instance_id=instance_id)
+        runner = _find_runner(gha, instance_id, runners)
+        if runner is not None and runners is None:
+            # The index may be 90 seconds old, or rebuilt from the record_metric
+            # snapshot. A runner deregistered since is still in it, and deleting
+            # the token would leave the instance unable to register again.
+            with emf.phase("runner_lookup"):
+                runner = gha.find_runner_by_label(f"instance_id:{instance_id}")
+        if runner is None:
+            token = _get_registration_token(gha)
+            with emf.phase("registration_token"):
+                Secret(registration_token_secret, session=_session).ensure_present(
+                    value=token,
+                    description="GitHub Actions runner registration token",
+                    update_if_exists=True,
+                )
+        else:
+            # if the instance is already registered, we don't need the token
+            with emf.phase("registration_token"):
+                Secret(registration_token_secret, session=_session).ensure_absent(
+                    force=True
+                )
+        with emf.phase("complete_lifecycle_action"):
+            asg.complete_lifecycle_action(hook_name=hook_name, instance_id=instance_id)
         LOG.info(
             f"Lifecycle hook %s for %s is successfully complete.",
             hook_name,
             instance_id,
         )
+        return "CONTINUE"
 
     except (
         ClientError,
         BotoCoreError,
-        GithubException,
         RuntimeError,
         TimeoutError,
     ) as err:
         LOG.error(err)
-        asg.complete_lifecycle_action(
-            hook_name=hook_name,
-            result="ABANDON",
-            instance_id=instance_id,
-        )
+        with emf.phase("complete_lifecycle_action"):
+            asg.complete_lifecycle_action(
+                hook_name=hook_name,
+                result="ABANDON",
+                instance_id=instance_id,
+            )
         LOG.info(
             f"Lifecycle hook %s for %s is complete with ABANDON result.",
             hook_name,
             instance_id,
         )
+        return "ABANDON"
 
 
 def _handle_bootstrap_hook(
-    asg_instance: ASGInstance, hook_name: str, gha: GitHubActions, wait_timeout=900
-):
+    asg_instance: ASGInstance,
+    hook_name: str,
+    gha: github_client.GitHubClient,
+    wait_timeout=0,
+    runners=None,
+) -> str:
     instance_id = asg_instance.instance_id
-    asg = ASG(asg_name=asg_instance.asg_name, session=_session)
+    with emf.phase("asg_instance_lookup"):
+        asg = ASG(asg_name=asg_instance.asg_name, session=_session)
     label = f"instance_id:{instance_id}"
     LOG.info("Looking for runner with label %s.", label)
-    runner = gha.find_runner_by_label(label)
+    with emf.phase("runner_online_wait"):
+        runner = _wait_for_runner(gha, instance_id, wait_timeout, runners)
     if runner:
-        result = "CONTINUE"
+        LOG.info("Found runner %s in GitHub.", runner.name)
         try:
-            LOG.info("Found runner %s in GitHub.", runner.name)
-
-        finally:
-            asg.complete_lifecycle_action(
-                hook_name=hook_name, result=result, instance_id=instance_id
-            )
+            with emf.phase("complete_lifecycle_action"):
+                asg.complete_lifecycle_action(
+                    hook_name=hook_name, result="CONTINUE", instance_id=instance_id
+                )
+        except ClientError as err:
+            # While the Lambda waited for the runner,
+            # the instance completed the hook itself.
+            if err.response["Error"]["Code"] != "ValidationError":
+                raise
             LOG.info(
-                f"Lifecycle hook %s for %s is complete with result %s.",
-                hook_name,
-                instance_id,
-                result,
+                "Lifecycle hook %s for %s is already complete.", hook_name, instance_id
             )
+            return emf.RESULT_DEFERRED
+
+        LOG.info(
+            "Lifecycle hook %s for %s is complete with result CONTINUE.",
+            hook_name,
+            instance_id,
+        )
+        return "CONTINUE"
     else:
         LOG.warning(
             "Couldn't find a runner labeled %s. "
@@ -146,11 +325,144 @@ def _handle_bootstrap_hook(
             "Then, puppet will complete the bootstrap hook.",
             label,
         )
+        return emf.RESULT_DEFERRED
+
+
+def _wait_for_runner(
+    gha: github_client.GitHubClient, instance_id, wait_timeout, runners=None
+):
+    """
+    Look up the runner of an instance until it's online or ``wait_timeout``
+    seconds pass. GitHub is polled with exponential backoff, starting at
+    ``BOOTSTRAP_POLL_INITIAL_DELAY`` seconds. A poll is answered from the
+    runner index or snapshot if it was built since the previous poll, see
+    ``BOOTSTRAP_POLL_MIN_AGE``.
+
+    :return: The runner, online or not, or None if it isn't registered.
+    """
+    deadline = monotonic() + wait_timeout
+    delay = BOOTSTRAP_POLL_INITIAL_DELAY
+    max_age = runner_index.INDEX_TTL
+    while True:
+        runner = _find_runner(gha, instance_id, runners, max_age=max_age)
+        polled_at = monotonic()
+        if runner is not None and runner.status == "online":
+            return runner
+
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            return runner
+        LOG.info("Runner of %s isn't online yet, checking in %d s.", instance_id, delay)
+        sleep(min(delay, remaining))
+        delay = min(2 * delay, BOOTSTRAP_POLL_MAX_DELAY)
+        # The runner may have come online since the previous poll.
+        max_age = max(monotonic() - polled_at, BOOTSTRAP_POLL_MIN_AGE)
+
+
+def _find_runner(
+    gha: github_client.GitHubClient,
+    instance_id,
+    runners=None,
+    max_age=runner_index.INDEX_TTL,
+):
+    """
+    Find the runner of an instance in the batch's listing ``runners``,
+    or in the runner index if there is no listing.
+
+    :param max_age: See ``runner_index.find_runner()``.
+    """
+    if runners is not None:
+        return runners.get(instance_id)
+    with emf.phase("runner_lookup"):
+        return runner_index.find_runner(
+            gha, f"instance_id:{instance_id}", max_age=max_age
+        )
+
+
+def _get_registration_token(gha: github_client.GitHubClient) -> str:
+    """
+    Return a registration token shared by all launching instances.
+
+    The token comes from the warm Lambda cache or the pooled secret, see
+    ``REGISTRATION_TOKEN_POOL_SUFFIX``. Only if neither has a fresh one, see
+    ``REGISTRATION_TOKEN_MIN_LIFETIME``, a new token is minted and stored for
+    the next invocations. When many instances launch at once, one invocation
+    mints the token while the others wait up to ``REGISTRATION_TOKEN_LOCK_WAIT``
+    seconds for it, so the burst costs one GitHub call instead of one per instance.
+    """
+    global _registration_token, _registration_token_expires_at
+
+    if _registration_token is not None and _is_fresh(_registration_token_expires_at):
+        return _registration_token
+
+    for attempt in range(REGISTRATION_TOKEN_LOCK_WAIT + 1):
+        with emf.phase("registration_token"):
+            shared = _get_pooled_token()
+        if shared:
+            _registration_token = shared["token"]
+            _registration_token_expires_at = shared["expires_at"]
+            return _registration_token
+
+        if attempt == REGISTRATION_TOKEN_LOCK_WAIT or state_store.claim(
+            REGISTRATION_TOKEN_LOCK_KEY, REGISTRATION_TOKEN_LOCK_WAIT
+        ):
+            break
+        LOG.info("Another invocation is minting a registration token, waiting.")
+        sleep(1)
+
+    with emf.phase("github_registration_token"):
+        token, expires_at = gha.create_registration_token()
+    _registration_token = token
+    _registration_token_expires_at = expires_at
+    with emf.phase("registration_token"):
+        _pooled_token_secret().ensure_present(
+            value={"token": token, "expires_at": expires_at},
+            description="GitHub Actions runner registration token shared by instances",
+            update_if_exists=True,
+        )
+    return _registration_token
+
+
+def _pooled_token_secret() -> Secret:
+    return Secret(
+        environ["REGISTRATION_TOKEN_SECRET_PREFIX"] + REGISTRATION_TOKEN_POOL_SUFFIX,
+        session=_session,
+    )
+
+
+def _get_pooled_token():
+    """
+    :return: The pooled secret's ``token`` and ``expires_at`` (Unix time),
+        or None if there is no such secret or its token isn't fresh.
+    """
+    try:
+        shared = _pooled_token_secret().value
+    except IHSecretNotFound:
+        return None
+    if not isinstance(shared, dict) or not _is_fresh(shared.get("expires_at", 0)):
+        return None
+    return shared
+
+
+def _is_fresh(expires_at) -> bool:
+    """
+    Whether a token that expires at ``expires_at`` (Unix time)
+    lives long enough for a launching instance to register with it.
+    """
+    return expires_at - time() >= REGISTRATION_TOKEN_MIN_LIFETIME
+
+
+def _github_actions() -> github_client.GitHubClient:
+    with emf.phase("github_token"):
+        token = _get_github_token(environ["GITHUB_ORG_NAME"])
+    return github_client.github_actions(token, environ["GITHUB_ORG_NAME"])
 
 
 def _get_github_token(org):
     return (
         get_secret(_secretsmanager, environ["GITHUB_SECRET"])
         if environ["GITHUB_SECRET_TYPE"] == "token"
-        else get_tmp_token(int(environ["GH_APP_ID"]), environ["GITHUB_SECRET"], org)
+        else github_client.app_token(
+            environ["GH_APP_ID"], environ["GITHUB_SECRET"], org
+        )
     )
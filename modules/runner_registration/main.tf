@@ -80,6 +80,54 @@ data "aws_iam_policy_document" "runner_registration_permissions" {
       )
     ]
   }
+  # The registration token shared by the launching instances. Its name doesn't
+  # match the prefix-* secrets the instances can read and delete.
+  statement {
+    actions = [
+      "secretsmanager:CreateSecret",
+      "secretsmanager:DescribeSecret",
+      "secretsmanager:GetSecretValue",
+      "secretsmanager:PutSecretValue",
+    ]
+    resources = [
+      join(
+        ":",
+        [
+          "arn",
+          "aws",
+          "secretsmanager",
+          data.aws_region.current.name,
+          data.aws_caller_identity.current.account_id,
+          "secret",
+          # Secrets Manager adds a random suffix to the secret name in its ARN.
+          "${var.registration_token_secret_prefix}.pool-*"
+        ]
+      )
+    ]
+  }
+  dynamic "statement" {
+    for_each = var.sqs_buffer_enabled ? [1] : []
+    content {
+      actions = [
+        "sqs:ChangeMessageVisibility",
+        "sqs:DeleteMessage",
+        "sqs:GetQueueAttributes",
+        "sqs:ReceiveMessage",
+      ]
+      resources = [aws_sqs_queue.lifecycle[0].arn]
+    }
+  }
+  dynamic "statement" {
+    for_each = var.state_table_arn != null ? [1] : []
+    content {
+      actions = [
+        "dynamodb:DeleteItem",
+        "dynamodb:GetItem",
+        "dynamodb:PutItem",
+      ]
+      resources = [var.state_table_arn]
+    }
+  }
 }
 
 resource "aws_iam_policy" "runner_registration_permissions" {
@@ -117,12 +165,15 @@ module "lambda_monitored" {
   lambda_security_group_ids = var.security_group_ids
 
   environment_variables = {
+    ASG_NAME                         = var.asg_name
+    BOOTSTRAP_POLL_TIMEOUT           = var.bootstrap_poll_timeout
     GITHUB_ORG_NAME                  = var.github_org_name
     GITHUB_SECRET                    = var.github_credentials.secret
     GITHUB_SECRET_TYPE               = var.github_credentials.type
     GH_APP_ID                        = var.github_app_id
     REGISTRATION_TOKEN_SECRET_PREFIX = var.registration_token_secret_prefix
     LAMBDA_TIMEOUT                   = var.lambda_timeout
+    STATE_TABLE                      = var.state_table_name != null ? var.state_table_name : ""
   }
 
   tags = merge(
@@ -2,3 +2,8 @@ output "lambda_name" {
   description = "Lambda function name that (de)registers runners"
   value       = module.lambda_monitored.lambda_function_name
 }
+
+output "lifecycle_queue_arn" {
+  description = "ARN of the SQS queue that buffers the launch lifecycle events, or null without the buffer."
+  value       = var.sqs_buffer_enabled ? aws_sqs_queue.lifecycle[0].arn : null
+}
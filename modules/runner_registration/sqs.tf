@@ -0,0 +1,73 @@
+# Optional buffer between the lifecycle EventBridge rule and the Lambda.
+# The Lambda receives the launch events in batches and lists the GitHub runners
+# once per batch instead of once per instance.
+resource "aws_sqs_queue" "lifecycle" {
+  count = var.sqs_buffer_enabled ? 1 : 0
+  # Queue names are limited to 80 characters, and name_prefix adds 26.
+  name_prefix             = substr("${var.asg_name}-lifecycle-", 0, 54)
+  sqs_managed_sse_enabled = true
+  # AWS recommends six times the function timeout, so a batch isn't redelivered
+  # while the Lambda is still handling it, including throttled retries.
+  visibility_timeout_seconds = 6 * var.lambda_timeout
+  # A lifecycle action doesn't outlive the lifecycle hook global timeout of 48 hours.
+  message_retention_seconds = 2 * 24 * 3600
+  redrive_policy = jsonencode(
+    {
+      deadLetterTargetArn : aws_sqs_queue.lifecycle_dlq[0].arn
+      maxReceiveCount : 3
+    }
+  )
+  tags = merge(
+    var.tags,
+    {
+      "asg_name" : var.asg_name
+    }
+  )
+}
+
+resource "aws_sqs_queue" "lifecycle_dlq" {
+  count                     = var.sqs_buffer_enabled ? 1 : 0
+  name_prefix               = substr("${var.asg_name}-lifecycle-dlq-", 0, 54)
+  sqs_managed_sse_enabled   = true
+  message_retention_seconds = 14 * 24 * 3600
+  tags = merge(
+    var.tags,
+    {
+      "asg_name" : var.asg_name
+    }
+  )
+}
+
+data "aws_iam_policy_document" "lifecycle_queue" {
+  count = var.sqs_buffer_enabled ? 1 : 0
+  statement {
+    actions = [
+      "sqs:SendMessage",
+    ]
+    resources = [aws_sqs_queue.lifecycle[0].arn]
+    principals {
+      type        = "Service"
+      identifiers = ["events.amazonaws.com"]
+    }
+    condition {
+      test     = "ArnEquals"
+      variable = "aws:SourceArn"
+      values   = [aws_cloudwatch_event_rule.scale.arn]
+    }
+  }
+}
+
+resource "aws_sqs_queue_policy" "lifecycle" {
+  count     = var.sqs_buffer_enabled ? 1 : 0
+  queue_url = aws_sqs_queue.lifecycle[0].id
+  policy    = data.aws_iam_policy_document.lifecycle_queue[0].json
+}
+
+resource "aws_lambda_event_source_mapping" "lifecycle" {
+  count                              = var.sqs_buffer_enabled ? 1 : 0
+  event_source_arn                   = aws_sqs_queue.lifecycle[0].arn
+  function_name                      = module.lambda_monitored.lambda_function_arn
+  batch_size                         = var.sqs_batch_size
+  maximum_batching_window_in_seconds = var.sqs_batching_window
+  function_response_types            = ["ReportBatchItemFailures"]
+}
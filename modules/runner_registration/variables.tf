@@ -9,6 +9,20 @@ variable "asg_name" {
   type        = string
 }
 
+variable "bootstrap_poll_timeout" {
+  description = <<-EOT
+    How many seconds the Lambda waits for a launching instance's runner to come online in GitHub,
+    polling with exponential backoff, and then completes the bootstrap lifecycle hook itself.
+    0 checks once and otherwise leaves the hook to the instance. Capped at `lambda_timeout` minus 30 seconds.
+  EOT
+  type        = number
+  default     = 0
+  validation {
+    condition     = var.bootstrap_poll_timeout >= 0 && var.bootstrap_poll_timeout <= 900
+    error_message = "bootstrap_poll_timeout must be between 0 and 900"
+  }
+}
+
 variable "cloudwatch_log_group_retention" {
   description = "Number of days you want to retain log events in the log group."
   default     = 365
@@ -76,6 +90,53 @@ variable "security_group_ids" {
   type        = list(string)
 }
 
+variable "sqs_batch_size" {
+  description = <<-EOT
+    How many lifecycle events the Lambda receives at most in one batch from the SQS buffer.
+    More than 10 requires a non-zero `sqs_batching_window`.
+  EOT
+  type        = number
+  default     = 10
+  validation {
+    condition     = var.sqs_batch_size >= 1 && var.sqs_batch_size <= 100
+    error_message = "sqs_batch_size must be between 1 and 100"
+  }
+}
+
+variable "sqs_batching_window" {
+  description = <<-EOT
+    How many seconds the SQS buffer gathers lifecycle events before it invokes the Lambda
+    with a batch smaller than `sqs_batch_size`. Every launch waits up to this long.
+  EOT
+  type        = number
+  default     = 5
+  validation {
+    condition     = var.sqs_batching_window >= 0 && var.sqs_batching_window <= 300
+    error_message = "sqs_batching_window must be between 0 and 300"
+  }
+}
+
+variable "sqs_buffer_enabled" {
+  description = <<-EOT
+    Deliver the launch lifecycle events to the Lambda through an SQS queue, in batches.
+    The Lambda lists the GitHub runners once per batch instead of once per instance.
+  EOT
+  type        = bool
+  default     = false
+}
+
+variable "state_table_arn" {
+  description = "ARN of the module's DynamoDB state table. Duplicate lifecycle events are detected there, the lock for minting the shared registration token is held there, and the runner snapshot of `record_metric` is read there."
+  type        = string
+  default     = null
+}
+
+variable "state_table_name" {
+  description = "Name of the module's DynamoDB state table."
+  type        = string
+  default     = null
+}
+
 variable "subnet_ids" {
   description = "List of subnet ids where the actions runner instances will be created."
   type        = list(string)
@@ -0,0 +1,140 @@
+"""
+CloudWatch Embedded Metric Format (EMF) emitter.
+
+A metric written as an EMF log line is extracted by CloudWatch Logs
+asynchronously, so publishing it costs a ``print()`` instead of a
+``PutMetricData`` round trip.
+
+Every Lambda of the module is packaged from its own directory, so this file
+is copied verbatim into each of them. Edit all copies together;
+``tests/test_emf.py`` fails if they differ.
+"""
+
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from time import monotonic, time
+
+NAMESPACE = "GitHubRunners"
+
+# Result of a lifecycle hook that the Lambda leaves for the instance to complete.
+RESULT_DEFERRED = "DEFERRED"
+# Result of a duplicate delivery of a lifecycle event that the Lambda skipped.
+RESULT_DUPLICATE = "DUPLICATE"
+
+# Durations in milliseconds by phase name, collected by phase() until
+# emit_phases() publishes them.
+_phase_durations = defaultdict(list)
+
+
+def emit(metrics, dimensions, timestamp=None, storage_resolution=60, properties=None):
+    """
+    Write one EMF record to stdout.
+
+    :param metrics: Metric name to ``(value, unit)`` mapping. The value may be
+        a list of up to 100 values. All metrics share the same dimensions and timestamp.
+    :type metrics: dict
+    :param dimensions: Dimension name to value mapping.
+    :type dimensions: dict
+    :param timestamp: Time of the datapoints, a timezone-aware datetime.
+        Defaults to now.
+    :param storage_resolution: 60 for standard-resolution metrics,
+        1 for high-resolution ones.
+    :param properties: Extra fields to include in the log line. They are
+        searchable in CloudWatch Logs Insights but don't become metrics.
+    :type properties: dict
+    """
+    timestamp_ms = int((timestamp.timestamp() if timestamp else time()) * 1000)
+    record = {
+        "_aws": {
+            "Timestamp": timestamp_ms,
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [
+                        {
+                            "Name": name,
+                            "Unit": unit,
+                            "StorageResolution": storage_resolution,
+                        }
+                        for name, (_, unit) in metrics.items()
+                    ],
+                }
+            ],
+        },
+        **(properties or {}),
+        **dimensions,
+        **{name: value for name, (value, _) in metrics.items()},
+    }
+    print(json.dumps(record), flush=True)
+
+
+def emit_lifecycle_hook(event, hook_name, result):
+    """
+    Publish the outcome of a lifecycle hook and how long after the lifecycle
+    event its handling finished.
+
+    :param event: The EventBridge lifecycle action event.
+    :param hook_name: Lifecycle hook name.
+    :param result: ``CONTINUE`` or ``ABANDON`` if the Lambda completed the
+        lifecycle action, ``RESULT_DEFERRED`` if it left it to the instance,
+        ``RESULT_DUPLICATE`` if the event was already handled. The latency
+        isn't published for duplicates.
+    """
+    asg_name = event["detail"]["AutoScalingGroupName"]
+    emit(
+        {"LifecycleHookResults": (1, "Count")},
+        {"asg_name": asg_name, "hook": hook_name, "result": result},
+    )
+    if "time" in event and result != RESULT_DUPLICATE:
+        received_at = datetime.fromisoformat(event["time"].replace("Z", "+00:00"))
+        latency = datetime.now(tz=timezone.utc) - received_at
+        emit(
+            {"LifecycleHookLatency": (latency.total_seconds() * 1000, "Milliseconds")},
+            {"asg_name": asg_name, "hook": hook_name},
+        )
+
+
+@contextmanager
+def phase(name):
+    """
+    Time a phase of the handler, e.g. a GitHub or AWS API call.
+
+    A phase may run many times in one invocation; every run is recorded.
+    The durations are published by ``emit_phases()``.
+    """
+    started_at = monotonic()
+    try:
+        yield
+    finally:
+        _phase_durations[name].append((monotonic() - started_at) * 1000)
+
+
+def record_init(started_at):
+    """
+    Record how long the Lambda's main module took to load as the ``init`` phase.
+    The first invocation after a cold start publishes it with ``emit_phases()``.
+
+    :param started_at: ``monotonic()`` when the module started loading.
+    """
+    _phase_durations["init"].append((monotonic() - started_at) * 1000)
+
+
+def emit_phases(asg_name, function):
+    """
+    Publish the durations recorded by ``phase()`` as the ``PhaseDuration`` metric
+    with ``asg_name``, ``function``, and ``phase`` dimensions, and forget them.
+
+    :param asg_name: Value of the ``asg_name`` dimension.
+    :param function: Value of the ``function`` dimension, e.g. ``record_metric``.
+    """
+    for name, durations in _phase_durations.items():
+        # An EMF record holds up to 100 values of a metric.
+        for start in range(0, len(durations), 100):
+            emit(
+                {"PhaseDuration": (durations[start : start + 100], "Milliseconds")},
+                {"asg_name": asg_name, "function": function, "phase": name},
+            )
+    _phase_durations.clear()
@@ -0,0 +1,262 @@
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from os import environ
+from time import time
+from typing import Dict, Tuple
+
+import boto3
+
+import emf
+
+LOG = logging.getLogger()
+LOG.setLevel(level=logging.INFO)
+
+_autoscaling = boto3.client("autoscaling")
+_cloudwatch = boto3.client("cloudwatch")
+_ssm = boto3.client("ssm")
+
+# Launches and busy runners that arrive within a cold boot of each other
+# make one burst: the warm pool has to serve all of them.
+BURST_WINDOW = 15 * 60
+# The tuner sizes the pool for the next LOOKBACK seconds. It looks at the last
+# LOOKBACK seconds, and at the next LOOKBACK seconds of each of the previous
+# HISTORY_DAYS days, so the pool is ready before a daily burst.
+LOOKBACK = 3600
+HISTORY_DAYS = 7
+# Period of the datapoints the tuner reads, in seconds.
+PERIOD = 60
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def lambda_handler(event, context):
+    """
+    Size the ASG's warm pool for the scale-out demand of the next hour.
+
+    The demand is the most instances a burst scaled out, see ``_demand()``.
+    The pool grows to the demand at once, but shrinks by one instance per run,
+    within the ``MIN_SIZE`` and ``MAX_SIZE`` bounds, or the bounds of the
+    ``PROFILES`` entry in effect, see ``_bounds()``.
+
+    The tuner writes the new size to the ``SIZE_PARAMETER`` SSM parameter, which
+    Terraform reads the warm pool size from, then sets both ``MinSize`` and
+    ``MaxGroupPreparedCapacity`` of the warm pool to it. The warm pool keeps
+    ``MaxGroupPreparedCapacity`` minus the desired capacity instances, and at
+    least ``MinSize``, so it then keeps exactly that many hibernated instances,
+    however busy the group is.
+
+    It publishes the demand and the new size as the ``WarmPoolDemand`` and
+    ``WarmPoolTargetSize`` EMF metrics.
+
+    :param event: The EventBridge scheduled event.
+    :type event: dict
+    :param context: The context object providing runtime information about the Lambda function.
+    :type context: LambdaContext
+    :return: None
+    """
+    asg_name = environ["ASG_NAME"]
+    warm_pool = _autoscaling.describe_warm_pool(AutoScalingGroupName=asg_name).get(
+        "WarmPoolConfiguration"
+    )
+    if not warm_pool:
+        LOG.warning("%s has no warm pool, nothing to tune.", asg_name)
+        return
+
+    now = int(time()) // PERIOD * PERIOD
+    current = warm_pool["MinSize"]
+    demand = _demand(_get_series(asg_name, now), now, current)
+    min_size, max_size = _bounds(
+        datetime.fromtimestamp(now, tz=timezone.utc),
+        json.loads(environ.get("PROFILES", "[]")),
+        int(environ["MIN_SIZE"]),
+        int(environ["MAX_SIZE"]),
+    )
+    target = _target_size(current, demand, min_size, max_size)
+    LOG.info(
+        "Demand: %d, bounds: [%d, %d], warm pool size: %d -> %d.",
+        demand,
+        min_size,
+        max_size,
+        current,
+        target,
+    )
+    emf.emit(
+        {
+            "WarmPoolDemand": (demand, "Count"),
+            "WarmPoolTargetSize": (target, "Count"),
+        },
+        {"asg_name": asg_name},
+    )
+
+    if target == current and warm_pool.get("MaxGroupPreparedCapacity") == target:
+        return
+    # First, so a failed resize doesn't leave Terraform with a stale size.
+    _ssm.put_parameter(
+        Name=environ["SIZE_PARAMETER"], Value=str(target), Type="String", Overwrite=True
+    )
+    _autoscaling.put_warm_pool(
+        AutoScalingGroupName=asg_name,
+        MinSize=target,
+        MaxGroupPreparedCapacity=target,
+        PoolState=warm_pool["PoolState"],
+        InstanceReusePolicy=warm_pool.get("InstanceReusePolicy", {}),
+    )
+
+
+def _demand(series, now, current) -> int:
+    """
+    How many instances a burst of the next hour may scale out.
+
+    It's the biggest burst of the last hour and of the next hour on the previous
+    days, see ``_peak_burst()``. If the warm pool ran dry in the last hour
+    and instances booted cold, it was short of that many on top of its size.
+
+    :param series: The metrics ``_get_series()`` returned.
+    :param now: The current time, in seconds since the epoch.
+    :param current: The current warm pool size.
+    """
+    day = 24 * 3600
+    demand = max(
+        _peak_burst(series, start, start + LOOKBACK)
+        for start in [now - LOOKBACK]
+        + [now - days * day for days in range(1, HISTORY_DAYS + 1)]
+    )
+    recent = range(now - LOOKBACK, now, PERIOD)
+    cold = sum(series["cold"].get(minute, 0) for minute in recent)
+    warmed = [
+        series["warmed"][minute] for minute in recent if minute in series["warmed"]
+    ]
+    if cold and warmed and min(warmed) == 0:
+        demand = max(demand, current + int(cold))
+    return demand
+
+
+def _peak_burst(series, start, end) -> int:
+    """
+    The most instances launched, or the biggest rise of ``BusyRunners``,
+    within ``BURST_WINDOW`` seconds ending between ``start`` and ``end``.
+
+    Launches count what the ASG scaled out. The rise of busy runners also counts
+    jobs that arrived faster than the ASG scaled out.
+    """
+    peak = 0
+    for minute in range(start, end, PERIOD):
+        window = range(minute - BURST_WINDOW + PERIOD, minute + PERIOD, PERIOD)
+        launches = sum(
+            series["cold"].get(sample, 0) + series["resume"].get(sample, 0)
+            for sample in window
+        )
+        busy = [series["busy"][sample] for sample in window if sample in series["busy"]]
+        rise = busy[-1] - min(busy) if busy else 0
+        peak = max(peak, int(launches), int(rise))
+    return peak
+
+
+def _bounds(now, profiles, min_size, max_size) -> Tuple[int, int]:
+    """
+    The warm pool size bounds in effect at ``now``.
+
+    A profile applies on its ``days`` (every day if it has none), from
+    ``start_hour`` to ``end_hour`` UTC. A profile with ``start_hour`` after
+    ``end_hour`` runs over midnight. The first profile that applies wins.
+
+    :param now: A timezone-aware datetime.
+    :param profiles: List of dicts with ``days``, ``start_hour``, ``end_hour``,
+        ``min_size``, and ``max_size``.
+    :param min_size: Lower bound outside the profiles.
+    :param max_size: Upper bound outside the profiles.
+    """
+    now = now.astimezone(timezone.utc)
+    for profile in profiles:
+        if profile.get("days") and WEEKDAYS[now.weekday()] not in profile["days"]:
+            continue
+        start, end = profile["start_hour"], profile["end_hour"]
+        if start <= now.hour < end or start > end and not end <= now.hour < start:
+            return profile["min_size"], profile["max_size"]
+    return min_size, max_size
+
+
+def _target_size(current, demand, min_size, max_size) -> int:
+    """
+    The new warm pool size.
+
+    The pool grows to the demand at once: a burst doesn't wait for the next run.
+    It shrinks by one instance per run, so a quiet hour between two bursts
+    doesn't empty it.
+
+    :return: The size, clamped to ``[min_size, max_size]``.
+    """
+    target = demand if demand >= current else current - 1
+    return max(min_size, min(max_size, target))
+
+
+def _get_series(asg_name, now) -> Dict[str, Dict[int, float]]:
+    """
+    Read the metrics the tuner needs, per minute, for the last ``HISTORY_DAYS`` days.
+
+    :return: ``busy`` (maximum ``BusyRunners``), ``cold`` and ``resume`` (launches
+        by launch type, from ``LaunchLatency``), and ``warmed`` (minimum
+        ``WarmPoolWarmedCapacity``), each a dict of values by the minute's
+        start in seconds since the epoch.
+    """
+    launches = {
+        "Namespace": "GitHubRunners",
+        "MetricName": "LaunchLatency",
+        "Dimensions": [
+            {"Name": "asg_name", "Value": asg_name},
+            {"Name": "stage", "Value": "registration_hook"},
+        ],
+    }
+    queries = {
+        "busy": (
+            {
+                "Namespace": "GitHubRunners",
+                "MetricName": "BusyRunners",
+                "Dimensions": [{"Name": "asg_name", "Value": asg_name}],
+            },
+            "Maximum",
+        ),
+        "warmed": (
+            {
+                "Namespace": "AWS/AutoScaling",
+                "MetricName": "WarmPoolWarmedCapacity",
+                "Dimensions": [{"Name": "AutoScalingGroupName", "Value": asg_name}],
+            },
+            "Minimum",
+        ),
+        **{
+            launch_type: (
+                {
+                    **launches,
+                    "Dimensions": launches["Dimensions"]
+                    + [{"Name": "launch_type", "Value": launch_type}],
+                },
+                "SampleCount",
+            )
+            for launch_type in ("cold", "resume")
+        },
+    }
+    series = {name: {} for name in queries}
+    kwargs = {
+        "MetricDataQueries": [
+            {
+                "Id": name,
+                "MetricStat": {"Metric": metric, "Period": PERIOD, "Stat": stat},
+            }
+            for name, (metric, stat) in queries.items()
+        ],
+        "StartTime": datetime.fromtimestamp(now, tz=timezone.utc)
+        - timedelta(days=HISTORY_DAYS),
+        "EndTime": datetime.fromtimestamp(now, tz=timezone.utc),
+    }
+    while True:
+        response = _cloudwatch.get_metric_data(**kwargs)
+        for result in response["MetricDataResults"]:
+            series[result["Id"]].update(
+                (int(timestamp.timestamp()), value)
+                for timestamp, value in zip(result["Timestamps"], result["Values"])
+            )
+        if not response.get("NextToken"):
+            return series
+        kwargs["NextToken"] = response["NextToken"]
@@ -0,0 +1,75 @@
+# Custom IAM policy for warm_pool_tuner lambda
+data "aws_iam_policy_document" "warm_pool_tuner_permissions" {
+  statement {
+    actions = [
+      "autoscaling:DescribeWarmPool",
+      "cloudwatch:GetMetricData",
+    ]
+    resources = [
+      "*"
+    ]
+  }
+  statement {
+    actions = [
+      "autoscaling:PutWarmPool",
+    ]
+    resources = [
+      "arn:aws:autoscaling:*:*:autoScalingGroup:*:autoScalingGroupName/${var.asg_name}"
+    ]
+  }
+  statement {
+    actions = [
+      "ssm:PutParameter",
+    ]
+    resources = [
+      "arn:aws:ssm:*:*:parameter/${trimprefix(var.size_parameter_name, "/")}"
+    ]
+  }
+}
+
+resource "aws_iam_policy" "warm_pool_tuner_permissions" {
+  name_prefix = "${var.asg_name}-warm-pool-tuner-"
+  description = "IAM policy for warm_pool_tuner lambda permissions"
+  policy      = data.aws_iam_policy_document.warm_pool_tuner_permissions.json
+  tags = merge(
+    var.tags,
+    {
+      "asg_name" : var.asg_name
+    }
+  )
+}
+
+# Lambda function with monitoring using terraform-aws-lambda-monitored module
+module "lambda_monitored" {
+  source  = "registry.infrahouse.com/infrahouse/lambda-monitored/aws"
+  version = "1.1.1"
+
+  function_name                        = "${var.asg_name}_warm_pool_tuner"
+  lambda_source_dir                    = "${path.module}/lambda"
+  architecture                         = var.architecture
+  python_version                       = var.python_version
+  timeout                              = var.lambda_timeout
+  memory_size                          = 256
+  memory_utilization_threshold_percent = 80
+  cloudwatch_log_retention_days        = var.cloudwatch_log_group_retention
+  alarm_emails                         = var.alarm_emails
+  alert_strategy                       = "threshold"
+  error_rate_threshold                 = var.error_rate_threshold
+  additional_iam_policy_arns           = [aws_iam_policy.warm_pool_tuner_permissions.arn]
+
+  environment_variables = {
+    ASG_NAME = var.asg_name
+    MAX_SIZE = var.max_size
+    MIN_SIZE = var.min_size
+    PROFILES = jsonencode(var.profiles)
+    # Name of the SSM parameter that keeps the warm pool size for Terraform.
+    SIZE_PARAMETER = var.size_parameter_name
+  }
+
+  tags = merge(
+    var.tags,
+    {
+      "asg_name" : var.asg_name
+    }
+  )
+}
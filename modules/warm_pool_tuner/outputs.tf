@@ -0,0 +1,3 @@
+output "lambda_name" {
+  value = module.lambda_monitored.lambda_function_name
+}
@@ -0,0 +1,85 @@
+variable "architecture" {
+  description = "The CPU architecture for the Lambda function; valid values are `x86_64` or `arm64`."
+  type        = string
+  default     = "x86_64"
+}
+
+variable "asg_name" {
+  description = "Autoscaling group name"
+  type        = string
+}
+
+variable "cloudwatch_log_group_retention" {
+  description = "Number of days you want to retain log events in the log group."
+  default     = 365
+  type        = number
+}
+
+variable "lambda_timeout" {
+  description = "Time in seconds to let lambda run."
+  type        = number
+  default     = 60
+}
+
+variable "max_size" {
+  description = "Largest warm pool the tuner sets outside the profiles."
+  type        = number
+}
+
+variable "min_size" {
+  description = "Smallest warm pool the tuner sets outside the profiles."
+  type        = number
+  default     = 0
+}
+
+variable "profiles" {
+  description = "Warm pool size bounds by time of day (UTC) and weekday. The first profile that applies wins."
+  type = list(
+    object(
+      {
+        days       = optional(list(string), [])
+        start_hour = number
+        end_hour   = number
+        min_size   = number
+        max_size   = number
+      }
+    )
+  )
+  default = []
+}
+
+variable "size_parameter_name" {
+  description = "Name of the SSM parameter the tuner writes every warm pool size it sets to, so Terraform keeps that size."
+  type        = string
+}
+
+variable "python_version" {
+  description = "Python version to run lambda on. Must one of https://docs.aws.amazon.com/lambda/latest/dg/lambda-runtimes.html"
+  type        = string
+  default     = "python3.12"
+}
+
+variable "tags" {
+  description = "A map of tags to assign to resources."
+  type        = map(string)
+  default     = {}
+}
+
+variable "alarm_emails" {
+  description = "List of email addresses to receive alarm notifications for Lambda errors. At least one email is required for Lambda error monitoring."
+  type        = list(string)
+  validation {
+    condition     = length(var.alarm_emails) > 0
+    error_message = "At least one alarm email address must be provided for monitoring compliance"
+  }
+}
+
+variable "error_rate_threshold" {
+  description = "Error rate threshold percentage for threshold-based alerting."
+  type        = number
+  default     = 10.0
+  validation {
+    condition     = var.error_rate_threshold > 0 && var.error_rate_threshold <= 100
+    error_message = "error_rate_threshold must be between 0 and 100"
+  }
+}
@@ -0,0 +1,294 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+from datetime import datetime
+from os import environ
+from time import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+import emf
+import runner_snapshot
+
+LOG = logging.getLogger()
+LOG.setLevel(level=logging.INFO)
+
+_secretsmanager = boto3.client("secretsmanager")
+_dynamodb = boto3.client("dynamodb")
+_lambda = boto3.client("lambda")
+
+# workflow_job actions in the order a job goes through them. "waiting" (for an
+# environment approval) is skipped: a waiting job can't be picked up by a runner.
+JOB_STATUSES = ("queued", "in_progress", "completed")
+
+# Counter attributes on the COUNTERS_KEY item, by job status.
+# Completed jobs aren't counted.
+COUNTERS_KEY = "webhook#counters"
+COUNTED_STATUSES = ("queued", "in_progress")
+
+# A job item only has to outlive the job itself. Self-hosted runner jobs
+# can run for five days at most.
+JOB_ITEM_TTL = 7 * 24 * 3600
+
+TRIGGER_KEY = "webhook#trigger"
+
+INSTALLATION_LABEL_PREFIX = "installation_id:"
+
+# Module-scope cache of the webhook secret: it only changes when the
+# operator rotates it, and a cold start picks up the new value.
+_webhook_secret = None
+
+
+def lambda_handler(event, context):
+    """
+    Receive GitHub ``workflow_job`` webhooks on a Lambda function URL.
+
+    The function checks the ``X-Hub-Signature-256`` HMAC signature, tracks every job
+    that targets this installation's runner labels in the state table, and keeps
+    counters of queued and in-progress jobs there. When a job is queued, it invokes
+    the ``record_metric`` Lambda right away (at most once per ``TRIGGER_DEBOUNCE``
+    seconds), so the scaling signal doesn't wait for the next scheduled run.
+
+    When a job run by one of the installation's runners completes, the function
+    publishes how long it waited for a runner and how long it ran, see
+    ``_publish_job_timing()``.
+
+    :param event: Lambda function URL request (payload format 2.0).
+    :type event: dict
+    :param context: The context object providing runtime information about the Lambda function.
+    :type context: LambdaContext
+    :return: Function URL response.
+    :rtype: dict
+    """
+    headers = {
+        key.lower(): value for key, value in (event.get("headers") or {}).items()
+    }
+    body = event.get("body") or ""
+    body = base64.b64decode(body) if event.get("isBase64Encoded") else body.encode()
+    delivery = headers.get("x-github-delivery")
+
+    if not _signature_is_valid(body, headers.get("x-hub-signature-256", "")):
+        LOG.warning("Rejecting delivery %s: invalid signature.", delivery)
+        return _response(401, "Invalid signature")
+
+    github_event = headers.get("x-github-event")
+    if github_event == "ping":
+        return _response(200, "pong")
+    if github_event != "workflow_job":
+        return _response(202, f"Ignoring {github_event} event")
+
+    payload = json.loads(body)
+    action = payload["action"]
+    job = payload["workflow_job"]
+    LOG.info("Delivery %s: job %s is %s.", delivery, job["id"], action)
+    if action not in JOB_STATUSES:
+        return _response(202, f"Ignoring {action} action")
+
+    pool_labels = {label.lower() for label in json.loads(environ["RUNNER_LABELS"])}
+    if not _job_targets_pool(job, pool_labels):
+        return _response(202, "Job doesn't target this runner pool")
+
+    if _record_job_status(job["id"], action):
+        if action == "queued":
+            _trigger_record_metric()
+        elif action == "completed":
+            _publish_job_timing(job, pool_labels)
+
+    return _response(200, "OK")
+
+
+def _signature_is_valid(body, signature) -> bool:
+    """
+    Check the ``sha256=<hexdigest>`` signature GitHub computes over the request body.
+    """
+    expected = (
+        "sha256="
+        + hmac.new(_get_webhook_secret().encode(), body, hashlib.sha256).hexdigest()
+    )
+    return hmac.compare_digest(expected, signature)
+
+
+def _get_webhook_secret():
+    global _webhook_secret
+
+    if _webhook_secret is None:
+        _webhook_secret = _secretsmanager.get_secret_value(
+            SecretId=environ["WEBHOOK_SECRET"]
+        )["SecretString"]
+    return _webhook_secret
+
+
+def _job_targets_pool(job, pool_labels) -> bool:
+    """
+    A job can run on this installation's runners if every label
+    in its ``runs-on`` is one of the runner labels. GitHub matches
+    labels case-insensitively; ``pool_labels`` must be lowercase.
+    """
+    job_labels = {label.lower() for label in job["labels"]}
+    return bool(job_labels) and job_labels <= pool_labels
+
+
+def _record_job_status(job_id, status) -> bool:
+    """
+    Move a job to ``status`` and update the counters in one transaction.
+
+    GitHub may deliver a webhook more than once and doesn't guarantee the order
+    of deliveries. A job therefore only moves forward through ``JOB_STATUSES``:
+    a duplicate or late delivery is ignored, and if the ``queued`` delivery
+    is lost, ``in_progress`` still counts the job.
+
+    :return: True if the job status changed.
+    """
+    table = environ["STATE_TABLE"]
+    key = {"pk": {"S": f"job#{job_id}"}}
+    item = _dynamodb.get_item(TableName=table, Key=key, ConsistentRead=True).get("Item")
+    previous = item["status"]["S"] if item else None
+    if previous and JOB_STATUSES.index(status) <= JOB_STATUSES.index(previous):
+        LOG.info("Job %s is already %s, ignoring %s.", job_id, previous, status)
+        return False
+
+    deltas = {name: 0 for name in COUNTED_STATUSES}
+    if previous in deltas:
+        deltas[previous] -= 1
+    if status in deltas:
+        deltas[status] += 1
+
+    put_job = {
+        "TableName": table,
+        "Item": {
+            **key,
+            "status": {"S": status},
+            "expires_at": {"N": str(int(time()) + JOB_ITEM_TTL)},
+        },
+    }
+    if previous:
+        put_job["ConditionExpression"] = "#status = :previous"
+        put_job["ExpressionAttributeNames"] = {"#status": "status"}
+        put_job["ExpressionAttributeValues"] = {":previous": {"S": previous}}
+    else:
+        put_job["ConditionExpression"] = "attribute_not_exists(pk)"
+
+    try:
+        _dynamodb.transact_write_items(
+            TransactItems=[
+                {"Put": put_job},
+                {
+                    "Update": {
+                        "TableName": table,
+                        "Key": {"pk": {"S": COUNTERS_KEY}},
+                        "UpdateExpression": "ADD queued :queued, in_progress :in_progress",
+                        "ExpressionAttributeValues": {
+                            f":{name}": {"N": str(delta)}
+                            for name, delta in deltas.items()
+                        },
+                    }
+                },
+            ]
+        )
+    except ClientError as err:
+        if err.response["Error"]["Code"] != "TransactionCanceledException":
+            raise
+        # Another delivery for the same job won the race.
+        LOG.info("Job %s changed concurrently, ignoring %s.", job_id, status)
+        return False
+
+    return True
+
+
+def _publish_job_timing(job, pool_labels):
+    """
+    Publish the ``JobWaitTime`` (created to started) and ``JobDuration``
+    (started to completed) EMF metrics of a completed job, one value per job,
+    so CloudWatch can compute their percentiles.
+
+    The job only counts if it ran on one of the installation's runners: it either
+    requested the ``installation_id`` label, or its runner is in the latest
+    runner snapshot. A job that never got a runner, e.g. one cancelled while
+    queued, isn't published.
+
+    :param job: ``workflow_job`` of a ``completed`` delivery.
+    :param pool_labels: Lowercase runner labels of this installation.
+    """
+    if not job.get("runner_id") or not job.get("started_at"):
+        return
+    requested = {label.lower() for label in job["labels"]}
+    installation_labels = {
+        label for label in pool_labels if label.startswith(INSTALLATION_LABEL_PREFIX)
+    }
+    if not requested & installation_labels and (
+        job["runner_id"] not in _installation_runner_ids()
+    ):
+        LOG.info("Job %s ran on another installation's runner.", job["id"])
+        return
+
+    created_at = _parse_github_time(job["created_at"])
+    started_at = _parse_github_time(job["started_at"])
+    completed_at = _parse_github_time(job["completed_at"])
+    emf.emit(
+        {
+            # GitHub's clock may put started_at a little before created_at.
+            "JobWaitTime": (max(started_at - created_at, 0.0), "Seconds"),
+            "JobDuration": (max(completed_at - started_at, 0.0), "Seconds"),
+        },
+        {"asg_name": environ["ASG_NAME"]},
+    )
+
+
+def _installation_runner_ids() -> set:
+    """
+    IDs of the runners in the snapshot ``record_metric`` saves every sample,
+    or an empty set if there is no snapshot.
+    """
+    snapshot = runner_snapshot.load(runner_snapshot.SNAPSHOT_TTL)
+    if snapshot is None:
+        return set()
+    runners, _ = snapshot
+    return {runner.runner_id for runner in runners}
+
+
+def _parse_github_time(value) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _trigger_record_metric():
+    """
+    Invoke the ``record_metric`` Lambda asynchronously, unless it was
+    triggered less than ``TRIGGER_DEBOUNCE`` seconds ago.
+
+    A burst of queued jobs thus results in one invocation that sees all of them
+    rather than one invocation per job.
+    """
+    now = int(time())
+    try:
+        _dynamodb.update_item(
+            TableName=environ["STATE_TABLE"],
+            Key={"pk": {"S": TRIGGER_KEY}},
+            UpdateExpression="SET triggered_at = :now",
+            ConditionExpression="attribute_not_exists(triggered_at) OR triggered_at <= :since",
+            ExpressionAttributeValues={
+                ":now": {"N": str(now)},
+                ":since": {"N": str(now - int(environ["TRIGGER_DEBOUNCE"]))},
+            },
+        )
+    except ClientError as err:
+        if err.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        LOG.info("record_metric was triggered recently, skipping.")
+        return
+
+    _lambda.invoke(
+        FunctionName=environ["RECORD_METRIC_FUNCTION"],
+        InvocationType="Event",
+        Payload=json.dumps({"source": "webhook_receiver"}),
+    )
+
+
+def _response(status_code, message):
+    return {
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps({"message": message}),
+    }
@@ -0,0 +1,100 @@
+# Custom IAM policy for webhook_receiver lambda
+data "aws_iam_policy_document" "webhook_receiver_permissions" {
+  statement {
+    actions = [
+      "secretsmanager:GetSecretValue"
+    ]
+    resources = [var.webhook_secret_arn]
+  }
+  statement {
+    actions = [
+      "dynamodb:ConditionCheckItem",
+      "dynamodb:GetItem",
+      "dynamodb:PutItem",
+      "dynamodb:UpdateItem",
+    ]
+    resources = [var.state_table_arn]
+  }
+  statement {
+    actions = [
+      "lambda:InvokeFunction"
+    ]
+    resources = [var.record_metric_function_arn]
+  }
+}
+
+resource "aws_iam_policy" "webhook_receiver_permissions" {
+  name_prefix = "${var.asg_name}-webhook-receiver-"
+  description = "IAM policy for webhook_receiver lambda permissions"
+  policy      = data.aws_iam_policy_document.webhook_receiver_permissions.json
+  tags = merge(
+    var.tags,
+    {
+      "asg_name" : var.asg_name
+    }
+  )
+}
+
+# Lambda function with monitoring using terraform-aws-lambda-monitored module
+module "lambda_monitored" {
+  source  = "registry.infrahouse.com/infrahouse/lambda-monitored/aws"
+  version = "1.1.1"
+
+  # Lambda function names are at most 64 characters. The _webhook suffix
+  # is kept, so the name doesn't clash with the other Lambdas of the ASG.
+  function_name                        = "${substr(var.asg_name, 0, 56)}_webhook"
+  lambda_source_dir                    = "${path.module}/lambda"
+  architecture                         = var.architecture
+  python_version                       = var.python_version
+  timeout                              = var.lambda_timeout
+  memory_size                          = 256
+  memory_utilization_threshold_percent = 80
+  cloudwatch_log_retention_days        = var.cloudwatch_log_group_retention
+  alarm_emails                         = var.alarm_emails
+  alert_strategy                       = "threshold"
+  error_rate_threshold                 = var.error_rate_threshold
+  additional_iam_policy_arns           = [aws_iam_policy.webhook_receiver_permissions.arn]
+
+  environment_variables = {
+    ASG_NAME               = var.asg_name
+    RECORD_METRIC_FUNCTION = var.record_metric_function_arn
+    RUNNER_LABELS          = jsonencode(var.runner_labels)
+    STATE_TABLE            = var.state_table_name
+    TRIGGER_DEBOUNCE       = var.trigger_debounce
+    WEBHOOK_SECRET         = var.webhook_secret_arn
+  }
+
+  tags = merge(
+    var.tags,
+    {
+      "asg_name" : var.asg_name
+    }
+  )
+}
+
+# GitHub can't sign AWS requests, so the URL is public. Every request
+# is authenticated by its X-Hub-Signature-256 HMAC signature instead.
+resource "aws_lambda_function_url" "webhook" {
+  #checkov:skip=CKV_AWS_258:GitHub webhooks are authenticated with an HMAC signature, not IAM
+  function_name      = module.lambda_monitored.lambda_function_name
+  authorization_type = "NONE"
+}
+
+# A function URL doesn't grant anyone access by itself. Since October 2025,
+# a public URL needs both statements. The second one only allows invocations
+# through the URL, not direct Invoke calls.
+resource "aws_lambda_permission" "allow_function_url" {
+  statement_id           = "AllowPublicFunctionUrl"
+  action                 = "lambda:InvokeFunctionUrl"
+  function_name          = module.lambda_monitored.lambda_function_name
+  principal              = "*"
+  function_url_auth_type = "NONE"
+}
+
+resource "aws_lambda_permission" "allow_function_url_invoke" {
+  statement_id             = "AllowPublicFunctionUrlInvoke"
+  action                   = "lambda:InvokeFunction"
+  function_name            = module.lambda_monitored.lambda_function_name
+  principal                = "*"
+  invoked_via_function_url = true
+}
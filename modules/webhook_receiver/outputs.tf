@@ -0,0 +1,7 @@
+output "lambda_name" {
+  value = module.lambda_monitored.lambda_function_name
+}
+
+output "function_url" {
+  value = aws_lambda_function_url.webhook.function_url
+}
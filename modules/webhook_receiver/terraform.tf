@@ -0,0 +1,11 @@
+terraform {
+  required_version = "~> 1.5"
+
+  //noinspection HILUnresolvedReference
+  required_providers {
+    aws = {
+      source  = "hashicorp/aws"
+      version = ">= 6.19, < 7.0"
+    }
+  }
+}
@@ -0,0 +1,84 @@
+variable "architecture" {
+  description = "The CPU architecture for the Lambda function; valid values are `x86_64` or `arm64`."
+  type        = string
+  default     = "x86_64"
+}
+
+variable "asg_name" {
+  description = "Autoscaling group name"
+  type        = string
+}
+
+variable "cloudwatch_log_group_retention" {
+  description = "Number of days you want to retain log events in the log group."
+  default     = 365
+  type        = number
+}
+
+variable "lambda_timeout" {
+  description = "Time in seconds to let lambda run."
+  type        = number
+  default     = 10
+}
+
+variable "python_version" {
+  description = "Python version to run lambda on. Must one of https://docs.aws.amazon.com/lambda/latest/dg/lambda-runtimes.html"
+  type        = string
+  default     = "python3.12"
+}
+
+variable "record_metric_function_arn" {
+  description = "ARN of the record_metric Lambda to invoke when a job is queued."
+  type        = string
+}
+
+variable "runner_labels" {
+  description = "All labels of the runners in this installation. Jobs with other labels are ignored."
+  type        = list(string)
+}
+
+variable "state_table_arn" {
+  description = "ARN of the DynamoDB table where the Lambda keeps job states and counters."
+  type        = string
+}
+
+variable "state_table_name" {
+  description = "Name of the DynamoDB table where the Lambda keeps job states and counters."
+  type        = string
+}
+
+variable "tags" {
+  description = "A map of tags to assign to resources."
+  type        = map(string)
+  default     = {}
+}
+
+variable "trigger_debounce" {
+  description = "Invoke record_metric at most once in this many seconds, however many jobs are queued."
+  type        = number
+  default     = 10
+}
+
+variable "webhook_secret_arn" {
+  description = "ARN of the Secrets Manager secret with the webhook secret configured in GitHub."
+  type        = string
+}
+
+variable "alarm_emails" {
+  description = "List of email addresses to receive alarm notifications for Lambda errors. At least one email is required for Lambda error monitoring."
+  type        = list(string)
+  validation {
+    condition     = length(var.alarm_emails) > 0
+    error_message = "At least one alarm email address must be provided for monitoring compliance"
+  }
+}
+
+variable "error_rate_threshold" {
+  description = "Error rate threshold percentage for threshold-based alerting."
+  type        = number
+  default     = 10.0
+  validation {
+    condition     = var.error_rate_threshold > 0 && var.error_rate_threshold <= 100
+    error_message = "error_rate_threshold must be between 0 and 100"
+  }
+}
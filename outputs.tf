@@ -47,3 +47,18 @@ output "dashboard_url" {
   description = "URL of the CloudWatch dashboard the module creates for this runner pool."
   value       = "https://${data.aws_region.current.name}.console.aws.amazon.com/cloudwatch/home?region=${data.aws_region.current.name}#dashboards:name=${aws_cloudwatch_dashboard.actions_runner.dashboard_name}"
 }
+
+output "state_table_name" {
+  description = "Name of the DynamoDB table where the module's Lambdas keep shared state."
+  value       = aws_dynamodb_table.state.name
+}
+
+output "webhook_url" {
+  description = "URL for the GitHub workflow_job webhook. Null unless webhook_secret_arn is set."
+  value       = local.webhook_enabled ? module.webhook_receiver[0].function_url : null
+}
+
+output "warm_pool_tuner_lambda_name" {
+  description = "Name of the warm pool tuner Lambda function. Null unless warm_pool_tuner_enabled is set and the ASG has a warm pool."
+  value       = length(module.warm_pool_tuner) > 0 ? module.warm_pool_tuner[0].lambda_name : null
+}
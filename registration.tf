@@ -1,6 +1,7 @@
 module "registration" {
   source                         = "./modules/runner_registration"
   asg_name                       = local.asg_name
+  bootstrap_poll_timeout         = var.runner_bootstrap_poll_timeout
   cloudwatch_log_group_retention = var.cloudwatch_log_group_retention
   github_org_name                = var.github_org_name
   github_credentials = {
@@ -18,13 +19,17 @@ module "registration" {
   security_group_ids = [
     aws_security_group.actions-runner.id
   ]
-  subnet_ids = var.lambda_subnet_ids != null ? var.lambda_subnet_ids : var.subnet_ids
+  subnet_ids         = var.lambda_subnet_ids != null ? var.lambda_subnet_ids : var.subnet_ids
+  state_table_name   = aws_dynamodb_table.state.name
+  state_table_arn    = aws_dynamodb_table.state.arn
+  sqs_buffer_enabled = var.runner_registration_sqs_buffer
 }
 
 module "deregistration" {
   source                         = "./modules/runner_deregistration"
   asg_name                       = local.asg_name
   cloudwatch_log_group_retention = var.cloudwatch_log_group_retention
+  deregistration_concurrency     = var.runner_deregistration_concurrency
   github_org_name                = var.github_org_name
   github_credentials = {
     type : var.github_token_secret_arn != null ? "token" : "pem"
@@ -43,4 +48,6 @@ module "deregistration" {
   installation_id      = random_uuid.installation-id.result
   alarm_emails         = var.alarm_emails
   error_rate_threshold = var.error_rate_threshold
+  state_table_name     = aws_dynamodb_table.state.name
+  state_table_arn      = aws_dynamodb_table.state.arn
 }
@@ -0,0 +1,7 @@
+"""
+Offline simulators of the module's Lambdas and autoscaling.
+
+Run ``python -m simulator --help`` for the available simulations.
+They need the development requirements (moto, responses) but no AWS
+account or GitHub organization.
+"""
@@ -0,0 +1,131 @@
+"""
+Command line of the simulators. Every ``Scenario`` and ``PoolSettings`` field is an option.
+"""
+
+import json
+import logging
+from argparse import ArgumentParser, ArgumentTypeError
+from dataclasses import fields
+
+from simulator import autoscaling, lifecycle
+from simulator.stats import PERCENTILES
+
+
+def _parse_bool(value):
+    if value.lower() in ("true", "yes", "1"):
+        return True
+    if value.lower() in ("false", "no", "0"):
+        return False
+    raise ArgumentTypeError(f"{value!r} isn't a boolean")
+
+
+def _option_type(default):
+    return _parse_bool if isinstance(default, bool) else type(default)
+
+
+def _add_scenario_options(parser, scenario_class):
+    group = parser.add_argument_group(scenario_class.__name__)
+    for field in fields(scenario_class):
+        group.add_argument(
+            f"--{field.name.replace('_', '-')}",
+            type=_option_type(field.default),
+            default=field.default,
+            help=f"Default: {field.default}.",
+        )
+
+
+def _sweep_option(value):
+    """
+    Parse ``NAME=VALUE,VALUE...`` into the ``PoolSettings`` field name and its values.
+    """
+    name, _, values = value.partition("=")
+    name = name.replace("-", "_")
+    defaults = {field.name: field.default for field in fields(autoscaling.PoolSettings)}
+    if name not in defaults or not values:
+        raise ArgumentTypeError(
+            f"{value!r} isn't NAME=VALUE,VALUE... of a pool setting"
+        )
+    return name, [_option_type(defaults[name])(item) for item in values.split(",")]
+
+
+def _dataclass_from_args(dataclass, args):
+    return dataclass(**{field.name: args[field.name] for field in fields(dataclass)})
+
+
+def main():
+    parser = ArgumentParser(prog="python -m simulator", description=__doc__)
+    subparsers = parser.add_subparsers(dest="simulation", required=True)
+    _add_scenario_options(
+        subparsers.add_parser(
+            "lifecycle",
+            help="Replay instance lifecycles through the Lambdas.",
+            description=lifecycle.__doc__,
+        ),
+        lifecycle.Scenario,
+    )
+    autoscaling_parser = subparsers.add_parser(
+        "autoscaling",
+        help="Replay a job trace against the pool's autoscaling.",
+        description=autoscaling.__doc__,
+    )
+    _add_scenario_options(autoscaling_parser, autoscaling.Scenario)
+    _add_scenario_options(autoscaling_parser, autoscaling.PoolSettings)
+    autoscaling_parser.add_argument(
+        "--sweep",
+        type=_sweep_option,
+        action="append",
+        default=[],
+        metavar="NAME=VALUE,VALUE...",
+        help="Replay every combination of these pool settings and recommend one.",
+    )
+    autoscaling_parser.add_argument(
+        "--max-wait",
+        type=float,
+        default=60.0,
+        help="Longest job wait the recommended settings may have, in seconds. Default: 60.",
+    )
+    autoscaling_parser.add_argument(
+        "--wait-percentile",
+        type=int,
+        choices=PERCENTILES,
+        default=95,
+        help="Percentile of the job waits --max-wait applies to. Default: 95.",
+    )
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=logging.WARNING)
+
+    simulation = args.pop("simulation")
+    if simulation == "lifecycle":
+        with lifecycle.LifecycleSimulator(
+            _dataclass_from_args(lifecycle.Scenario, args)
+        ) as simulator:
+            report = simulator.run()
+    elif simulation == "autoscaling":
+        scenario = _dataclass_from_args(autoscaling.Scenario, args)
+        settings = _dataclass_from_args(autoscaling.PoolSettings, args)
+        if scenario.trace:
+            trace = autoscaling.load_trace(scenario.trace)
+        else:
+            trace = autoscaling.synthetic_trace(scenario)
+        if args["sweep"]:
+            grid = dict(args["sweep"])
+            reports = autoscaling.sweep(scenario, settings, grid, trace)
+            recommended = dict(
+                autoscaling.recommend(
+                    reports, args["max_wait"], args["wait_percentile"]
+                )
+            )
+            # The results only show the settings that vary.
+            for result in reports:
+                result["settings"] = {name: result["settings"][name] for name in grid}
+            report = {
+                "recommended": recommended,
+                "results": sorted(reports, key=lambda result: result["instance_hours"]),
+            }
+        else:
+            report = autoscaling.simulate(scenario, settings, trace)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
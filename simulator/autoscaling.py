@@ -0,0 +1,671 @@
+"""
+Discrete-event simulation of the pool's autoscaling, for tuning its variables.
+
+A trace of jobs is replayed against a model of the ASG and of what scales it:
+
+- ``record_metric`` samples the idle and busy runners every
+  ``runner_metrics_period`` seconds. With ``queued_jobs_source = "polling"``,
+  it counts the queued jobs on the first sample of every minute. With
+  ``"webhook"``, it counts them on every sample and also runs when a job is
+  queued, at most every 10 seconds.
+- In the ``alarms`` mode, the ``IdleRunnersTooLow``, ``IdleRunnersTooHigh``,
+  and ``QueuedJobsTooHigh`` alarms of ``autoscaling.tf`` evaluate their
+  periods ``alarm_delay`` seconds after the periods end. They invoke the
+  simple scaling policies at every evaluation in ALARM. A policy does nothing
+  until the last scaling activity has completed and its cooldown has passed.
+  An activity completes when its instances are in service or terminated.
+- In the ``controller`` mode, every sample sets the desired capacity the way
+  ``record_metric`` does.
+- Scale-out resumes hibernated warm-pool instances first, which takes
+  ``resume_time`` seconds. It boots the other instances, which takes
+  ``boot_time`` seconds. New instances that boot and then hibernate refill
+  the warm pool.
+- Scale-in terminates unprotected in-service instances at random. A busy
+  instance drains its job for up to ``allowed_drain_time`` seconds. A job
+  still running after that is interrupted.
+- A job starts on an idle runner as soon as there is one.
+
+The report gives how long the jobs waited for a runner and the
+instance-hours of running instances. An instance is running while it boots,
+serves, drains, or prepares for the warm pool. Hibernated instances are
+reported separately, because they only pay for their volumes.
+"""
+
+import csv
+import heapq
+import json
+import random
+from collections import deque
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime
+from itertools import count, product
+from math import ceil
+
+from simulator.stats import summary
+
+# How often the webhook receiver may invoke record_metric.
+WEBHOOK_RUN_INTERVAL = 10
+
+WARMING = "warming"
+HIBERNATED = "hibernated"
+PENDING = "pending"
+IDLE = "idle"
+BUSY = "busy"
+DRAINING = "draining"
+TERMINATED = "terminated"
+
+IN_SERVICE_STATES = (PENDING, IDLE, BUSY)
+RUNNING_STATES = (WARMING, PENDING, IDLE, BUSY, DRAINING)
+WARM_POOL_STATES = (WARMING, HIBERNATED)
+
+
+@dataclass
+class Scenario:
+    """
+    The job trace of a replay and the latencies of AWS. Durations are seconds.
+    """
+
+    # Trace file to replay, see load_trace(). Without one, a synthetic
+    # trace is generated from the parameters below.
+    trace: str = ""
+    hours: float = 8.0
+    # Jobs queued per minute, at random.
+    job_rate: float = 1.0
+    # Mean run time of a job.
+    job_time: float = 300.0
+    # Every burst_interval seconds, burst_size more jobs are queued
+    # at once, like a push that fans out to a matrix of jobs.
+    burst_interval: float = 3600.0
+    burst_size: int = 20
+    boot_time: float = 240.0
+    resume_time: float = 20.0
+    # From the end of a metric period to the alarms acting on it.
+    alarm_delay: float = 30.0
+    seed: int = 0
+
+
+@dataclass
+class PoolSettings:
+    """
+    Module variables of a replay, by their names in ``variables.tf``.
+    """
+
+    autoscaling_mode: str = "alarms"
+    asg_min_size: int = 1
+    asg_max_size: int = 10
+    idle_runners_target_count: int = 1
+    autoscaling_step: int = 1
+    autoscaling_scaleout_evaluation_period: int = 60
+    # Not a variable: the scale-in policy's cooldown in autoscaling.tf.
+    scalein_cooldown: int = 180
+    autoscaling_scalein_damping: float = 0.5
+    autoscaling_protect_busy_runners: bool = False
+    runner_metrics_period: int = 60
+    # "none", "polling" (queued_jobs_repositories),
+    # or "webhook" (webhook_secret_arn).
+    queued_jobs_source: str = "none"
+    # 0 stands for null: queued jobs don't trigger scale-out alarms.
+    queued_jobs_scaleout_threshold: int = 0
+    # False stands for spot instances, which have no warm pool.
+    warm_pool: bool = True
+    warm_pool_min_size: int = 2
+    warm_pool_max_size: int = 10
+    allowed_drain_time: int = 900
+
+
+def load_trace(path) -> list:
+    """
+    Jobs of a trace file as ``(arrival, duration)`` tuples, sorted by arrival.
+
+    Arrivals are seconds since the first job was queued.
+
+    A ``.csv`` file has a header row and a ``created_at`` or ``queued_at``
+    column. It also has either a ``duration`` column or ``started_at`` and
+    ``completed_at`` columns. Times are ISO 8601 timestamps or seconds.
+
+    Any other file is a GitHub export of workflow jobs. It can be a JSON list
+    of jobs, or a ``{"jobs": [...]}`` response of the workflow jobs API. It can
+    also be a list of those responses, as ``gh api --paginate --slurp`` saves
+    them. Jobs that never ran are skipped.
+    """
+    with open(path) as trace_file:
+        if path.endswith(".csv"):
+            jobs = [
+                (
+                    _parse_time(row.get("created_at") or row["queued_at"]),
+                    (
+                        float(row["duration"])
+                        if row.get("duration")
+                        else _parse_time(row["completed_at"])
+                        - _parse_time(row["started_at"])
+                    ),
+                )
+                for row in csv.DictReader(trace_file)
+            ]
+        else:
+            jobs = [
+                (
+                    _parse_time(job["created_at"]),
+                    _parse_time(job["completed_at"]) - _parse_time(job["started_at"]),
+                )
+                for job in _github_jobs(json.load(trace_file))
+                if job.get("started_at") and job.get("completed_at")
+            ]
+    if not jobs:
+        return []
+    first = min(arrival for arrival, _ in jobs)
+    return sorted((arrival - first, max(duration, 0.0)) for arrival, duration in jobs)
+
+
+def synthetic_trace(scenario: Scenario) -> list:
+    """
+    Jobs queued at ``job_rate`` per minute at random plus regular bursts,
+    as ``(arrival, duration)`` tuples sorted by arrival.
+    """
+    rng = random.Random(scenario.seed)
+    length = scenario.hours * 3600
+    arrivals = []
+    if scenario.job_rate > 0:
+        arrival = rng.expovariate(scenario.job_rate / 60)
+        while arrival < length:
+            arrivals.append(arrival)
+            arrival += rng.expovariate(scenario.job_rate / 60)
+    if scenario.burst_size and scenario.burst_interval > 0:
+        burst = scenario.burst_interval / 2
+        while burst < length:
+            arrivals += [burst] * scenario.burst_size
+            burst += scenario.burst_interval
+    return sorted(
+        (arrival, rng.expovariate(1 / scenario.job_time)) for arrival in arrivals
+    )
+
+
+def desired_capacity(
+    current, min_size, max_size, busy, idle, queued, idle_target, damping
+) -> int:
+    """
+    The desired capacity the controller sets.
+
+    It's ``_desired_capacity()`` of the ``record_metric`` Lambda,
+    which ``tests/test_simulator.py`` checks it against.
+    """
+    target = busy + queued + idle_target
+    if target > current:
+        desired = target
+    else:
+        surplus = min(current - target, idle - idle_target)
+        desired = current - ceil(surplus * damping) if surplus > 0 else current
+    return max(min_size, min(max_size, desired))
+
+
+class _Instance:
+    """An instance of the ASG or its warm pool."""
+
+    def __init__(self, number):
+        self.number = number
+        self.state = None
+        self.since = 0.0
+        # Incremented on every state change; outdated events check it.
+        self.epoch = 0
+        # When it finishes booting or resuming.
+        self.ready_at = None
+        # Index of the job the runner is running.
+        self.job = None
+        self.warm = False
+        self.protected = False
+
+
+class AutoscalingSimulator:
+    """
+    Replay a job trace against a pool with the given settings.
+
+    :param scenario: Latencies of AWS, and the trace parameters.
+    :param settings: The pool's variables.
+    :param trace: ``(arrival, duration)`` tuples, see ``load_trace()``.
+    """
+
+    def __init__(self, scenario: Scenario, settings: PoolSettings, trace: list):
+        self.scenario = scenario
+        self.settings = settings
+        self.trace = trace
+        self.now = 0.0
+        self.waits = []
+        self.interrupted_jobs = 0
+        self.cold_starts = 0
+        self.warm_starts = 0
+        self.scale_outs = 0
+        self.scale_ins = 0
+        self.max_capacity = 0
+        self._running_s = 0.0
+        self._hibernated_s = 0.0
+        self._random = random.Random(scenario.seed)
+        self._events = []
+        self._sequence = count()
+        self._instance_numbers = count()
+        self._instances = []
+        self._queue = deque()
+        self._jobs_left = len(trace)
+        self._desired = 0
+        self._cooldown_until = 0.0
+        self._datapoints = {"IdleRunners": deque(), "QueuedJobs": deque()}
+        self._last_webhook_run = None
+
+    def run(self) -> dict:
+        """
+        Replay the trace until every job has finished.
+
+        :return: The report, see ``report()``.
+        """
+        settings = self.settings
+        self._desired = max(settings.asg_min_size, 0)
+        for _ in range(self._desired):
+            self._set_state(self._new_instance(), IDLE)
+        for _ in range(self._warm_pool_size()):
+            self._set_state(self._new_instance(), HIBERNATED)
+        self.max_capacity = self._desired
+
+        for index, (arrival, _) in enumerate(self.trace):
+            self._schedule(arrival, self._arrive, index)
+        self._schedule(0.0, self._sample, 0)
+        if settings.autoscaling_mode == "alarms":
+            self._schedule(
+                settings.runner_metrics_period + self.scenario.alarm_delay,
+                self._evaluate_scale_out,
+                settings.runner_metrics_period,
+            )
+            self._schedule(60 + self.scenario.alarm_delay, self._evaluate_scale_in, 60)
+
+        while self._events and self._jobs_left:
+            self.now, _, action, args = heapq.heappop(self._events)
+            action(*args)
+        for instance in list(self._instances):
+            self._set_state(instance, TERMINATED)
+        return self.report()
+
+    def report(self) -> dict:
+        """
+        Job waits and the instance-hours of the replay.
+        """
+        return {
+            "settings": asdict(self.settings),
+            "jobs": len(self.trace),
+            "wait_s": summary(self.waits),
+            "interrupted_jobs": self.interrupted_jobs,
+            "hours": self.now / 3600,
+            "instance_hours": self._running_s / 3600,
+            "warm_pool_hours": self._hibernated_s / 3600,
+            "cold_starts": self.cold_starts,
+            "warm_starts": self.warm_starts,
+            "scale_outs": self.scale_outs,
+            "scale_ins": self.scale_ins,
+            "max_capacity": self.max_capacity,
+        }
+
+    def _schedule(self, at, action, *args):
+        heapq.heappush(self._events, (at, next(self._sequence), action, args))
+
+    def _new_instance(self):
+        instance = _Instance(next(self._instance_numbers))
+        instance.since = self.now
+        self._instances.append(instance)
+        return instance
+
+    def _set_state(self, instance, state):
+        if instance.state in RUNNING_STATES:
+            self._running_s += self.now - instance.since
+        elif instance.state == HIBERNATED:
+            self._hibernated_s += self.now - instance.since
+        instance.state = state
+        instance.since = self.now
+        instance.epoch += 1
+        if state == TERMINATED:
+            self._instances.remove(instance)
+
+    def _count(self, *states):
+        return sum(1 for instance in self._instances if instance.state in states)
+
+    # Jobs
+
+    def _arrive(self, index):
+        self._queue.append(index)
+        self._dispatch()
+        if self.settings.queued_jobs_source == "webhook" and (
+            self._last_webhook_run is None
+            or self.now - self._last_webhook_run >= WEBHOOK_RUN_INTERVAL
+        ):
+            self._last_webhook_run = self.now
+            self._sample(None)
+
+    def _dispatch(self):
+        idle = [instance for instance in self._instances if instance.state == IDLE]
+        while self._queue and idle:
+            instance = idle.pop(0)
+            index = self._queue.popleft()
+            arrival, duration = self.trace[index]
+            self.waits.append(self.now - arrival)
+            self._set_state(instance, BUSY)
+            instance.job = index
+            self._schedule(self.now + duration, self._finish, instance, index)
+
+    def _finish(self, instance, index):
+        if instance.job != index:
+            return
+        self._jobs_left -= 1
+        instance.job = None
+        if instance.state == DRAINING:
+            self._set_state(instance, TERMINATED)
+        else:
+            self._set_state(instance, IDLE)
+            self._dispatch()
+
+    def _drain_deadline(self, instance, index):
+        if instance.job != index or instance.state != DRAINING:
+            return
+        self.interrupted_jobs += 1
+        self._jobs_left -= 1
+        instance.job = None
+        self._set_state(instance, TERMINATED)
+
+    # Instances
+
+    def _ready(self, instance, epoch):
+        if instance.epoch != epoch:
+            return
+        if instance.state == WARMING:
+            self._set_state(instance, HIBERNATED)
+            return
+        if instance.warm:
+            self.warm_starts += 1
+        else:
+            self.cold_starts += 1
+        self._set_state(instance, IDLE)
+        self._dispatch()
+
+    def _set_desired(self, desired) -> float:
+        """
+        Launch or terminate instances to reach ``desired`` in-service ones.
+
+        :return: When the scaling activity completes.
+        """
+        done_at = self.now
+        adjustment = desired - self._desired
+        if adjustment > 0:
+            self.scale_outs += 1
+            for _ in range(adjustment):
+                done_at = max(done_at, self._launch())
+            self._desired = desired
+        elif adjustment < 0:
+            self.scale_ins += 1
+            candidates = [
+                instance
+                for instance in self._instances
+                if instance.state in IN_SERVICE_STATES and not instance.protected
+            ]
+            # Protected instances aren't terminated, so the capacity
+            # only goes down by as many as could be.
+            victims = self._random.sample(candidates, min(-adjustment, len(candidates)))
+            for instance in victims:
+                done_at = max(done_at, self._terminate(instance))
+            self._desired -= len(victims)
+        self.max_capacity = max(self.max_capacity, self._desired)
+        self._refill_warm_pool()
+        return done_at
+
+    def _launch(self) -> float:
+        pool = [
+            instance for instance in self._instances if instance.state == HIBERNATED
+        ] or [instance for instance in self._instances if instance.state == WARMING]
+        if pool:
+            instance = pool[0]
+            if instance.state == HIBERNATED:
+                ready_at = self.now + self.scenario.resume_time
+                instance.warm = True
+            else:
+                # Still booting for the warm pool; it goes in service instead.
+                ready_at = instance.ready_at
+        else:
+            instance = self._new_instance()
+            ready_at = self.now + self.scenario.boot_time
+        self._set_state(instance, PENDING)
+        instance.ready_at = ready_at
+        self._schedule(ready_at, self._ready, instance, instance.epoch)
+        return ready_at
+
+    def _terminate(self, instance) -> float:
+        if instance.state != BUSY:
+            self._set_state(instance, TERMINATED)
+            return self.now
+        self._set_state(instance, DRAINING)
+        finish_at = self.now + self.trace[instance.job][1]
+        deadline = self.now + self.settings.allowed_drain_time
+        self._schedule(deadline, self._drain_deadline, instance, instance.job)
+        return min(finish_at, deadline)
+
+    def _warm_pool_size(self):
+        settings = self.settings
+        if not settings.warm_pool:
+            return 0
+        # As local.warm_pool_min clamps it.
+        min_size = min(settings.warm_pool_min_size, settings.warm_pool_max_size)
+        return max(min_size, settings.warm_pool_max_size - self._desired)
+
+    def _refill_warm_pool(self):
+        pool = [
+            instance
+            for instance in self._instances
+            if instance.state in WARM_POOL_STATES
+        ]
+        size = self._warm_pool_size()
+        # Instances aren't reused on scale-in, so new ones refill the pool.
+        for _ in range(size - len(pool)):
+            instance = self._new_instance()
+            self._set_state(instance, WARMING)
+            instance.ready_at = self.now + self.scenario.boot_time
+            self._schedule(instance.ready_at, self._ready, instance, instance.epoch)
+        for instance in sorted(pool, key=lambda i: i.state == WARMING)[
+            : max(len(pool) - size, 0)
+        ]:
+            self._set_state(instance, TERMINATED)
+
+    # record_metric
+
+    def _sample(self, number):
+        """
+        Take a runners sample, as ``record_metric`` does.
+
+        :param number: Number of the scheduled sample, or None for a run
+            the webhook receiver invoked.
+        """
+        settings = self.settings
+        if number is not None:
+            self._schedule(
+                (number + 1) * settings.runner_metrics_period, self._sample, number + 1
+            )
+        first_of_minute = (
+            number is not None and number * settings.runner_metrics_period % 60 == 0
+        )
+        idle = self._count(IDLE)
+        busy = self._count(BUSY, DRAINING)
+        queued = None
+        if settings.queued_jobs_source == "webhook" or (
+            settings.queued_jobs_source == "polling" and first_of_minute
+        ):
+            queued = len(self._queue)
+
+        self._datapoints["IdleRunners"].append((self.now, idle))
+        if queued is not None:
+            self._datapoints["QueuedJobs"].append((self.now, queued))
+        for datapoints in self._datapoints.values():
+            while datapoints and datapoints[0][0] < self.now - 600:
+                datapoints.popleft()
+
+        if settings.autoscaling_protect_busy_runners:
+            for instance in self._instances:
+                instance.protected = instance.state == BUSY
+        if settings.autoscaling_mode == "controller":
+            desired = desired_capacity(
+                self._desired,
+                settings.asg_min_size,
+                settings.asg_max_size,
+                busy,
+                idle,
+                queued or 0,
+                settings.idle_runners_target_count,
+                settings.autoscaling_scalein_damping,
+            )
+            if desired != self._desired:
+                # The controller doesn't honor cooldowns.
+                self._set_desired(desired)
+
+    # CloudWatch alarms and scaling policies
+
+    def _breaching(self, metric, period, periods, end, statistic, breaches) -> bool:
+        for index in range(periods):
+            start = end - (index + 1) * period
+            values = [
+                value
+                for at, value in self._datapoints[metric]
+                if start <= at < start + period
+            ]
+            # Missing data doesn't breach.
+            if not values or not breaches(statistic(values)):
+                return False
+        return True
+
+    def _evaluate_scale_out(self, end):
+        settings = self.settings
+        period = settings.runner_metrics_period
+        self._schedule(
+            end + period + self.scenario.alarm_delay,
+            self._evaluate_scale_out,
+            end + period,
+        )
+        target = settings.idle_runners_target_count
+        idle_low = self._breaching(
+            "IdleRunners",
+            period,
+            max(1, ceil(settings.autoscaling_scaleout_evaluation_period / period)),
+            end,
+            _average,
+            lambda value: value < target,
+        )
+        queued_high = (
+            settings.queued_jobs_source != "none"
+            and settings.queued_jobs_scaleout_threshold > 0
+            and end % 60 == 0
+            and self._breaching(
+                "QueuedJobs",
+                60,
+                1,
+                end,
+                max,
+                lambda value: value >= settings.queued_jobs_scaleout_threshold,
+            )
+        )
+        if idle_low or queued_high:
+            self._execute_policy(
+                settings.autoscaling_step,
+                settings.autoscaling_scaleout_evaluation_period,
+            )
+
+    def _evaluate_scale_in(self, end):
+        settings = self.settings
+        self._schedule(
+            end + 60 + self.scenario.alarm_delay, self._evaluate_scale_in, end + 60
+        )
+        target = settings.idle_runners_target_count
+        if self._breaching(
+            "IdleRunners", 60, 3, end, _average, lambda value: value > target
+        ):
+            self._execute_policy(-settings.autoscaling_step, settings.scalein_cooldown)
+
+    def _execute_policy(self, adjustment, cooldown):
+        if self.now < self._cooldown_until:
+            return
+        settings = self.settings
+        desired = max(
+            settings.asg_min_size,
+            min(settings.asg_max_size, self._desired + adjustment),
+        )
+        if desired != self._desired:
+            self._cooldown_until = self._set_desired(desired) + cooldown
+
+
+def simulate(scenario: Scenario, settings: PoolSettings, trace: list) -> dict:
+    """
+    Replay ``trace`` against a pool with ``settings``.
+
+    :return: The report of ``AutoscalingSimulator.report()``.
+    """
+    return AutoscalingSimulator(scenario, settings, trace).run()
+
+
+def sweep(scenario: Scenario, settings: PoolSettings, grid: dict, trace: list) -> list:
+    """
+    Replay ``trace`` for every combination of settings in ``grid``.
+
+    :param settings: Values of the settings that aren't in the grid.
+    :param grid: ``PoolSettings`` field names to the values to try.
+    :return: The reports, in the order of the combinations.
+    """
+    return [
+        simulate(scenario, replace(settings, **dict(zip(grid, values))), trace)
+        for values in product(*grid.values())
+    ]
+
+
+def recommend(reports, max_wait, wait_percentile=95) -> dict:
+    """
+    The cheapest report whose jobs waited at most ``max_wait`` seconds
+    at ``wait_percentile``.
+
+    Cheapest is fewest instance-hours, then fewest warm pool hours. Reports
+    with interrupted jobs don't qualify. If no report does, the one with the
+    fewest interrupted jobs and then the shortest wait is recommended.
+    """
+    wait_key = f"p{wait_percentile}"
+    meeting = [
+        report
+        for report in reports
+        if (report["wait_s"][wait_key] or 0) <= max_wait
+        and not report["interrupted_jobs"]
+    ]
+    if meeting:
+        return min(
+            meeting,
+            key=lambda report: (
+                report["instance_hours"],
+                report["warm_pool_hours"],
+                report["wait_s"][wait_key] or 0,
+            ),
+        )
+    return min(
+        reports,
+        key=lambda report: (
+            report["interrupted_jobs"],
+            report["wait_s"][wait_key] or 0,
+            report["instance_hours"],
+        ),
+    )
+
+
+def _average(values):
+    return sum(values) / len(values)
+
+
+def _parse_time(value) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _github_jobs(document):
+    if isinstance(document, dict):
+        yield from document.get("jobs", [])
+        return
+    for item in document:
+        if isinstance(item, dict) and "jobs" in item and "id" not in item:
+            yield from item["jobs"]
+        else:
+            yield item
@@ -0,0 +1,213 @@
+"""
+Fake GitHub API server with the organization runner endpoints the Lambdas call.
+
+The Lambdas reach it through ``GITHUB_API_URL``. It serves:
+
+- ``GET /orgs/<org>/actions/runners``, paginated like GitHub;
+- ``POST /orgs/<org>/actions/runners/registration-token``;
+- ``DELETE /orgs/<org>/actions/runners/<id>``, refused with 422 while the runner is busy.
+
+The simulated instances register runners and change their status
+with the methods of ``FakeGitHub``, as the runner service would.
+Every API request is counted by method and route.
+"""
+
+import json
+import re
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from secrets import token_hex
+from threading import Lock, Thread
+from urllib.parse import parse_qs, urlsplit
+
+# GitHub's maximum page size of the runners listing.
+MAX_PER_PAGE = 100
+
+
+class FakeGitHub:
+    """
+    Runners of one organization, served over HTTP on localhost.
+
+    :param org: Organization name.
+    :param token: The only token the API accepts.
+    """
+
+    def __init__(self, org, token):
+        self.org = org
+        self.token = token
+        # Requests served, by "<method> <route>".
+        self.requests = Counter()
+        self._runners = {}
+        self._registration_tokens = set()
+        self._runner_ids = count(1)
+        self._lock = Lock()
+        self._server = None
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self._server.daemon_threads = True
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self) -> str:
+        """The API URL to put in ``GITHUB_API_URL``."""
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def issue_registration_token(self) -> str:
+        """
+        A new registration token, as the registration-token endpoint returns.
+        """
+        with self._lock:
+            return self._new_registration_token()
+
+    def register_runner(self, registration_token, name, labels) -> int:
+        """
+        Register a runner, as ``config.sh`` does with a registration token.
+
+        :return: The runner ID.
+        :raise ValueError: If GitHub never issued the registration token.
+        """
+        with self._lock:
+            if registration_token not in self._registration_tokens:
+                raise ValueError(f"Unknown registration token for runner {name}")
+            runner_id = next(self._runner_ids)
+            self._runners[runner_id] = {
+                "id": runner_id,
+                "name": name,
+                "os": "linux",
+                "status": "online",
+                "busy": False,
+                "labels": [
+                    {"id": index, "name": label, "type": "custom"}
+                    for index, label in enumerate(labels, start=1)
+                ],
+            }
+            return runner_id
+
+    def update_runner(self, runner_id, **attributes):
+        """
+        Set ``status`` or ``busy`` of a runner, if it's still registered.
+        """
+        with self._lock:
+            if runner_id in self._runners:
+                self._runners[runner_id].update(attributes)
+
+    def remove_runner(self, runner_id):
+        """
+        Drop a runner, as its host does when it deregisters itself.
+        """
+        with self._lock:
+            self._runners.pop(runner_id, None)
+
+    def runner(self, runner_id) -> dict:
+        """
+        A copy of the runner, or None if it isn't registered.
+        """
+        with self._lock:
+            runner = self._runners.get(runner_id)
+            return dict(runner) if runner else None
+
+    def handle(self, method, path, query) -> tuple:
+        """
+        Serve one API request.
+
+        :return: The status code, the JSON body or None, and the extra headers.
+        """
+        runners_path = f"/orgs/{self.org}/actions/runners"
+        with self._lock:
+            if path == runners_path and method == "GET":
+                self.requests["GET /orgs/{org}/actions/runners"] += 1
+                return self._list_runners(runners_path, query)
+
+            if path == f"{runners_path}/registration-token" and method == "POST":
+                self.requests[
+                    "POST /orgs/{org}/actions/runners/registration-token"
+                ] += 1
+                token = self._new_registration_token()
+                return 201, {"token": token, "expires_at": None}, {}
+
+            match = re.fullmatch(rf"{runners_path}/(\d+)", path)
+            if match and method == "DELETE":
+                self.requests["DELETE /orgs/{org}/actions/runners/{id}"] += 1
+                runner = self._runners.get(int(match[1]))
+                if runner is None:
+                    return 404, {"message": "Not Found"}, {}
+                if runner["busy"]:
+                    return 422, {"message": "Runner is running a job"}, {}
+                del self._runners[runner["id"]]
+                return 204, None, {}
+
+        self.requests[f"{method} {path}"] += 1
+        return 404, {"message": "Not Found"}, {}
+
+    def _new_registration_token(self):
+        token = token_hex(16)
+        self._registration_tokens.add(token)
+        return token
+
+    def _list_runners(self, runners_path, query):
+        per_page = min(int(query.get("per_page", 30)), MAX_PER_PAGE)
+        page = int(query.get("page", 1))
+        runners = list(self._runners.values())
+        headers = {}
+        if page * per_page < len(runners):
+            headers["Link"] = (
+                f'<{self.url}{runners_path}?per_page={per_page}&page={page + 1}>; rel="next"'
+            )
+        return (
+            200,
+            {
+                "total_count": len(runners),
+                "runners": runners[(page - 1) * per_page : page * per_page],
+            },
+            headers,
+        )
+
+
+def _handler(github):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, as api.github.com does.
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self._serve()
+
+        def do_POST(self):
+            self._serve()
+
+        def do_DELETE(self):
+            self._serve()
+
+        def log_message(self, format, *args):
+            pass
+
+        def _serve(self):
+            # The Lambdas send no request bodies the fake needs, but
+            # the connection is reused, so read them anyway.
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.headers.get("Authorization") != f"Bearer {github.token}":
+                status, body, headers = 401, {"message": "Bad credentials"}, {}
+            else:
+                url = urlsplit(self.path)
+                status, body, headers = github.handle(
+                    self.command,
+                    url.path,
+                    {name: values[0] for name, values in parse_qs(url.query).items()},
+                )
+            payload = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
@@ -0,0 +1,497 @@
+"""
+Offline replay of instance lifecycles through the three Lambdas.
+
+A synthetic stream of launches and scale-ins is replayed on a virtual clock
+through the ``lambda_handler()`` of ``runner_registration``,
+``runner_deregistration``, and ``record_metric``. AWS is moto, GitHub is
+``FakeGitHub``, and the instances are played by the simulator:
+
+- A launch fires the ``registration`` and ``bootstrap`` lifecycle hooks.
+  The instance boots ``boot_time`` seconds later, registers its runner with
+  the token the registration hook stored, and completes the bootstrap hook if
+  the Lambda left it. A warm-pool resume finds its runner already registered
+  and is online after ``resume_time`` seconds.
+- ``hold_time`` seconds after it's up, the instance is scaled in, which fires
+  the ``deregistration`` hook. Its runner is busy with ``busy_fraction``
+  probability. If the Lambda leaves the hook to the instance, the runner
+  service stops and completes it ``stop_time`` seconds later, or
+  ``job_time`` seconds later if it was running a job.
+- ``record_metric`` runs every ``metric_interval`` seconds.
+
+Every function has ``containers`` warm Lambda instances, i.e. its concurrency.
+An event waits for the first free one, and a handler keeps it busy for as long
+as the handler really took. The Lambdas' own clocks (caches, TTLs, sleeps)
+follow the virtual clock. The handlers run one at a time, so their effects
+land in event order even when the Lambda instances would overlap.
+
+The report has the AWS and GitHub API calls the Lambdas made, the handlers'
+latency, and the virtual seconds from a lifecycle event to the completion
+of its hook, by who completed it.
+"""
+
+import heapq
+import logging
+import os
+import random
+import sys
+from collections import Counter, defaultdict
+from contextlib import ExitStack, redirect_stdout
+from dataclasses import asdict, dataclass
+from importlib.util import module_from_spec, spec_from_file_location
+from itertools import count
+from time import perf_counter, time
+from unittest import mock
+
+import boto3
+from botocore.client import BaseClient
+from moto import mock_aws
+
+from simulator.fake_github import FakeGitHub
+from simulator.stats import summary
+
+LAMBDA_ROOT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "modules")
+LAMBDAS = ("runner_registration", "runner_deregistration", "record_metric")
+
+ASG_NAME = "simulator"
+GITHUB_ORG_NAME = "simulator"
+GITHUB_TOKEN = "simulator-pat"
+INSTALLATION_ID = "simulator"
+REGISTRATION_TOKEN_SECRET_PREFIX = "GH-reg-token-simulator"
+
+HOOK_REGISTRATION = "registration"
+HOOK_BOOTSTRAP = "bootstrap"
+HOOK_DEREGISTRATION = "deregistration"
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclass
+class Scenario:
+    """
+    Parameters of a replay. Durations are virtual seconds.
+    """
+
+    launches: int = 500
+    # Seconds between two launches.
+    launch_interval: float = 1.0
+    # Share of the launches that resume a hibernated warm-pool instance.
+    warm_fraction: float = 0.0
+    boot_time: float = 240.0
+    resume_time: float = 20.0
+    # How long an instance serves before it's scaled in.
+    hold_time: float = 600.0
+    # Share of the scaled-in instances whose runner is running a job.
+    busy_fraction: float = 0.2
+    stop_time: float = 10.0
+    job_time: float = 300.0
+    metric_interval: float = 60.0
+    # Warm Lambda instances of each function.
+    containers: int = 10
+    seed: int = 0
+
+
+class VirtualClock:
+    """
+    Virtual time of the replay, which also advances while a handler
+    runs, by the real time the handler takes.
+    """
+
+    def __init__(self):
+        self.epoch = time()
+        self._now = 0.0
+        self._handler_started_at = None
+
+    def monotonic(self) -> float:
+        if self._handler_started_at is None:
+            return self._now
+        return self._now + perf_counter() - self._handler_started_at
+
+    def time(self) -> float:
+        return self.epoch + self.monotonic()
+
+    def sleep(self, seconds):
+        self._now += seconds
+
+    def set(self, at):
+        """Move the clock to ``at`` between handlers."""
+        self._now = at
+
+    def start_handler(self, at):
+        self._now = at
+        self._handler_started_at = perf_counter()
+
+    def stop_handler(self) -> float:
+        """
+        :return: How many seconds the handler took.
+        """
+        duration = perf_counter() - self._handler_started_at
+        self._handler_started_at = None
+        return duration
+
+
+class _Container:
+    """A warm Lambda instance of a function."""
+
+    def __init__(self, main):
+        self.main = main
+        self.free_at = 0.0
+
+
+class _Instance:
+    """An instance of the replay and its runner."""
+
+    def __init__(self, instance_id, warm):
+        self.instance_id = instance_id
+        self.warm = warm
+        self.runner_id = None
+        # Lifecycle hook name to the virtual time its event fired.
+        self.hook_fired_at = {}
+
+
+class LifecycleSimulator:
+    """
+    Replay a ``Scenario`` and collect the report.
+
+    Use it as a context manager; it sets up the fake GitHub, moto, and the
+    Lambdas on entry and tears them down on exit.
+    """
+
+    def __init__(self, scenario: Scenario):
+        self.scenario = scenario
+        self.clock = VirtualClock()
+        self.aws_requests = Counter()
+        self.handler_ms = defaultdict(list)
+        self.handler_errors = Counter()
+        self.hook_results = Counter()
+        # (hook, completed by) to the virtual seconds from the event to the completion.
+        self.hook_completion = defaultdict(list)
+        self.boot_failures = 0
+        self._random = random.Random(scenario.seed)
+        self._events = []
+        self._sequence = count()
+        self._instances = {}
+        self._containers = {}
+        self._in_handler = False
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        self.github = self._stack.enter_context(
+            FakeGitHub(GITHUB_ORG_NAME, GITHUB_TOKEN)
+        )
+        self._stack.enter_context(
+            mock.patch.dict(
+                os.environ,
+                {
+                    "AWS_DEFAULT_REGION": "us-east-1",
+                    "AWS_ACCESS_KEY_ID": "simulator",
+                    "AWS_SECRET_ACCESS_KEY": "simulator",
+                    "ASG_NAME": ASG_NAME,
+                    "GITHUB_API_URL": self.github.url,
+                    "GITHUB_ORG_NAME": GITHUB_ORG_NAME,
+                    "GITHUB_SECRET": "github-token",
+                    "GITHUB_SECRET_TYPE": "token",
+                    "GH_APP_ID": "1",
+                    "INSTALLATION_ID": INSTALLATION_ID,
+                    "REGISTRATION_TOKEN_SECRET_PREFIX": REGISTRATION_TOKEN_SECRET_PREFIX,
+                    "LAMBDA_TIMEOUT": "900",
+                    "STATE_TABLE": f"{ASG_NAME}-state",
+                    "BOOTSTRAP_POLL_TIMEOUT": "0",
+                },
+            )
+        )
+        self._stack.enter_context(mock_aws())
+        self._stack.enter_context(
+            mock.patch.object(
+                BaseClient, "_make_api_call", self._api_call_interceptor()
+            )
+        )
+        self._create_aws_resources()
+        for name in LAMBDAS:
+            self._containers[name] = [
+                _Container(self._load(name)) for _ in range(self.scenario.containers)
+            ]
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def run(self) -> dict:
+        """
+        Replay the scenario.
+
+        :return: The report, see ``report()``.
+        """
+        scenario = self.scenario
+        for index in range(scenario.launches):
+            if self._random.random() < scenario.warm_fraction:
+                instance = self._hibernated_instance()
+            else:
+                instance = None
+            self._schedule(index * scenario.launch_interval, self._launch, instance)
+        self._schedule(0.0, self._record_metric)
+
+        started_at = perf_counter()
+        while self._events:
+            at, _, action, args = heapq.heappop(self._events)
+            self.clock.set(at)
+            action(at, *args)
+        return self.report(perf_counter() - started_at)
+
+    def report(self, wall_time=None) -> dict:
+        """
+        The API calls, handler latency, and hook completion times of the replay.
+        """
+        return {
+            "scenario": asdict(self.scenario),
+            "wall_time_s": wall_time,
+            "aws_requests": dict(sorted(self.aws_requests.items())),
+            "github_requests": dict(sorted(self.github.requests.items())),
+            "handler_ms": {
+                name: summary(durations)
+                for name, durations in sorted(self.handler_ms.items())
+            },
+            "handler_errors": dict(self.handler_errors),
+            "hook_results": {
+                f"{hook} {result}": total
+                for (hook, result), total in sorted(self.hook_results.items())
+            },
+            "hook_completion_s": {
+                f"{hook} by {completed_by}": summary(delays)
+                for (hook, completed_by), delays in sorted(self.hook_completion.items())
+            },
+            "boot_failures": self.boot_failures,
+        }
+
+    def _schedule(self, at, action, *args):
+        heapq.heappush(self._events, (at, next(self._sequence), action, args))
+
+    def _create_aws_resources(self):
+        ec2 = boto3.client("ec2")
+        template = ec2.create_launch_template(
+            LaunchTemplateName=ASG_NAME,
+            LaunchTemplateData={"ImageId": "ami-12c6146b", "InstanceType": "t3.micro"},
+        )["LaunchTemplate"]
+        boto3.client("autoscaling").create_auto_scaling_group(
+            AutoScalingGroupName=ASG_NAME,
+            LaunchTemplate={"LaunchTemplateId": template["LaunchTemplateId"]},
+            MinSize=0,
+            MaxSize=self.scenario.launches,
+            DesiredCapacity=0,
+            AvailabilityZones=["us-east-1a"],
+        )
+        boto3.client("secretsmanager").create_secret(
+            Name="github-token", SecretString=GITHUB_TOKEN
+        )
+        boto3.client("dynamodb").create_table(
+            TableName=f"{ASG_NAME}-state",
+            KeySchema=[{"AttributeName": "pk", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "pk", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+    def _load(self, name):
+        """
+        Load a fresh copy of a Lambda's ``main.py``, i.e. a cold start,
+        with its clocks on the virtual clock.
+        """
+        lambda_dir = os.path.join(LAMBDA_ROOT_DIR, name, "lambda")
+        siblings = [
+            filename[: -len(".py")]
+            for filename in os.listdir(lambda_dir)
+            if filename.endswith(".py") and filename != "main.py"
+        ]
+        for sibling in siblings:
+            sys.modules.pop(sibling, None)
+        spec = spec_from_file_location(
+            f"simulator_{name}_main", os.path.join(lambda_dir, "main.py")
+        )
+        main = module_from_spec(spec)
+        sys.path.insert(0, lambda_dir)
+        try:
+            spec.loader.exec_module(main)
+        finally:
+            sys.path.remove(lambda_dir)
+
+        # emf keeps measuring real durations.
+        for module in [main, *(sys.modules[sibling] for sibling in siblings)]:
+            if module.__name__ == "emf":
+                continue
+            for attribute in ("time", "monotonic", "sleep"):
+                if hasattr(module, attribute):
+                    setattr(module, attribute, getattr(self.clock, attribute))
+        return main
+
+    def _api_call_interceptor(self):
+        """
+        Count the Lambdas' AWS API calls. Lifecycle actions, which moto doesn't
+        implement, are completed by the simulator.
+        """
+        make_api_call = BaseClient._make_api_call
+
+        def _make_api_call(client, operation_name, api_params):
+            service = client.meta.service_model.service_name
+            if self._in_handler:
+                self.aws_requests[f"{service}:{operation_name}"] += 1
+            if service == "autoscaling" and operation_name == "CompleteLifecycleAction":
+                self._complete_hook(
+                    api_params["InstanceId"],
+                    api_params["LifecycleHookName"],
+                    api_params["LifecycleActionResult"],
+                    "lambda",
+                )
+                return {}
+            if (
+                service == "autoscaling"
+                and operation_name == "RecordLifecycleActionHeartbeat"
+            ):
+                return {}
+            return make_api_call(client, operation_name, api_params)
+
+        return _make_api_call
+
+    def _invoke(self, function, at, event):
+        """
+        Run a handler on the first free Lambda instance of ``function``.
+        """
+        container = min(self._containers[function], key=lambda c: c.free_at)
+        started_at = max(at, container.free_at)
+        self.clock.start_handler(started_at)
+        self._in_handler = True
+        try:
+            # The handlers write their EMF records to stdout.
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                container.main.lambda_handler(event, None)
+        except Exception:
+            LOG.exception("%s failed on %s", function, event)
+            self.handler_errors[function] += 1
+        finally:
+            self._in_handler = False
+            duration = self.clock.stop_handler()
+            container.free_at = started_at + duration
+            self.handler_ms[function].append(duration * 1000)
+
+    def _fire_hook(self, at, instance, hook_name, function):
+        instance.hook_fired_at[hook_name] = at
+        self._invoke(
+            function,
+            at,
+            {
+                "detail-type": "EC2 Instance-launch Lifecycle Action",
+                "detail": {
+                    "AutoScalingGroupName": ASG_NAME,
+                    "LifecycleActionToken": f"{hook_name}-{instance.instance_id}",
+                    "LifecycleHookName": hook_name,
+                    "EC2InstanceId": instance.instance_id,
+                },
+            },
+        )
+
+    def _complete_hook(self, instance_id, hook_name, result, completed_by):
+        instance = self._instances[instance_id]
+        if hook_name not in instance.hook_fired_at:
+            return
+        self.hook_results[(hook_name, result)] += 1
+        self.hook_completion[(hook_name, completed_by)].append(
+            self.clock.monotonic() - instance.hook_fired_at.pop(hook_name)
+        )
+
+    def _run_instance(self, warm):
+        (ec2_instance,) = boto3.client("ec2").run_instances(
+            ImageId="ami-12c6146b", MinCount=1, MaxCount=1
+        )["Instances"]
+        instance = _Instance(ec2_instance["InstanceId"], warm=warm)
+        self._instances[instance.instance_id] = instance
+        return instance
+
+    def _hibernated_instance(self):
+        # A warm-pool instance registered its runner on its first boot,
+        # well before the replay, and the runner went offline when it hibernated.
+        instance = self._run_instance(warm=True)
+        instance.runner_id = self._register_runner(
+            instance, self.github.issue_registration_token()
+        )
+        self.github.update_runner(instance.runner_id, status="offline")
+        return instance
+
+    def _launch(self, at, instance=None):
+        if instance is None:
+            instance = self._run_instance(warm=False)
+        boto3.client("autoscaling").attach_instances(
+            AutoScalingGroupName=ASG_NAME, InstanceIds=[instance.instance_id]
+        )
+        self._fire_hook(at, instance, HOOK_REGISTRATION, "runner_registration")
+        self._fire_hook(at, instance, HOOK_BOOTSTRAP, "runner_registration")
+        self._schedule(
+            at
+            + (self.scenario.resume_time if instance.warm else self.scenario.boot_time),
+            self._boot,
+            instance,
+        )
+
+    def _boot(self, at, instance):
+        if instance.warm:
+            self.github.update_runner(instance.runner_id, status="online")
+        else:
+            # Puppet reads the registration token, registers the runner,
+            # and deletes the token.
+            secretsmanager = boto3.client("secretsmanager")
+            secret_id = f"{REGISTRATION_TOKEN_SECRET_PREFIX}-{instance.instance_id}"
+            try:
+                token = secretsmanager.get_secret_value(SecretId=secret_id)
+            except secretsmanager.exceptions.ResourceNotFoundException:
+                LOG.warning("No registration token for %s", instance.instance_id)
+                self.boot_failures += 1
+                return
+            instance.runner_id = self._register_runner(instance, token["SecretString"])
+            secretsmanager.delete_secret(
+                SecretId=secret_id, ForceDeleteWithoutRecovery=True
+            )
+        # cloud-init completes the bootstrap hook if the Lambda didn't.
+        self._complete_hook(
+            instance.instance_id, HOOK_BOOTSTRAP, "CONTINUE", "instance"
+        )
+        self._schedule(at + self.scenario.hold_time, self._scale_in, instance)
+
+    def _register_runner(self, instance, registration_token):
+        return self.github.register_runner(
+            registration_token,
+            f"runner-{instance.instance_id}",
+            [
+                "self-hosted",
+                f"installation_id:{INSTALLATION_ID}",
+                f"instance_id:{instance.instance_id}",
+            ],
+        )
+
+    def _scale_in(self, at, instance):
+        busy = self._random.random() < self.scenario.busy_fraction
+        self.github.update_runner(instance.runner_id, busy=busy)
+        self._fire_hook(at, instance, HOOK_DEREGISTRATION, "runner_deregistration")
+        if HOOK_DEREGISTRATION in instance.hook_fired_at:
+            # Left to the instance: the runner service stops after its job.
+            self._schedule(
+                at + (self.scenario.job_time if busy else self.scenario.stop_time),
+                self._runner_exit,
+                instance,
+            )
+        else:
+            self._terminate(instance)
+
+    def _runner_exit(self, at, instance):
+        # gha-on-runner-exit.sh deregisters the runner and completes the hook.
+        self.github.remove_runner(instance.runner_id)
+        self._complete_hook(
+            instance.instance_id, HOOK_DEREGISTRATION, "CONTINUE", "instance"
+        )
+        self._terminate(instance)
+
+    def _terminate(self, instance):
+        boto3.client("autoscaling").terminate_instance_in_auto_scaling_group(
+            InstanceId=instance.instance_id, ShouldDecrementDesiredCapacity=True
+        )
+        del self._instances[instance.instance_id]
+
+    def _record_metric(self, at):
+        self._invoke("record_metric", at, {})
+        if self._instances or self._events:
+            self._schedule(at + self.scenario.metric_interval, self._record_metric)
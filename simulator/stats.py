@@ -0,0 +1,29 @@
+"""
+Percentile summaries of the simulators' measurements.
+"""
+
+from math import ceil
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, q) -> float:
+    """
+    The ``q``-th percentile of ``values`` by the nearest-rank method,
+    or None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def summary(values) -> dict:
+    """
+    Count, percentiles, and maximum of ``values``.
+    """
+    return {
+        "count": len(values),
+        **{f"p{q}": percentile(values, q) for q in PERCENTILES},
+        "max": max(values, default=None),
+    }
@@ -0,0 +1,210 @@
+"""
+Benchmark of one Lambda's cold start and invocations, run in a fresh interpreter.
+
+``tests/test_benchmark.py`` runs it as::
+
+    python -X importtime -m tests.benchmark_lambda <lambda> [--tracemalloc]
+
+It loads the Lambda's ``main.py`` the way the Lambda runtime does, then calls
+``lambda_handler()`` ``INVOCATIONS`` times against stubbed AWS clients and a
+stubbed GitHub API with ``GITHUB_RUNNERS`` runners. It prints the measurements
+as a JSON object on stdout.
+
+Only a few standard library modules are imported before ``main.py``, and the
+stubs after it, so the measured INIT is the Lambda's own. With ``--tracemalloc`` the Python allocations
+are traced from the start, which slows everything down; that run only reports
+``peak_traced_mb``.
+"""
+
+import json
+import os
+import re
+import resource
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from statistics import median
+from time import perf_counter
+
+LAMBDA_ROOT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "modules")
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_ORG_NAME = "infrahouse"
+INSTALLATION_ID = "benchmark"
+# Runners of the organization; the listing takes two pages of 100.
+GITHUB_RUNNERS = 150
+# The first invocation after the cold start and the warm ones.
+INVOCATIONS = 20
+
+ENVIRONMENT = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    # Stubbed clients never use them; they keep botocore off the metadata service.
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "ASG_NAME": "benchmark-asg",
+    "GITHUB_ORG_NAME": GITHUB_ORG_NAME,
+    "GITHUB_SECRET": "github-secret",
+    "GITHUB_SECRET_TYPE": "token",
+    "GH_APP_ID": "1",
+    "INSTALLATION_ID": INSTALLATION_ID,
+    "REGISTRATION_TOKEN_SECRET_PREFIX": "GH-reg-token-benchmark",
+    "LAMBDA_TIMEOUT": "900",
+}
+
+
+def _lifecycle_event(hook_name, instance_id):
+    return {
+        "time": "2024-08-19T14:02:11Z",
+        "detail": {
+            "LifecycleHookName": hook_name,
+            "LifecycleActionToken": f"token-{instance_id}",
+            "EC2InstanceId": instance_id,
+            "AutoScalingGroupName": ENVIRONMENT["ASG_NAME"],
+        },
+    }
+
+
+def _instance_id(index):
+    return f"i-{index:017x}"
+
+
+def _stub_aws(main):
+    """
+    Replace the module-scope boto3 clients and the infrahouse_core AWS classes.
+    """
+    from unittest import mock
+
+    for name in ("_secretsmanager", "_cloudwatch", "_autoscaling", "_ssm", "_ec2"):
+        if hasattr(main, name):
+            setattr(main, name, mock.Mock())
+    main._secretsmanager.get_secret_value.return_value = {"SecretString": "pat"}
+    for name in ("ASG", "Secret"):
+        if hasattr(main, name):
+            setattr(main, name, mock.Mock())
+    if hasattr(main, "ASGInstance"):
+        main.ASGInstance = mock.Mock(
+            return_value=mock.Mock(
+                asg_name=ENVIRONMENT["ASG_NAME"], lifecycle_state="Terminating:Wait"
+            )
+        )
+
+
+def _stub_github(rsps):
+    """
+    Serve the runners listing, a registration token, and runner deletions.
+    """
+    from responses import matchers
+
+    runners_url = f"{GITHUB_API_URL}/orgs/{GITHUB_ORG_NAME}/actions/runners"
+    runners = [
+        {
+            "id": index,
+            "name": f"runner-{index}",
+            "os": "linux",
+            "status": "online",
+            "busy": index % 2 == 0,
+            "labels": [
+                {"name": "self-hosted"},
+                {"name": f"installation_id:{INSTALLATION_ID}"},
+                {"name": f"instance_id:{_instance_id(index)}"},
+            ],
+        }
+        for index in range(GITHUB_RUNNERS)
+    ]
+    for page, start in enumerate(range(0, GITHUB_RUNNERS, 100), start=1):
+        last_page = start + 100 >= GITHUB_RUNNERS
+        rsps.get(
+            runners_url,
+            json={
+                "total_count": GITHUB_RUNNERS,
+                "runners": runners[start : start + 100],
+            },
+            headers=(
+                {}
+                if last_page
+                else {
+                    "Link": f'<{runners_url}?per_page=100&page={page + 1}>; rel="next"'
+                }
+            ),
+            match=[
+                matchers.query_param_matcher(
+                    {"per_page": "100", **({"page": str(page)} if page > 1 else {})}
+                )
+            ],
+        )
+    rsps.post(f"{runners_url}/registration-token", json={"token": "registration"})
+    rsps.delete(re.compile(rf"{runners_url}/\d+"), status=204)
+
+
+def _invocations(lambda_name):
+    """
+    Events of the benchmarked invocations.
+
+    Every lifecycle event is for another instance, so no invocation is
+    a duplicate. Deregistered instances run idle runners.
+    """
+    if lambda_name == "record_metric":
+        return [{} for _ in range(INVOCATIONS)]
+    if lambda_name == "runner_registration":
+        return [
+            _lifecycle_event("registration", _instance_id(GITHUB_RUNNERS + index))
+            for index in range(INVOCATIONS)
+        ]
+    return [
+        _lifecycle_event("deregistration", _instance_id(2 * index + 1))
+        for index in range(INVOCATIONS)
+    ]
+
+
+def _load_main(lambda_name):
+    lambda_dir = os.path.join(LAMBDA_ROOT_DIR, lambda_name, "lambda")
+    sys.path.insert(0, lambda_dir)
+    import main
+
+    return main
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("lambda_name", help="Directory name under modules/.")
+    parser.add_argument("--tracemalloc", action="store_true")
+    args = parser.parse_args()
+
+    os.environ.update(ENVIRONMENT)
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    lambda_main = _load_main(args.lambda_name)
+    # As published in the init phase by the first invocation.
+    init_ms = lambda_main.emf._phase_durations["init"][0]
+
+    import responses
+
+    _stub_aws(lambda_main)
+    durations = []
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+        _stub_github(rsps)
+        # The handlers write their EMF records to stdout.
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            for event in _invocations(args.lambda_name):
+                started_at = perf_counter()
+                lambda_main.lambda_handler(event, None)
+                durations.append((perf_counter() - started_at) * 1000)
+        github_requests = len(rsps.calls)
+
+    if args.tracemalloc:
+        results = {"peak_traced_mb": tracemalloc.get_traced_memory()[1] / 2**20}
+    else:
+        results = {
+            "init_ms": init_ms,
+            "first_invocation_ms": durations[0],
+            "warm_invocation_ms": median(durations[1:]),
+            "github_requests": github_requests,
+            # Kilobytes on Linux.
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
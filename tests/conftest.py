@@ -1,6 +1,9 @@
 import json
 import logging
+import sys
 from datetime import datetime, timedelta, timezone
+from importlib.util import module_from_spec, spec_from_file_location
+from os import environ, listdir, path as osp
 from time import sleep
 
 import pytest
@@ -20,6 +23,7 @@ from requests import get
 LOG = logging.getLogger(__name__)
 GITHUB_ORG_NAME = "infrahouse"
 TERRAFORM_ROOT_DIR = "test_data"
+LAMBDA_ROOT_DIR = osp.join(osp.dirname(osp.dirname(__file__)), "modules")
 GH_APP_ID = 1016363
 
 # Maximum LambdaInsights memory_utilization (percent) we tolerate in tests.
@@ -43,6 +47,16 @@ def pytest_addoption(parser):
         action="store",
         help=f"Secret ARN with a GitHub App PEM key.",
     )
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        help="Benchmark the Lambdas against tests/data/benchmark_baselines.json.",
+    )
+    parser.addoption(
+        "--benchmark-save",
+        action="store_true",
+        help="Benchmark the Lambdas and save the results as the new baselines.",
+    )
 
 
 @pytest.fixture(scope="session")
@@ -55,6 +69,39 @@ def github_app_pem_secret_arn(request):
     return request.config.getoption("--github-app-pem-secret")
 
 
+def load_lambda(module_name: str):
+    """
+    Import a Lambda package's ``main.py`` for offline unit tests.
+
+    Every Lambda in the module ships its own ``main.py``, so they can't be
+    imported by their package name side by side. Each call loads a fresh copy
+    under a unique name, so module-scope state (caches, boto3 clients) doesn't
+    leak between tests.
+
+    :param module_name: Directory name under ``modules/``, e.g. ``record_metric``.
+    :return: The loaded module.
+    """
+    # main.py builds boto3 clients at import time; they need a region.
+    environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    lambda_dir = osp.join(LAMBDA_ROOT_DIR, module_name, "lambda")
+    # main.py imports its sibling modules (e.g. emf) by plain name, as it does
+    # in the Lambda runtime. Forget the copies another Lambda has loaded.
+    for filename in listdir(lambda_dir):
+        if filename.endswith(".py") and filename != "main.py":
+            sys.modules.pop(filename[: -len(".py")], None)
+
+    spec = spec_from_file_location(
+        f"{module_name}_main", osp.join(lambda_dir, "main.py")
+    )
+    module = module_from_spec(spec)
+    sys.path.insert(0, lambda_dir)
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(lambda_dir)
+    return module
+
+
 def ensure_runners(
     gha: GitHubActions,
     aws_region,
@@ -0,0 +1,128 @@
+"""
+Offline benchmark of the Lambdas' cold start and invocations.
+
+Skipped unless pytest runs with ``--benchmark`` (``make benchmark``). Every
+Lambda is benchmarked by ``tests/benchmark_lambda.py`` in fresh interpreters
+and compared with ``tests/data/benchmark_baselines.json``. A measurement fails
+the test if it exceeds its baseline by more than its tolerance.
+
+``--benchmark-save`` stores the measurements as the new baselines instead.
+Timings depend on the machine, so save them on the machine that checks them.
+"""
+
+import json
+import re
+import subprocess
+import sys
+from os import path as osp
+
+import pytest
+
+from tests.conftest import LAMBDA_MEMORY_UTILIZATION_MAX_PERCENT, LAMBDA_ROOT_DIR
+
+BASELINES_PATH = osp.join(osp.dirname(__file__), "data", "benchmark_baselines.json")
+BENCHMARKED_LAMBDAS = ["record_metric", "runner_registration", "runner_deregistration"]
+# Timings are the best of this many runs.
+TIMING_RUNS = 3
+# Allowed excess over the baseline by measurement: (relative, absolute).
+# The absolute part keeps a millisecond of jitter from failing a short timing.
+TOLERANCES = {
+    "import_ms": (0.5, 20),
+    "init_ms": (0.5, 20),
+    "first_invocation_ms": (0.5, 5),
+    "warm_invocation_ms": (0.5, 5),
+    "github_requests": (0, 0),
+    "max_rss_mb": (0.1, 5),
+    "peak_traced_mb": (0.1, 2),
+}
+
+
+def _run(lambda_name, *args, importtime=False) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [
+            sys.executable,
+            *(["-X", "importtime"] if importtime else []),
+            "-m",
+            "tests.benchmark_lambda",
+            lambda_name,
+            *args,
+        ],
+        cwd=osp.dirname(osp.dirname(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def _measure(lambda_name) -> dict:
+    """
+    Benchmark a Lambda.
+
+    ``import_ms`` is the part of ``init_ms`` spent importing modules,
+    as reported by ``python -X importtime``.
+    """
+    runs = []
+    for _ in range(TIMING_RUNS):
+        process = _run(lambda_name, importtime=True)
+        self_us, cumulative_us = re.search(
+            r"^import time:\s+(\d+) \|\s+(\d+) \| main$",
+            process.stderr,
+            re.MULTILINE,
+        ).groups()
+        runs.append(
+            {
+                **json.loads(process.stdout),
+                "import_ms": (int(cumulative_us) - int(self_us)) / 1000,
+            }
+        )
+    measurements = {name: min(run[name] for run in runs) for name in runs[0]}
+
+    process = _run(lambda_name, "--tracemalloc")
+    return {**measurements, **json.loads(process.stdout)}
+
+
+def _memory_size(lambda_name) -> int:
+    """``memory_size`` of the Lambda in its Terraform module, in MB."""
+    with open(osp.join(LAMBDA_ROOT_DIR, lambda_name, "main.tf")) as main_tf:
+        return int(re.search(r"^\s*memory_size\s*=\s*(\d+)", main_tf.read(), re.M)[1])
+
+
+@pytest.fixture
+def benchmark_save(request):
+    if not (
+        request.config.getoption("--benchmark")
+        or request.config.getoption("--benchmark-save")
+    ):
+        pytest.skip("Run with --benchmark")
+    return request.config.getoption("--benchmark-save")
+
+
+@pytest.mark.parametrize("lambda_name", BENCHMARKED_LAMBDAS)
+def test_benchmark(benchmark_save, lambda_name):
+    measurements = _measure(lambda_name)
+    print(f"{lambda_name}: {json.dumps(measurements, indent=2)}")
+    # The same budget as assert_lambda_memory_within_limit() checks in AWS,
+    # where the Lambda runtime adds its own memory on top.
+    memory_limit = _memory_size(lambda_name) * LAMBDA_MEMORY_UTILIZATION_MAX_PERCENT
+    assert measurements["max_rss_mb"] <= memory_limit / 100
+
+    baselines = {}
+    if osp.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as baselines_file:
+            baselines = json.load(baselines_file)
+    if benchmark_save:
+        baselines[lambda_name] = {
+            name: round(value, 2) for name, value in sorted(measurements.items())
+        }
+        with open(BASELINES_PATH, "w") as baselines_file:
+            json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+            baselines_file.write("\n")
+        return
+
+    regressions = {
+        name: f"{measurements[name]:.2f} > {baseline:.2f}"
+        for name, baseline in baselines[lambda_name].items()
+        if measurements[name]
+        > baseline * (1 + TOLERANCES[name][0]) + TOLERANCES[name][1]
+    }
+    assert not regressions, f"{lambda_name} regressed: {regressions}"
@@ -0,0 +1,139 @@
+import json
+from datetime import datetime, timedelta, timezone
+from filecmp import cmp
+from os import path as osp
+
+import pytest
+
+from tests.conftest import LAMBDA_ROOT_DIR, load_lambda
+
+EMF_COPIES = [
+    osp.join(LAMBDA_ROOT_DIR, name, "lambda", "emf.py")
+    for name in (
+        "record_metric",
+        "runner_registration",
+        "runner_deregistration",
+        "webhook_receiver",
+        "warm_pool_tuner",
+    )
+]
+
+
+@pytest.fixture
+def emf():
+    load_lambda("record_metric")
+    import emf
+
+    # Forget the INIT duration main.py recorded.
+    emf._phase_durations.clear()
+    return emf
+
+
+def _records(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+@pytest.mark.parametrize("copy", EMF_COPIES[1:])
+def test_emf_copies_are_identical(copy):
+    assert cmp(
+        EMF_COPIES[0], copy, shallow=False
+    ), f"{copy} differs from {EMF_COPIES[0]}"
+
+
+def test_emit(emf, capsys):
+    timestamp = datetime(2024, 8, 19, 14, 2, 11, tzinfo=timezone.utc)
+
+    emf.emit(
+        {"BusyRunners": (3, "Count"), "IdleRunners": (1, "Count")},
+        {"asg_name": "test-asg"},
+        timestamp=timestamp,
+        storage_resolution=1,
+    )
+
+    assert _records(capsys) == [
+        {
+            "_aws": {
+                "Timestamp": 1724076131000,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": "GitHubRunners",
+                        "Dimensions": [["asg_name"]],
+                        "Metrics": [
+                            {
+                                "Name": "BusyRunners",
+                                "Unit": "Count",
+                                "StorageResolution": 1,
+                            },
+                            {
+                                "Name": "IdleRunners",
+                                "Unit": "Count",
+                                "StorageResolution": 1,
+                            },
+                        ],
+                    }
+                ],
+            },
+            "asg_name": "test-asg",
+            "BusyRunners": 3,
+            "IdleRunners": 1,
+        }
+    ]
+
+
+def test_emit_lifecycle_hook(emf, capsys):
+    received_at = datetime.now(tz=timezone.utc) - timedelta(seconds=5)
+    event = {
+        "time": received_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "detail": {"AutoScalingGroupName": "test-asg"},
+    }
+
+    emf.emit_lifecycle_hook(event, "registration", "CONTINUE")
+
+    results, latency = _records(capsys)
+    assert results["LifecycleHookResults"] == 1
+    assert (results["hook"], results["result"]) == ("registration", "CONTINUE")
+    assert latency["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [
+        ["asg_name", "hook"]
+    ]
+    assert 5000 <= latency["LifecycleHookLatency"] < 7000
+
+
+def test_emit_phases(emf, capsys, monkeypatch):
+    clock = iter([10.0, 10.25, 11.0, 11.5, 12.0, 12.125])
+    monkeypatch.setattr(emf, "monotonic", lambda: next(clock))
+
+    with emf.phase("github_token"):
+        pass
+    with emf.phase("asg_instance_lookup"):
+        pass
+    with pytest.raises(RuntimeError):
+        with emf.phase("asg_instance_lookup"):
+            raise RuntimeError
+    emf.emit_phases("test-asg", "registration")
+
+    token, lookup = _records(capsys)
+    assert token["PhaseDuration"] == [250.0]
+    assert lookup["PhaseDuration"] == [500.0, 125.0]
+    assert (lookup["asg_name"], lookup["function"], lookup["phase"]) == (
+        "test-asg",
+        "registration",
+        "asg_instance_lookup",
+    )
+    assert lookup["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [
+        ["asg_name", "function", "phase"]
+    ]
+
+    emf.emit_phases("test-asg", "registration")
+    assert _records(capsys) == []
+
+
+def test_init_duration_is_published_once(emf, capsys, monkeypatch):
+    monkeypatch.setattr(emf, "monotonic", lambda: 10.5)
+
+    emf.record_init(10.0)
+    emf.emit_phases("test-asg", "registration")
+    emf.emit_phases("test-asg", "registration")
+
+    (init,) = _records(capsys)
+    assert init["phase"] == "init"
+    assert init["PhaseDuration"] == [500.0]
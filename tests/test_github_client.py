@@ -0,0 +1,139 @@
+import subprocess
+import sys
+from filecmp import cmp
+from os import environ
+from os import path as osp
+from unittest import mock
+
+import pytest
+import responses
+from requests import HTTPError
+
+from tests.conftest import LAMBDA_ROOT_DIR, load_lambda
+
+GITHUB_CLIENT_COPIES = [
+    osp.join(LAMBDA_ROOT_DIR, name, "lambda", "github_client.py")
+    for name in ("record_metric", "runner_registration", "runner_deregistration")
+]
+GITHUB_CLIENT_LAMBDAS = [osp.dirname(copy) for copy in GITHUB_CLIENT_COPIES]
+RUNNERS_URL = "https://api.github.com/orgs/infrahouse/actions/runners"
+
+
+@pytest.fixture
+def github_client(monkeypatch):
+    load_lambda("runner_deregistration")
+    import github_client
+
+    # Don't sleep between retries.
+    monkeypatch.setattr(github_client.Retry, "DEFAULT_BACKOFF_MAX", 0)
+    return github_client
+
+
+@pytest.mark.parametrize("copy", GITHUB_CLIENT_COPIES[1:])
+def test_github_client_copies_are_identical(copy):
+    assert cmp(
+        GITHUB_CLIENT_COPIES[0], copy, shallow=False
+    ), f"{copy} differs from {GITHUB_CLIENT_COPIES[0]}"
+
+
+def _runner(runner_id):
+    return {
+        "id": runner_id,
+        "name": f"runner-{runner_id}",
+        "status": "online",
+        "busy": False,
+        "labels": [{"name": f"instance_id:i-{runner_id}"}],
+    }
+
+
+@responses.activate
+def test_client_and_session_are_reused(github_client):
+    responses.get(
+        RUNNERS_URL,
+        json={"runners": [_runner(1)]},
+        headers={"Link": f'<{RUNNERS_URL}?per_page=100&page=2>; rel="next"'},
+        match=[responses.matchers.query_param_matcher({"per_page": "100"})],
+    )
+    responses.get(
+        RUNNERS_URL,
+        json={"runners": [_runner(2)]},
+        match=[
+            responses.matchers.query_param_matcher({"per_page": "100", "page": "2"})
+        ],
+    )
+
+    gha = github_client.github_actions("token-1", "infrahouse")
+    runners = list(gha.runners)
+
+    assert [runner.name for runner in runners] == ["runner-1", "runner-2"]
+    assert runners[1].instance_id == "i-2"
+    assert github_client.github_actions("token-1", "infrahouse") is gha
+    assert github_client.github_actions("token-2", "infrahouse") is not gha
+    assert github_client.session() is github_client.session()
+    assert responses.calls[0].request.headers["Authorization"] == "Bearer token-1"
+
+
+@responses.activate
+def test_server_errors_are_retried(github_client):
+    url = f"{RUNNERS_URL}/7"
+    responses.delete(url, status=502)
+    responses.delete(url, status=204)
+    gha = github_client.github_actions("token", "infrahouse")
+
+    gha.deregister_runner(mock.Mock(runner_id=7))
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_registration_token_expiry(github_client):
+    responses.post(
+        f"{RUNNERS_URL}/registration-token",
+        json={
+            "token": "LLBF3JGZDX3P5PMEXLND6TS6FCWO6",
+            "expires_at": "2020-01-22T12:13:35.123-08:00",
+        },
+        status=201,
+    )
+    gha = github_client.github_actions("token", "infrahouse")
+
+    assert gha.create_registration_token() == (
+        "LLBF3JGZDX3P5PMEXLND6TS6FCWO6",
+        1579724015.123,
+    )
+
+
+@responses.activate
+def test_rate_limits_are_left_to_callers(github_client):
+    responses.post(f"{RUNNERS_URL}/registration-token", status=429)
+    gha = github_client.github_actions("token", "infrahouse")
+
+    with pytest.raises(HTTPError) as err:
+        gha.create_registration_token()
+    assert err.value.response.status_code == 429
+    assert len(responses.calls) == 1
+
+
+@pytest.mark.parametrize("lambda_dir", GITHUB_CLIENT_LAMBDAS)
+def test_lambdas_load_without_pygithub(lambda_dir):
+    # In a fresh interpreter: the test session has imported PyGithub already.
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, main; "
+            "assert not {'github', 'jwt'} & set(sys.modules), 'PyGithub is loaded'",
+        ],
+        cwd=lambda_dir,
+        env={**environ, "AWS_DEFAULT_REGION": "us-east-1"},
+        check=True,
+    )
+
+
+@responses.activate
+def test_runners_are_looked_up_by_label(github_client):
+    responses.get(RUNNERS_URL, json={"runners": [_runner(1), _runner(2)]})
+    gha = github_client.github_actions("token", "infrahouse")
+
+    runner = gha.find_runner_by_label("instance_id:i-2")
+    assert (runner.runner_id, runner.name, runner.busy) == (2, "runner-2", False)
+    assert gha.find_runner_by_label("instance_id:i-3") is None
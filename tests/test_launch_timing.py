@@ -0,0 +1,93 @@
+import json
+from filecmp import cmp
+from os import path as osp
+from unittest import mock
+
+import pytest
+
+from tests.conftest import LAMBDA_ROOT_DIR
+from tests.test_runner_registration import registration  # noqa: F401
+
+LAUNCH_TIMING_COPIES = [
+    osp.join(LAMBDA_ROOT_DIR, name, "lambda", "launch_timing.py")
+    for name in ("runner_registration", "record_metric")
+]
+LAUNCHED_AT = 1735725600.0  # 2025-01-01T10:00:00Z
+
+
+@pytest.fixture
+def launch_timing(registration, monkeypatch):  # noqa: F811
+    clock = mock.Mock(return_value=LAUNCHED_AT)
+    monkeypatch.setattr(registration.launch_timing, "time", clock)
+    monkeypatch.setattr(registration.launch_timing, "_online_instance_ids", set())
+    return registration.launch_timing
+
+
+def _latencies(capsys):
+    """(stage, launch_type, seconds) of the LaunchLatency records."""
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    return [
+        (record["stage"], record["launch_type"], record["LaunchLatency"])
+        for record in records
+        if "LaunchLatency" in record
+    ]
+
+
+def _launch_event(instance_id, **detail):
+    return {
+        "detail-type": "EC2 Instance-launch Lifecycle Action",
+        "time": "2025-01-01T10:00:00Z",
+        "detail": {
+            "AutoScalingGroupName": "test-asg",
+            "LifecycleHookName": "registration",
+            "EC2InstanceId": instance_id,
+            **detail,
+        },
+    }
+
+
+@pytest.mark.parametrize("copy", LAUNCH_TIMING_COPIES[1:])
+def test_launch_timing_copies_are_identical(copy):
+    assert cmp(
+        LAUNCH_TIMING_COPIES[0], copy, shallow=False
+    ), f"{copy} differs from {LAUNCH_TIMING_COPIES[0]}"
+
+
+def test_launch_stages(registration, launch_timing, capsys):  # noqa: F811
+    launch_timing.time.return_value = LAUNCHED_AT + 5
+    launch_timing.record_registration(_launch_event("i-1"))
+    launch_timing.record_registration(_launch_event("i-2", Origin="WarmPool"))
+    # Not measured: no job waits for a launch into the warm pool.
+    launch_timing.record_registration(_launch_event("i-3", Destination="WarmPool"))
+
+    launch_successful = {
+        "detail-type": registration.LAUNCH_SUCCESSFUL,
+        "detail": {
+            "ActivityId": "activity-1",
+            "AutoScalingGroupName": "test-asg",
+            "EC2InstanceId": "i-1",
+            "StartTime": "2025-01-01T10:00:00Z",
+            "EndTime": "2025-01-01T10:03:20Z",
+        },
+    }
+    registration._handle_event(launch_successful)
+    # EventBridge delivered the event twice.
+    registration._handle_event(launch_successful)
+
+    launch_timing.time.return_value = LAUNCHED_AT + 240
+    runners = [
+        mock.Mock(instance_id=instance_id) for instance_id in ("i-1", "i-2", "i-4")
+    ]
+    launch_timing.record_online("test-asg", runners)
+    # Already online in the previous sample.
+    launch_timing.record_online("test-asg", runners)
+
+    assert sorted(_latencies(capsys)) == [
+        ("in_service", "cold", 200.0),
+        ("registration_hook", "cold", 5.0),
+        ("registration_hook", "resume", 5.0),
+        ("runner_online", "cold", 240.0),
+        ("runner_online", "resume", 240.0),
+    ]
+    # The launch times are forgotten once published.
+    assert registration.state_store.get_many(["launch#i-1", "launch#i-2"]) == {}
@@ -0,0 +1,514 @@
+import json
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import pytest
+import responses
+from requests import HTTPError, Response
+
+from tests.conftest import load_lambda
+
+
+@pytest.fixture
+def record_metric(monkeypatch):
+    monkeypatch.setenv("ASG_NAME", "test-asg")
+    monkeypatch.setenv("GITHUB_ORG_NAME", "infrahouse")
+    monkeypatch.setenv("GITHUB_SECRET", "github-secret")
+    monkeypatch.setenv("GITHUB_SECRET_TYPE", "token")
+    monkeypatch.setenv("GH_APP_ID", "1")
+    monkeypatch.setenv("INSTALLATION_ID", "test-installation")
+    module = load_lambda("record_metric")
+    monkeypatch.setattr(module, "_cloudwatch", mock.Mock())
+    return module
+
+
+def _http_error(status_code):
+    response = Response()
+    response.status_code = status_code
+    return HTTPError(f"{status_code} Client Error", response=response)
+
+
+def _mock_runners(monkeypatch, record_metric, busy=0, idle=0):
+    """Make GitHub report ``busy`` busy and ``idle`` idle online runners."""
+    runners = [
+        mock.Mock(
+            runner_id=index,
+            instance_id=f"i-{index:017x}",
+            status="online",
+            busy=index < busy,
+        )
+        for index in range(busy + idle)
+    ]
+    for runner in runners:
+        runner.name = f"runner-{runner.runner_id}"
+    monkeypatch.setattr(record_metric, "_list_runners", mock.Mock(return_value=runners))
+    return runners
+
+
+def test_token_is_reused_across_invocations(record_metric, monkeypatch):
+    get_secret = mock.Mock(return_value="pat")
+    monkeypatch.setattr(record_metric, "get_secret", get_secret)
+
+    assert record_metric._get_github_token("infrahouse") == "pat"
+    assert record_metric._get_github_token("infrahouse") == "pat"
+    get_secret.assert_called_once()
+
+
+def test_app_token_is_refreshed_before_expiry(record_metric, monkeypatch):
+    monkeypatch.setenv("GITHUB_SECRET_TYPE", "pem")
+    app_token = mock.Mock(side_effect=["token-1", "token-2"])
+    monkeypatch.setattr(record_metric.github_client, "app_token", app_token)
+    clock = mock.Mock(return_value=1000.0)
+    monkeypatch.setattr(record_metric, "time", clock)
+
+    assert record_metric._get_github_token("infrahouse") == "token-1"
+
+    # Still well within the token lifetime.
+    clock.return_value = 1000.0 + record_metric.GITHUB_APP_TOKEN_TTL / 2
+    assert record_metric._get_github_token("infrahouse") == "token-1"
+
+    # Inside the refresh margin: a new token is minted ahead of expiry.
+    clock.return_value = (
+        1000.0
+        + record_metric.GITHUB_APP_TOKEN_TTL
+        - record_metric.GITHUB_TOKEN_REFRESH_MARGIN
+    )
+    assert record_metric._get_github_token("infrahouse") == "token-2"
+    assert app_token.call_count == 2
+
+
+def test_401_invalidates_cached_token(record_metric, monkeypatch):
+    monkeypatch.setattr(
+        record_metric, "get_secret", mock.Mock(side_effect=["revoked", "fresh"])
+    )
+    seen_tokens = []
+
+    def find_runners_by_label(gha, label):
+        seen_tokens.append(gha.token)
+        if gha.token == "revoked":
+            raise _http_error(401)
+        return iter([])
+
+    monkeypatch.setattr(
+        record_metric.github_client.GitHubClient,
+        "find_runners_by_label",
+        find_runners_by_label,
+    )
+
+    record_metric.lambda_handler({}, None)
+
+    assert seen_tokens == ["revoked", "fresh"]
+    assert record_metric._get_github_token("infrahouse") == "fresh"
+
+
+def test_other_http_errors_are_raised(record_metric, monkeypatch):
+    monkeypatch.setattr(record_metric, "get_secret", mock.Mock(return_value="pat"))
+
+    def find_runners_by_label(gha, label):
+        raise _http_error(502)
+
+    monkeypatch.setattr(
+        record_metric.github_client.GitHubClient,
+        "find_runners_by_label",
+        find_runners_by_label,
+    )
+
+    with pytest.raises(HTTPError):
+        record_metric.lambda_handler({}, None)
+
+
+def test_sampling_mode_publishes_high_resolution_metrics(record_metric, monkeypatch):
+    monkeypatch.setenv("METRIC_SAMPLE_COUNT", "6")
+    monkeypatch.setenv("METRIC_SAMPLE_INTERVAL", "10")
+    _mock_runners(monkeypatch, record_metric, idle=2)
+    sleep = mock.Mock()
+    monkeypatch.setattr(record_metric, "sleep", sleep)
+
+    record_metric.lambda_handler({}, None)
+
+    put_metric_data = record_metric._cloudwatch.put_metric_data
+    assert put_metric_data.call_count == 6
+    assert sleep.call_count == 5
+    for call in put_metric_data.call_args_list:
+        for datum in call.kwargs["MetricData"]:
+            assert datum["StorageResolution"] == 1
+
+
+def test_sampling_stops_before_lambda_timeout(record_metric, monkeypatch):
+    monkeypatch.setenv("METRIC_SAMPLE_COUNT", "6")
+    monkeypatch.setenv("METRIC_SAMPLE_INTERVAL", "10")
+    _mock_runners(
+        monkeypatch,
+        record_metric,
+    )
+    monkeypatch.setattr(record_metric, "sleep", mock.Mock())
+    context = mock.Mock()
+    context.get_remaining_time_in_millis.return_value = 5000
+
+    record_metric.lambda_handler({}, context)
+
+    assert record_metric._cloudwatch.put_metric_data.call_count == 1
+
+
+def test_default_mode_publishes_standard_resolution(record_metric, monkeypatch):
+    _mock_runners(monkeypatch, record_metric, busy=1)
+
+    record_metric.lambda_handler({}, None)
+
+    metric_data = record_metric._cloudwatch.put_metric_data.call_args.kwargs[
+        "MetricData"
+    ]
+    assert {d["MetricName"]: d["Value"] for d in metric_data} == {
+        "BusyRunners": 1,
+        "IdleRunners": 0,
+    }
+    assert all(d["StorageResolution"] == 60 for d in metric_data)
+
+
+@pytest.mark.parametrize(
+    "job_labels, expected",
+    [
+        (["self-hosted", "linux", "x64"], True),
+        (["Self-Hosted", "Linux"], True),
+        (["self-hosted", "gpu"], False),
+        (["ubuntu-latest"], False),
+        ([], False),
+    ],
+)
+def test_job_targets_pool(record_metric, job_labels, expected):
+    pool_labels = {"self-hosted", "linux", "x64", "installation_id:test-installation"}
+    assert (
+        record_metric._job_targets_pool({"labels": job_labels}, pool_labels) is expected
+    )
+
+
+@responses.activate
+def test_count_queued_jobs(record_metric, monkeypatch):
+    monkeypatch.setattr(record_metric, "get_secret", mock.Mock(return_value="pat"))
+    api = "https://api.github.com/repos/infrahouse/backend/actions"
+    created_at = datetime.now(tz=timezone.utc) - timedelta(minutes=5)
+
+    def job(status, labels, age=timedelta()):
+        return {
+            "status": status,
+            "labels": labels,
+            "created_at": (created_at + age).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+
+    responses.get(
+        f"{api}/runs?status=queued&per_page=100",
+        json={"workflow_runs": [{"jobs_url": f"{api}/runs/1/jobs"}]},
+    )
+    responses.get(
+        f"{api}/runs?status=in_progress&per_page=100",
+        json={"workflow_runs": [{"jobs_url": f"{api}/runs/2/jobs"}]},
+    )
+    responses.get(
+        f"{api}/runs/1/jobs?filter=latest&per_page=100",
+        json={"jobs": [job("queued", ["self-hosted"], timedelta(minutes=1))]},
+        headers={"Link": f'<{api}/runs/1/jobs?page=2>; rel="next"'},
+    )
+    responses.get(
+        f"{api}/runs/1/jobs?page=2",
+        json={"jobs": [job("queued", ["ubuntu-latest"], timedelta(minutes=-10))]},
+    )
+    responses.get(
+        f"{api}/runs/2/jobs?filter=latest&per_page=100",
+        json={
+            "jobs": [
+                job("in_progress", ["self-hosted"]),
+                job("queued", ["self-hosted", "linux"]),
+            ]
+        },
+    )
+
+    queued, oldest_age = record_metric._count_queued_jobs(
+        "infrahouse", ["backend"], ["self-hosted", "linux", "x64"]
+    )
+
+    assert queued == 2
+    assert 299 <= oldest_age <= 305
+    assert responses.calls[0].request.headers["Authorization"] == "Bearer pat"
+
+
+def test_queued_jobs_are_published_once_per_invocation(record_metric, monkeypatch):
+    monkeypatch.setenv("METRIC_SAMPLE_COUNT", "3")
+    monkeypatch.setenv("METRIC_SAMPLE_INTERVAL", "20")
+    monkeypatch.setenv("QUEUED_JOBS_REPOSITORIES", '["backend"]')
+    monkeypatch.setenv("RUNNER_LABELS", '["self-hosted"]')
+    _mock_runners(
+        monkeypatch,
+        record_metric,
+    )
+    count_queued_jobs = mock.Mock(return_value=(4, 90.0))
+    monkeypatch.setattr(record_metric, "_count_queued_jobs", count_queued_jobs)
+    monkeypatch.setattr(record_metric, "sleep", mock.Mock())
+
+    record_metric.lambda_handler({}, None)
+
+    count_queued_jobs.assert_called_once_with(
+        "infrahouse", ["backend"], ["self-hosted"]
+    )
+    calls = record_metric._cloudwatch.put_metric_data.call_args_list
+    first = {d["MetricName"]: d for d in calls[0].kwargs["MetricData"]}
+    assert first["QueuedJobs"]["Value"] == 4
+    assert first["QueuedJobs"]["StorageResolution"] == 60
+    assert first["OldestQueuedJobAge"]["Unit"] == "Seconds"
+    for call in calls[1:]:
+        assert {d["MetricName"] for d in call.kwargs["MetricData"]} == {
+            "BusyRunners",
+            "IdleRunners",
+        }
+
+
+@pytest.mark.parametrize(
+    "current, busy, idle, queued, expected",
+    [
+        # A burst of 40 queued jobs gets 40 more runners in one step.
+        (3, 2, 1, 40, 43),
+        # Clamped to the ASG max size.
+        (3, 2, 1, 100, 50),
+        # Steady state.
+        (3, 2, 1, 0, 3),
+        # Half of the 9 surplus idle runners (rounded up) are removed,
+        # then half of what's left, and so on.
+        (12, 2, 10, 0, 7),
+        (7, 2, 5, 0, 5),
+        (5, 2, 3, 0, 4),
+        (4, 2, 2, 0, 3),
+        # Instances still booting aren't scaled in.
+        (10, 2, 1, 0, 10),
+        # Never below the ASG min size.
+        (3, 0, 3, 0, 2),
+    ],
+)
+def test_desired_capacity(record_metric, current, busy, idle, queued, expected):
+    assert (
+        record_metric._desired_capacity(
+            current,
+            min_size=2,
+            max_size=50,
+            busy=busy,
+            idle=idle,
+            queued=queued,
+            idle_target=1,
+            damping=0.5,
+        )
+        == expected
+    )
+
+
+def test_controller_mode_sets_desired_capacity(record_metric, monkeypatch):
+    monkeypatch.setenv("AUTOSCALING_MODE", "controller")
+    monkeypatch.setenv("IDLE_RUNNERS_TARGET_COUNT", "1")
+    monkeypatch.setenv("QUEUED_JOBS_REPOSITORIES", '["backend"]')
+    monkeypatch.setenv("RUNNER_LABELS", '["self-hosted"]')
+    _mock_runners(monkeypatch, record_metric, busy=2)
+    monkeypatch.setattr(
+        record_metric, "_count_queued_jobs", mock.Mock(return_value=(40, 120.0))
+    )
+    autoscaling = mock.Mock()
+    autoscaling.describe_auto_scaling_groups.return_value = {
+        "AutoScalingGroups": [{"DesiredCapacity": 2, "MinSize": 1, "MaxSize": 100}]
+    }
+    monkeypatch.setattr(record_metric, "_autoscaling", autoscaling)
+
+    record_metric.lambda_handler({}, None)
+
+    autoscaling.set_desired_capacity.assert_called_once_with(
+        AutoScalingGroupName="test-asg", DesiredCapacity=43, HonorCooldown=False
+    )
+
+
+def test_controller_keeps_queued_jobs_across_samples(record_metric, monkeypatch):
+    monkeypatch.setenv("AUTOSCALING_MODE", "controller")
+    monkeypatch.setenv("IDLE_RUNNERS_TARGET_COUNT", "1")
+    monkeypatch.setenv("METRIC_SAMPLE_COUNT", "3")
+    monkeypatch.setenv("QUEUED_JOBS_REPOSITORIES", '["backend"]')
+    monkeypatch.setenv("RUNNER_LABELS", '["self-hosted"]')
+    _mock_runners(monkeypatch, record_metric, busy=2)
+    monkeypatch.setattr(
+        record_metric, "_count_queued_jobs", mock.Mock(return_value=(40, 120.0))
+    )
+    monkeypatch.setattr(record_metric, "sleep", mock.Mock())
+    adjust_capacity = mock.Mock()
+    monkeypatch.setattr(record_metric, "_adjust_capacity", adjust_capacity)
+
+    record_metric.lambda_handler({}, None)
+
+    # Queued jobs are counted once, but the later samples don't scale in
+    # as if the queue had emptied.
+    record_metric._count_queued_jobs.assert_called_once()
+    assert [call.args[2] for call in adjust_capacity.call_args_list] == [40, 40, 40]
+
+
+def test_alarms_mode_leaves_capacity_alone(record_metric, monkeypatch):
+    _mock_runners(monkeypatch, record_metric, busy=2)
+    autoscaling = mock.Mock()
+    monkeypatch.setattr(record_metric, "_autoscaling", autoscaling)
+
+    record_metric.lambda_handler({}, None)
+
+    autoscaling.describe_auto_scaling_groups.assert_not_called()
+    autoscaling.set_desired_capacity.assert_not_called()
+
+
+def test_webhook_counters_replace_github_polling(record_metric, monkeypatch):
+    monkeypatch.setenv("METRIC_SAMPLE_COUNT", "6")
+    monkeypatch.setenv("METRIC_SAMPLE_INTERVAL", "10")
+    monkeypatch.setenv("QUEUED_JOBS_SOURCE", "webhook")
+    monkeypatch.setenv("QUEUED_JOBS_REPOSITORIES", '["backend"]')
+    monkeypatch.setenv("STATE_TABLE", "test-asg-state")
+    _mock_runners(
+        monkeypatch,
+        record_metric,
+    )
+    count_queued_jobs = mock.Mock()
+    monkeypatch.setattr(record_metric, "_count_queued_jobs", count_queued_jobs)
+    dynamodb = mock.Mock()
+    dynamodb.get_item.return_value = {"Item": {"queued": {"N": "7"}}}
+    monkeypatch.setattr(record_metric.state_store, "_dynamodb", dynamodb)
+
+    # Invoked by the webhook receiver: one sample, not a full sampling window.
+    record_metric.lambda_handler({"source": "webhook_receiver"}, None)
+
+    count_queued_jobs.assert_not_called()
+    put_metric_data = record_metric._cloudwatch.put_metric_data
+    put_metric_data.assert_called_once()
+    metric_data = {
+        d["MetricName"]: d["Value"]
+        for d in put_metric_data.call_args.kwargs["MetricData"]
+    }
+    assert metric_data == {"BusyRunners": 0, "IdleRunners": 0, "QueuedJobs": 7}
+    # Still high-resolution, like the scheduled runs the alarms evaluate.
+    assert {
+        d["StorageResolution"] for d in put_metric_data.call_args.kwargs["MetricData"]
+    } == {1}
+
+
+def test_emf_emitter_writes_log_lines(record_metric, monkeypatch, capsys):
+    monkeypatch.setenv("METRICS_EMITTER", "emf")
+    monkeypatch.setenv("QUEUED_JOBS_REPOSITORIES", '["backend"]')
+    monkeypatch.setenv("RUNNER_LABELS", '["self-hosted"]')
+    monkeypatch.setenv("METRIC_SAMPLE_COUNT", "2")
+    monkeypatch.setenv("METRIC_SAMPLE_INTERVAL", "30")
+    monkeypatch.setattr(record_metric, "sleep", mock.Mock())
+    _mock_runners(monkeypatch, record_metric, busy=3)
+    monkeypatch.setattr(
+        record_metric, "_count_queued_jobs", mock.Mock(return_value=(2, 45.0))
+    )
+
+    record_metric.lambda_handler({}, None)
+
+    record_metric._cloudwatch.put_metric_data.assert_not_called()
+    *records, init, put_metric_data = [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+    ]
+    # First sample: high-resolution runner counts and standard-resolution
+    # queued jobs go to separate records. Second sample: runner counts only.
+    assert [
+        {
+            m["Name"]: m["StorageResolution"]
+            for m in r["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+        }
+        for r in records
+    ] == [
+        {"BusyRunners": 1, "IdleRunners": 1},
+        {"QueuedJobs": 60, "OldestQueuedJobAge": 60},
+        {"BusyRunners": 1, "IdleRunners": 1},
+    ]
+    assert records[0]["BusyRunners"] == 3
+    # The invocation ends with the INIT duration of the cold start
+    # and the time spent publishing each sample.
+    assert init["phase"] == "init"
+    assert put_metric_data["phase"] == "put_metric_data"
+    assert len(put_metric_data["PhaseDuration"]) == 2
+
+
+def test_protect_busy_runners(record_metric, monkeypatch):
+    monkeypatch.setattr(record_metric, "_autoscaling", mock.Mock())
+    runners = [
+        mock.Mock(instance_id="i-busy", busy=True),
+        mock.Mock(instance_id="i-busy-protected", busy=True),
+        mock.Mock(instance_id="i-idle", busy=False),
+        mock.Mock(instance_id="i-idle-protected", busy=False),
+    ]
+    record_metric._autoscaling.describe_auto_scaling_groups.return_value = {
+        "AutoScalingGroups": [
+            {
+                "Instances": [
+                    {
+                        "InstanceId": instance_id,
+                        "LifecycleState": lifecycle_state,
+                        "ProtectedFromScaleIn": protected,
+                    }
+                    for instance_id, lifecycle_state, protected in [
+                        ("i-busy", "InService", False),
+                        ("i-busy-protected", "InService", True),
+                        ("i-idle", "InService", False),
+                        ("i-idle-protected", "InService", True),
+                        # Not registered yet, or on its way out: leave alone.
+                        ("i-pending", "Pending", False),
+                        ("i-terminating", "Terminating:Wait", True),
+                    ]
+                ]
+            }
+        ]
+    }
+
+    record_metric._protect_busy_runners("test-asg", runners)
+
+    assert record_metric._autoscaling.set_instance_protection.call_args_list == [
+        mock.call(
+            AutoScalingGroupName="test-asg",
+            InstanceIds=["i-busy"],
+            ProtectedFromScaleIn=True,
+        ),
+        mock.call(
+            AutoScalingGroupName="test-asg",
+            InstanceIds=["i-idle-protected"],
+            ProtectedFromScaleIn=False,
+        ),
+    ]
+
+
+def test_protect_busy_runners_in_batches(record_metric, monkeypatch):
+    monkeypatch.setattr(record_metric, "INSTANCE_PROTECTION_BATCH_SIZE", 2)
+    monkeypatch.setattr(record_metric, "_autoscaling", mock.Mock())
+    runners = [mock.Mock(instance_id=f"i-{index}", busy=True) for index in range(5)]
+    record_metric._autoscaling.describe_auto_scaling_groups.return_value = {
+        "AutoScalingGroups": [
+            {
+                "Instances": [
+                    {
+                        "InstanceId": runner.instance_id,
+                        "LifecycleState": "InService",
+                        "ProtectedFromScaleIn": False,
+                    }
+                    for runner in runners
+                ]
+            }
+        ]
+    }
+
+    record_metric._protect_busy_runners("test-asg", runners)
+
+    assert [
+        call.kwargs["InstanceIds"]
+        for call in record_metric._autoscaling.set_instance_protection.call_args_list
+    ] == [["i-0", "i-1"], ["i-2", "i-3"], ["i-4"]]
+
+
+def test_busy_runners_are_protected_only_when_enabled(record_metric, monkeypatch):
+    _mock_runners(monkeypatch, record_metric, busy=1)
+    protect = mock.Mock()
+    monkeypatch.setattr(record_metric, "_protect_busy_runners", protect)
+
+    record_metric.lambda_handler({}, None)
+    protect.assert_not_called()
+
+    monkeypatch.setenv("PROTECT_BUSY_RUNNERS", "true")
+    record_metric.lambda_handler({}, None)
+    protect.assert_called_once_with(
+        "test-asg", record_metric._list_runners.return_value
+    )
@@ -0,0 +1,285 @@
+import json
+from threading import Barrier
+from unittest import mock
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+from requests import HTTPError
+
+from tests.conftest import load_lambda
+
+
+@pytest.fixture
+def deregistration(monkeypatch):
+    monkeypatch.setenv("ASG_NAME", "test-asg")
+    monkeypatch.setenv("GITHUB_ORG_NAME", "infrahouse")
+    monkeypatch.setenv("GITHUB_SECRET", "github-secret")
+    monkeypatch.setenv("GITHUB_SECRET_TYPE", "token")
+    monkeypatch.setenv("GH_APP_ID", "1")
+    monkeypatch.setenv("INSTALLATION_ID", "test-installation")
+    monkeypatch.setenv("REGISTRATION_TOKEN_SECRET_PREFIX", "GH-reg-token-abc")
+    module = load_lambda("runner_deregistration")
+    monkeypatch.setattr(module, "_autoscaling", mock.Mock())
+    monkeypatch.setattr(module, "_ssm", mock.Mock())
+    return module
+
+
+def _asg_instance(lifecycle_state):
+    return mock.Mock(asg_name="test-asg", lifecycle_state=lifecycle_state)
+
+
+def _records(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def _http_error(status_code, headers=None):
+    response = mock.Mock(status_code=status_code, headers=headers or {})
+    return HTTPError(f"{status_code} Client Error", response=response)
+
+
+def _runner(name, instance_id, status="online", busy=False):
+    runner = mock.Mock(
+        instance_id=instance_id,
+        status=status,
+        busy=busy,
+        labels=[f"instance_id:{instance_id}", "installation_id:test-installation"],
+    )
+    runner.name = name
+    return runner
+
+
+@pytest.mark.parametrize(
+    "lifecycle_state, runner, deregister_error, ssm_error, expected",
+    [
+        ("Warmed:Terminating:Wait", None, None, None, "CONTINUE"),
+        ("Terminating:Wait", None, None, None, "DEFERRED"),
+        ("Terminating:Wait", None, None, "InvalidInstanceId", "CONTINUE"),
+        # Idle runners are deregistered right away, busy ones are stopped over SSM.
+        ("Terminating:Wait", _runner("r", "i-0123456789"), None, None, "CONTINUE"),
+        (
+            "Terminating:Wait",
+            _runner("r", "i-0123456789", busy=True),
+            None,
+            None,
+            "DEFERRED",
+        ),
+        (
+            "Terminating:Wait",
+            _runner("r", "i-0123456789", "offline"),
+            None,
+            None,
+            "DEFERRED",
+        ),
+        (
+            "Terminating:Wait",
+            _runner("r", "i-0123456789"),
+            _http_error(422),
+            None,
+            "DEFERRED",
+        ),
+    ],
+)
+def test_deregistration_hook_result(
+    deregistration,
+    monkeypatch,
+    lifecycle_state,
+    runner,
+    deregister_error,
+    ssm_error,
+    expected,
+):
+    monkeypatch.setattr(
+        deregistration,
+        "ASGInstance",
+        mock.Mock(return_value=_asg_instance(lifecycle_state)),
+    )
+    gha = mock.Mock()
+    gha.runners = [runner] if runner else []
+    gha.deregister_runner.side_effect = deregister_error
+    if ssm_error:
+        deregistration._ssm.send_command.side_effect = ClientError(
+            {"Error": {"Code": ssm_error}}, "SendCommand"
+        )
+
+    assert deregistration._handle_deregistration_hook("i-0123456789", gha) == expected
+    assert deregistration._autoscaling.complete_lifecycle_action.called == (
+        expected == "CONTINUE"
+    )
+    assert deregistration._ssm.send_command.called == (
+        expected == "DEFERRED" or ssm_error is not None
+    )
+
+
+def test_deregistration_hook_emits_metrics(deregistration, monkeypatch, capsys):
+    get_secret = mock.Mock(return_value="pat")
+    monkeypatch.setattr(deregistration, "get_secret", get_secret)
+    monkeypatch.setattr(deregistration, "Secret", mock.Mock())
+    monkeypatch.setattr(
+        deregistration,
+        "ASGInstance",
+        mock.Mock(return_value=_asg_instance("Warmed:Terminating:Wait")),
+    )
+
+    deregistration.lambda_handler(
+        {
+            "time": "2024-08-19T14:02:11Z",
+            "detail": {
+                "LifecycleHookName": "deregistration",
+                "LifecycleActionToken": "b9ac7d2b-8e1f-4a5c-9d3e-6f0a1b2c3d4e",
+                "EC2InstanceId": "i-0123456789",
+                "AutoScalingGroupName": "test-asg",
+            },
+        },
+        None,
+    )
+
+    results, latency, *phases = _records(capsys)
+    assert (results["hook"], results["result"]) == ("deregistration", "CONTINUE")
+    assert "LifecycleHookLatency" in latency
+    # The first invocation after a cold start also publishes the INIT duration.
+    assert {record["phase"] for record in phases} == {
+        "init",
+        "state_table_claim",
+        "registration_token",
+        "asg_instance_lookup",
+        "complete_lifecycle_action",
+    }
+    # A warm-pool trim doesn't need GitHub.
+    get_secret.assert_not_called()
+
+
+def test_clean_runners_resolves_states_in_batches(deregistration, monkeypatch, capsys):
+    monkeypatch.setattr(deregistration, "DESCRIBE_INSTANCES_BATCH_SIZE", 2)
+    with mock_aws():
+        ec2 = boto3.client("ec2", region_name="us-east-1")
+        monkeypatch.setattr(deregistration, "_ec2", ec2)
+        running, terminated = [
+            instance["InstanceId"]
+            for instance in ec2.run_instances(
+                ImageId="ami-12c6146b", MinCount=2, MaxCount=2
+            )["Instances"]
+        ]
+        ec2.terminate_instances(InstanceIds=[terminated])
+        runners = [
+            _runner("running", running),
+            _runner("terminated", terminated),
+            _runner("gone", "i-0000000000000dead"),
+            # No instance_id label: not known to be stale.
+            _runner("unlabeled", None),
+        ]
+        gha = mock.Mock()
+        gha.runners = runners
+
+        deregistration._clean_runners(gha, "test-installation")
+
+    assert gha.deregister_runner.call_args_list == [
+        mock.call(runners[1]),
+        mock.call(runners[2]),
+    ]
+    (deregistered,) = _records(capsys)
+    assert deregistered["RunnersDeregistered"] == 2
+
+
+@pytest.mark.parametrize(
+    "errors, expected, attempts",
+    [
+        ([], "deregistered", 1),
+        ([_http_error(404)], "not_found", 1),
+        ([_http_error(429, {"Retry-After": "1"})], "deregistered", 2),
+        ([_http_error(403, {"Retry-After": "0"})] * 2, "deregistered", 3),
+        ([_http_error(403, {"X-RateLimit-Remaining": "0"})] * 4, "failed", 4),
+        # Not a rate limit: a missing permission.
+        ([_http_error(403)], "failed", 1),
+        ([_http_error(429, {"Retry-After": "60"})], "failed", 1),
+        ([_http_error(500)], "failed", 1),
+    ],
+)
+def test_deregister_runner_backs_off(
+    deregistration, monkeypatch, errors, expected, attempts
+):
+    monkeypatch.setattr(deregistration, "_rate_limited_until", 0.0)
+    monkeypatch.setattr(deregistration, "sleep", mock.Mock())
+    gha = mock.Mock()
+    gha.deregister_runner.side_effect = [*errors, None]
+
+    assert deregistration._deregister_runner(gha, _runner("r", "i-1")) == expected
+    assert gha.deregister_runner.call_count == attempts
+
+
+def test_clean_runners_deregisters_in_parallel(deregistration, monkeypatch, capsys):
+    monkeypatch.setenv("DEREGISTRATION_CONCURRENCY", "4")
+    runners = [_runner(f"runner-{i}", f"i-{i}") for i in range(9)]
+    monkeypatch.setattr(deregistration, "_instance_states", mock.Mock(return_value={}))
+    # Every deregistration waits until four of them run at the same time.
+    barrier = Barrier(4, timeout=5)
+    gha = mock.Mock()
+    gha.runners = runners
+    gha.deregister_runner.side_effect = lambda runner: (
+        barrier.wait() if runner.name != "runner-8" else _raise(_http_error(500))
+    )
+
+    results = deregistration._clean_runners(gha, "test-installation")
+
+    assert results == {
+        **{f"runner-{i}": "deregistered" for i in range(8)},
+        "runner-8": "failed",
+    }
+    (record,) = [
+        record for record in _records(capsys) if "RunnersDeregistered" in record
+    ]
+    assert record["RunnersDeregistered"] == 8
+    assert record["RunnerDeregistrationFailures"] == 1
+    assert record["results"] == results
+
+
+def _raise(err):
+    raise err
+
+
+def test_duplicate_lifecycle_event_is_skipped(deregistration, monkeypatch, capsys):
+    monkeypatch.setenv("LAMBDA_TIMEOUT", "300")
+    claims = {}
+    leases = []
+
+    def claim(key, ttl):
+        if key in claims:
+            return False
+        claims[key] = ttl
+        leases.append(ttl)
+        return True
+
+    def extend(key, ttl):
+        claims[key] = ttl
+
+    monkeypatch.setattr(deregistration.state_store, "claim", claim)
+    monkeypatch.setattr(deregistration.state_store, "extend", extend)
+    monkeypatch.setattr(
+        deregistration.state_store, "release", lambda key: claims.pop(key, None)
+    )
+    handle = mock.Mock(side_effect=[RuntimeError("SSM is down"), "DEFERRED"])
+    monkeypatch.setattr(deregistration, "_handle_lifecycle_action", handle)
+    event = {
+        "detail": {
+            "LifecycleHookName": "deregistration",
+            "LifecycleActionToken": "b9ac7d2b-8e1f-4a5c-9d3e-6f0a1b2c3d4e",
+            "EC2InstanceId": "i-0123456789",
+            "AutoScalingGroupName": "test-asg",
+        },
+    }
+
+    # A failed attempt releases its claim, so the retry runs the hook.
+    with pytest.raises(RuntimeError):
+        deregistration.lambda_handler(event, None)
+    deregistration.lambda_handler(event, None)
+    deregistration.lambda_handler(event, None)
+
+    assert handle.call_count == 2
+    # Claimed for the function timeout while handled, for 48 hours once done.
+    assert leases == [300, 300]
+    assert list(claims.values()) == [deregistration.state_store.LIFECYCLE_CLAIM_TTL]
+    assert [record["result"] for record in _records(capsys) if "result" in record] == [
+        "DEFERRED",
+        "DUPLICATE",
+    ]
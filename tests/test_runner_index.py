@@ -0,0 +1,98 @@
+from filecmp import cmp
+from os import path as osp
+from unittest import mock
+
+import pytest
+
+from tests.conftest import LAMBDA_ROOT_DIR, load_lambda
+
+RUNNER_INDEX_COPIES = [
+    osp.join(LAMBDA_ROOT_DIR, name, "lambda", "runner_index.py")
+    for name in ("runner_registration", "runner_deregistration")
+]
+
+
+@pytest.fixture
+def runner_index(monkeypatch):
+    load_lambda("runner_registration")
+    import runner_index
+
+    clock = mock.Mock(return_value=1000.0)
+    monkeypatch.setattr(runner_index, "monotonic", clock)
+    return runner_index
+
+
+@pytest.mark.parametrize("copy", RUNNER_INDEX_COPIES[1:])
+def test_runner_index_copies_are_identical(copy):
+    assert cmp(
+        RUNNER_INDEX_COPIES[0], copy, shallow=False
+    ), f"{copy} differs from {RUNNER_INDEX_COPIES[0]}"
+
+
+def _runner(instance_id):
+    return mock.Mock(labels=[f"instance_id:{instance_id}", "installation_id:abc"])
+
+
+def _gha(*runners):
+    """GitHubActions that counts how many times the runners are listed."""
+    gha = mock.Mock()
+    gha.listings = mock.PropertyMock(side_effect=lambda: iter(runners))
+    type(gha).runners = gha.listings
+    return gha
+
+
+def test_lookups_reuse_listing(runner_index):
+    runners = [_runner("i-1"), _runner("i-2")]
+    gha = _gha(*runners)
+
+    assert runner_index.find_runner(gha, "instance_id:i-2") is runners[1]
+    assert runner_index.find_runner(gha, "instance_id:i-3") is None
+    assert runner_index.find_runners(gha, "installation_id:abc") == runners
+    assert gha.listings.call_count == 1
+
+
+def test_listing_expires(runner_index):
+    gha = _gha(_runner("i-1"))
+
+    runner_index.find_runner(gha, "instance_id:i-1")
+    runner_index.monotonic.return_value += runner_index.INDEX_TTL
+    runner_index.find_runner(gha, "instance_id:i-1")
+    assert gha.listings.call_count == 1
+
+    runner_index.monotonic.return_value += 1
+    runner_index.find_runner(gha, "instance_id:i-1")
+    assert gha.listings.call_count == 2
+
+    runner_index.find_runner(gha, "instance_id:i-1", max_age=0)
+    assert gha.listings.call_count == 2
+    runner_index.monotonic.return_value += 0.1
+    runner_index.find_runner(gha, "instance_id:i-1", max_age=0)
+    assert gha.listings.call_count == 3
+
+
+def test_forget_and_invalidate(runner_index):
+    runners = [_runner("i-1"), _runner("i-2")]
+    gha = _gha(*runners)
+
+    runner_index.forget(runner_index.find_runner(gha, "instance_id:i-1"))
+    assert runner_index.find_runner(gha, "instance_id:i-1") is None
+    assert runner_index.find_runners(gha, "installation_id:abc") == runners[1:]
+    assert gha.listings.call_count == 1
+
+    runner_index.invalidate()
+    assert runner_index.find_runner(gha, "instance_id:i-1") is runners[0]
+    assert gha.listings.call_count == 2
+
+
+def test_failed_listing_is_not_kept(runner_index):
+    def listing():
+        yield _runner("i-1")
+        raise RuntimeError("GitHub is down")
+
+    gha = mock.Mock()
+    type(gha).runners = mock.PropertyMock(side_effect=listing)
+
+    with pytest.raises(RuntimeError):
+        runner_index.find_runner(gha, "instance_id:i-2")
+    type(gha).runners = mock.PropertyMock(return_value=[])
+    assert runner_index.find_runner(gha, "instance_id:i-1") is None
@@ -0,0 +1,348 @@
+import json
+from time import time
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.conftest import load_lambda
+
+STATE_TABLE = "test-asg-state"
+
+
+@pytest.fixture
+def registration(monkeypatch):
+    monkeypatch.setenv("ASG_NAME", "test-asg")
+    monkeypatch.setenv("GITHUB_ORG_NAME", "infrahouse")
+    monkeypatch.setenv("GITHUB_SECRET", "github-secret")
+    monkeypatch.setenv("GITHUB_SECRET_TYPE", "token")
+    monkeypatch.setenv("GH_APP_ID", "1")
+    monkeypatch.setenv("REGISTRATION_TOKEN_SECRET_PREFIX", "GH-reg-token-abc")
+    monkeypatch.setenv("LAMBDA_TIMEOUT", "900")
+    monkeypatch.setenv("STATE_TABLE", STATE_TABLE)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("dynamodb").create_table(
+            TableName=STATE_TABLE,
+            KeySchema=[{"AttributeName": "pk", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "pk", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        module = load_lambda("runner_registration")
+        monkeypatch.setattr(module, "sleep", mock.Mock())
+        yield module
+
+
+def _gha(*tokens, clock=time):
+    """
+    GitHubClient whose create_registration_token() returns ``tokens``,
+    each valid for an hour from ``clock()``.
+    """
+    tokens = iter(tokens)
+    gha = mock.Mock()
+    gha.mint = gha.create_registration_token
+    gha.mint.side_effect = lambda: (next(tokens), clock() + 3600)
+    return gha
+
+
+def _runner(instance_id, status="online"):
+    return mock.Mock(status=status, labels=[f"instance_id:{instance_id}"])
+
+
+def _forget_warm_cache(registration):
+    registration._registration_token = None
+    registration._registration_token_expires_at = 0.0
+
+
+def test_registration_token_is_reused(registration):
+    gha = _gha("token-1", "token-2")
+
+    assert registration._get_registration_token(gha) == "token-1"
+    # Warm Lambda cache.
+    assert registration._get_registration_token(gha) == "token-1"
+    # Another Lambda instance reads it from the pooled secret,
+    # not from the state table.
+    _forget_warm_cache(registration)
+    assert registration._get_registration_token(gha) == "token-1"
+
+    assert gha.mint.call_count == 1
+    secret = boto3.client("secretsmanager").get_secret_value(
+        SecretId="GH-reg-token-abc.pool"
+    )
+    assert json.loads(secret["SecretString"])["token"] == "token-1"
+    items = boto3.client("dynamodb").scan(TableName=STATE_TABLE)["Items"]
+    assert "token-1" not in json.dumps(items)
+
+
+def test_registration_token_is_minted_again_before_expiry(registration, monkeypatch):
+    clock = mock.Mock(return_value=1000.0)
+    monkeypatch.setattr(registration, "time", clock)
+    monkeypatch.setattr(registration.state_store, "time", clock)
+    gha = _gha("token-1", "token-2", clock=clock)
+
+    assert registration._get_registration_token(gha) == "token-1"
+    # Another Lambda instance.
+    _forget_warm_cache(registration)
+    clock.return_value = 1000.0 + 3600 - registration.REGISTRATION_TOKEN_MIN_LIFETIME
+    assert registration._get_registration_token(gha) == "token-1"
+    # An instance that got the token now might not register before it expires.
+    clock.return_value += 1
+    assert registration._get_registration_token(gha) == "token-2"
+    _forget_warm_cache(registration)
+    assert registration._get_registration_token(gha) == "token-2"
+
+
+def test_registration_token_waits_for_concurrent_mint(registration):
+    # Another invocation holds the lock and stores its token a second later.
+    registration.state_store.claim(registration.REGISTRATION_TOKEN_LOCK_KEY, 10)
+    registration.sleep.side_effect = (
+        lambda _: registration._pooled_token_secret().create(
+            {"token": "token-0", "expires_at": registration.time() + 3600}
+        )
+    )
+    gha = _gha("token-1")
+
+    assert registration._get_registration_token(gha) == "token-0"
+    assert gha.mint.call_count == 0
+
+
+def test_registration_token_is_minted_if_lock_holder_fails(registration):
+    registration.state_store.claim(registration.REGISTRATION_TOKEN_LOCK_KEY, 10)
+    gha = _gha("token-1")
+
+    assert registration._get_registration_token(gha) == "token-1"
+    assert registration.sleep.call_count == registration.REGISTRATION_TOKEN_LOCK_WAIT
+
+
+def test_registration_hook_stores_pooled_token(registration, monkeypatch):
+    asg = mock.Mock()
+    monkeypatch.setattr(registration, "ASG", mock.Mock(return_value=asg))
+    gha = _gha("token-1")
+    gha.runners = []
+
+    for instance_id in ("i-1", "i-2"):
+        result = registration._handle_registration_hook(
+            mock.Mock(instance_id=instance_id), "registration", gha
+        )
+        assert result == "CONTINUE"
+
+    secretsmanager = boto3.client("secretsmanager")
+    assert [
+        secretsmanager.get_secret_value(SecretId=f"GH-reg-token-abc-{instance_id}")[
+            "SecretString"
+        ]
+        for instance_id in ("i-1", "i-2")
+    ] == ["token-1", "token-1"]
+    assert asg.complete_lifecycle_action.call_count == 2
+
+
+def test_registration_hook_confirms_runner_before_deleting_token(
+    registration, monkeypatch
+):
+    monkeypatch.setattr(registration, "ASG", mock.Mock())
+    # The index still has the runner the stale sweep deregistered.
+    monkeypatch.setattr(
+        registration.runner_index, "find_runner", mock.Mock(return_value=_runner("i-1"))
+    )
+    gha = _gha("token-1")
+    gha.find_runner_by_label.return_value = None
+
+    registration._handle_registration_hook(
+        mock.Mock(instance_id="i-1"), "registration", gha
+    )
+
+    gha.find_runner_by_label.assert_called_once_with("instance_id:i-1")
+    secret = boto3.client("secretsmanager").get_secret_value(
+        SecretId="GH-reg-token-abc-i-1"
+    )
+    assert secret["SecretString"] == "token-1"
+
+
+def _lifecycle_message(instance_id, hook_name="registration"):
+    """SQS message that holds an EventBridge launch lifecycle event."""
+    return {
+        "messageId": f"message-{instance_id}",
+        "body": json.dumps(
+            {
+                "detail-type": "EC2 Instance-launch Lifecycle Action",
+                "detail": {
+                    "AutoScalingGroupName": "test-asg",
+                    "LifecycleActionToken": f"token-{instance_id}",
+                    "LifecycleHookName": hook_name,
+                    "EC2InstanceId": instance_id,
+                },
+            }
+        ),
+    }
+
+
+def test_batch_lists_runners_once(registration, monkeypatch):
+    gha = mock.Mock()
+    gha.runners = [mock.Mock(instance_id="i-2")]
+    monkeypatch.setattr(registration, "_github_actions", mock.Mock(return_value=gha))
+    monkeypatch.setattr(registration, "ASGInstance", mock.Mock())
+    hook = mock.Mock(return_value="CONTINUE")
+    monkeypatch.setattr(registration, "_handle_registration_hook", hook)
+
+    response = registration.lambda_handler(
+        {"Records": [_lifecycle_message("i-1"), _lifecycle_message("i-2")]}, None
+    )
+
+    assert response == {"batchItemFailures": []}
+    registration._github_actions.assert_called_once_with()
+    runners = {"i-2": gha.runners[0]}
+    assert [call.args[2:] for call in hook.call_args_list] == [
+        (gha, runners),
+        (gha, runners),
+    ]
+    monkeypatch.setattr(registration.runner_index, "find_runner", mock.Mock())
+    assert registration._find_runner(gha, "i-1", runners) is None
+    assert registration._find_runner(gha, "i-2", runners) is gha.runners[0]
+    registration.runner_index.find_runner.assert_not_called()
+
+
+def test_batch_reports_failed_messages(registration, monkeypatch):
+    gha = mock.Mock(runners=[])
+    monkeypatch.setattr(registration, "_github_actions", mock.Mock(return_value=gha))
+    monkeypatch.setattr(registration, "ASGInstance", mock.Mock())
+    monkeypatch.setattr(
+        registration,
+        "_handle_registration_hook",
+        mock.Mock(side_effect=["CONTINUE", RuntimeError("boom"), "CONTINUE"]),
+    )
+    messages = [_lifecycle_message(f"i-{index}") for index in range(3)]
+
+    response = registration.lambda_handler({"Records": messages}, None)
+    assert response == {"batchItemFailures": [{"itemIdentifier": "message-i-1"}]}
+
+    # SQS redelivers the failed message; its claim was released.
+    registration._handle_registration_hook.side_effect = ["CONTINUE"]
+    response = registration.lambda_handler({"Records": messages}, None)
+    assert response == {"batchItemFailures": []}
+    assert registration._handle_registration_hook.call_count == 4
+
+
+@pytest.fixture
+def bootstrap_clock(registration, monkeypatch):
+    """A clock that sleep() advances."""
+    clock = mock.Mock(return_value=1000.0)
+
+    def advance(seconds):
+        clock.return_value += seconds
+
+    monkeypatch.setattr(registration, "monotonic", clock)
+    monkeypatch.setattr(registration.runner_index, "monotonic", clock)
+    registration.sleep.side_effect = advance
+    clock.advance = advance
+    return clock
+
+
+def _listings(clock, *listings):
+    """
+    A ``runners`` property that returns ``listings``, each taking a second.
+    """
+    listings = iter(listings)
+
+    def list_runners():
+        clock.advance(1)
+        return next(listings)
+
+    return mock.PropertyMock(side_effect=list_runners)
+
+
+def test_bootstrap_hook_waits_for_runner_online(
+    registration, bootstrap_clock, monkeypatch
+):
+    asg = mock.Mock()
+    monkeypatch.setattr(registration, "ASG", mock.Mock(return_value=asg))
+    gha = mock.Mock()
+    # A poll reuses the previous listing if it's at most 10 seconds old,
+    # or if no time passed between the listing and the previous poll.
+    gha.listings = _listings(
+        bootstrap_clock, [], [_runner("i-1", "offline")], [_runner("i-1", "online")]
+    )
+    type(gha).runners = gha.listings
+
+    result = registration._handle_bootstrap_hook(
+        mock.Mock(instance_id="i-1"), "bootstrap", gha, wait_timeout=600
+    )
+
+    assert result == "CONTINUE"
+    assert registration.sleep.call_args_list == [
+        mock.call(2),
+        mock.call(4),
+        mock.call(8),
+        mock.call(16),
+        mock.call(30),
+    ]
+    assert gha.listings.call_count == 3
+    asg.complete_lifecycle_action.assert_called_once_with(
+        hook_name="bootstrap", result="CONTINUE", instance_id="i-1"
+    )
+
+
+def test_bootstrap_hook_polls_snapshot_taken_since_previous_poll(
+    registration, bootstrap_clock, monkeypatch
+):
+    asg = mock.Mock()
+    monkeypatch.setattr(registration, "ASG", mock.Mock(return_value=asg))
+    gha = mock.Mock()
+    gha.listings = _listings(bootstrap_clock, [])
+    type(gha).runners = gha.listings
+    online = mock.Mock(runner_id=1, instance_id="i-1", status="online", busy=False)
+    online.name = "runner-1"
+
+    def record_metric(seconds):
+        bootstrap_clock.advance(seconds)
+        registration.runner_index.runner_snapshot.save([online], "123")
+
+    registration.sleep.side_effect = record_metric
+
+    result = registration._handle_bootstrap_hook(
+        mock.Mock(instance_id="i-1"), "bootstrap", gha, wait_timeout=600
+    )
+
+    assert result == "CONTINUE"
+    assert gha.listings.call_count == 1
+    asg.complete_lifecycle_action.assert_called_once_with(
+        hook_name="bootstrap", result="CONTINUE", instance_id="i-1"
+    )
+
+
+def test_bootstrap_hook_polls_within_budget(registration, bootstrap_clock, monkeypatch):
+    asg = mock.Mock()
+    monkeypatch.setattr(registration, "ASG", mock.Mock(return_value=asg))
+    gha = mock.Mock(runners=[])
+
+    result = registration._handle_bootstrap_hook(
+        mock.Mock(instance_id="i-1"), "bootstrap", gha, wait_timeout=100
+    )
+
+    assert result == registration.emf.RESULT_DEFERRED
+    assert [call.args[0] for call in registration.sleep.call_args_list] == [
+        2,
+        4,
+        8,
+        16,
+        30,
+        30,
+        10,
+    ]
+    asg.complete_lifecycle_action.assert_not_called()
+
+
+def test_bootstrap_hook_completed_by_instance(registration, monkeypatch):
+    asg = mock.Mock()
+    asg.complete_lifecycle_action.side_effect = registration.ClientError(
+        {"Error": {"Code": "ValidationError", "Message": "No active Lifecycle Action"}},
+        "CompleteLifecycleAction",
+    )
+    monkeypatch.setattr(registration, "ASG", mock.Mock(return_value=asg))
+    gha = mock.Mock(runners=[_runner("i-1", "online")])
+
+    result = registration._handle_bootstrap_hook(
+        mock.Mock(instance_id="i-1"), "bootstrap", gha, wait_timeout=600
+    )
+
+    assert result == registration.emf.RESULT_DEFERRED
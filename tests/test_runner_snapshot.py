@@ -0,0 +1,100 @@
+from filecmp import cmp
+from os import path as osp
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.conftest import LAMBDA_ROOT_DIR, load_lambda
+
+RUNNER_SNAPSHOT_COPIES = [
+    osp.join(LAMBDA_ROOT_DIR, name, "lambda", "runner_snapshot.py")
+    for name in (
+        "record_metric",
+        "runner_registration",
+        "runner_deregistration",
+        "webhook_receiver",
+    )
+]
+STATE_TABLE = "test-asg-state"
+
+
+@pytest.fixture
+def record_metric(monkeypatch):
+    monkeypatch.setenv("ASG_NAME", "test-asg")
+    monkeypatch.setenv("GITHUB_ORG_NAME", "infrahouse")
+    monkeypatch.setenv("GITHUB_SECRET", "github-secret")
+    monkeypatch.setenv("GITHUB_SECRET_TYPE", "token")
+    monkeypatch.setenv("INSTALLATION_ID", "test-installation")
+    monkeypatch.setenv("STATE_TABLE", STATE_TABLE)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("dynamodb").create_table(
+            TableName=STATE_TABLE,
+            KeySchema=[{"AttributeName": "pk", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "pk", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        module = load_lambda("record_metric")
+        monkeypatch.setattr(module, "_cloudwatch", mock.Mock())
+        yield module
+
+
+@pytest.mark.parametrize("copy", RUNNER_SNAPSHOT_COPIES[1:])
+def test_runner_snapshot_copies_are_identical(copy):
+    assert cmp(
+        RUNNER_SNAPSHOT_COPIES[0], copy, shallow=False
+    ), f"{copy} differs from {RUNNER_SNAPSHOT_COPIES[0]}"
+
+
+def _runner(runner_id, instance_id, status="online", busy=False):
+    runner = mock.Mock(
+        runner_id=runner_id, instance_id=instance_id, status=status, busy=busy
+    )
+    runner.name = f"runner-{runner_id}"
+    return runner
+
+
+def test_lifecycle_lambdas_read_record_metric_snapshot(record_metric, monkeypatch):
+    runners = [
+        _runner(1, "i-1", busy=True),
+        _runner(2, "i-2"),
+        _runner(3, "i-3", status="offline"),
+    ]
+    monkeypatch.setattr(record_metric, "_list_runners", mock.Mock(return_value=runners))
+    record_metric.lambda_handler({}, None)
+
+    registration = load_lambda("runner_registration")
+    # Listing the runners in GitHub would fail.
+    gha = mock.Mock(spec=[])
+    assert registration._find_runner(gha, "i-1") == (
+        1,
+        "runner-1",
+        "i-1",
+        "online",
+        True,
+        ("installation_id:test-installation", "instance_id:i-1"),
+    )
+    assert registration._find_runner(gha, "i-3").status == "offline"
+    assert registration._find_runner(gha, "i-4") is None
+
+    deregistration = load_lambda("runner_deregistration")
+    runner_ids = [
+        runner.runner_id
+        for runner in deregistration.runner_index.find_runners(
+            gha, "installation_id:test-installation"
+        )
+    ]
+    assert runner_ids == [1, 2, 3]
+
+
+def test_stale_snapshot_is_ignored(record_metric, monkeypatch):
+    clock = mock.Mock(return_value=1000.0)
+    monkeypatch.setattr(record_metric.runner_snapshot, "time", clock)
+    record_metric.runner_snapshot.save([_runner(1, "i-1")], "test-installation")
+
+    clock.return_value += 60
+    runners, age = record_metric.runner_snapshot.load(90)
+    assert ([runner.runner_id for runner in runners], age) == ([1], 60)
+    assert record_metric.runner_snapshot.load(30) is None
@@ -0,0 +1,163 @@
+import json
+from itertools import product
+
+import pytest
+from requests import Session
+
+from simulator import autoscaling
+from simulator.fake_github import FakeGitHub
+from simulator.lifecycle import LifecycleSimulator, Scenario
+from tests.conftest import load_lambda
+
+
+@pytest.fixture
+def github():
+    with FakeGitHub("infrahouse", "pat") as github:
+        yield github
+
+
+def test_fake_github_serves_the_runner_api(github):
+    session = Session()
+    session.headers["Authorization"] = "Bearer pat"
+    runners_url = f"{github.url}/orgs/infrahouse/actions/runners"
+    token = session.post(f"{runners_url}/registration-token").json()["token"]
+    runner_ids = [
+        github.register_runner(token, f"runner-{index}", [f"instance_id:i-{index}"])
+        for index in range(3)
+    ]
+    github.update_runner(runner_ids[0], busy=True)
+
+    response = session.get(runners_url, params={"per_page": 2})
+    assert [runner["name"] for runner in response.json()["runners"]] == [
+        "runner-0",
+        "runner-1",
+    ]
+    response = session.get(response.links["next"]["url"])
+    assert [runner["name"] for runner in response.json()["runners"]] == ["runner-2"]
+    assert "next" not in response.links
+
+    # GitHub refuses to delete a runner that is running a job.
+    assert session.delete(f"{runners_url}/{runner_ids[0]}").status_code == 422
+    assert session.delete(f"{runners_url}/{runner_ids[1]}").status_code == 204
+    assert session.delete(f"{runners_url}/{runner_ids[1]}").status_code == 404
+    assert (
+        session.get(runners_url, headers={"Authorization": "Bearer other"}).status_code
+        == 401
+    )
+    with pytest.raises(ValueError):
+        github.register_runner("forged", "runner-3", [])
+    assert github.requests["GET /orgs/{org}/actions/runners"] == 2
+
+
+def test_lifecycle_replay():
+    scenario = Scenario(
+        launches=6, warm_fraction=0.5, busy_fraction=0.5, containers=2, seed=1
+    )
+    with LifecycleSimulator(scenario) as simulator:
+        report = simulator.run()
+
+    assert report["handler_errors"] == {}
+    assert report["boot_failures"] == 0
+    assert report["hook_results"] == {
+        "bootstrap CONTINUE": 6,
+        "deregistration CONTINUE": 6,
+        "registration CONTINUE": 6,
+    }
+    completed = {
+        name: delays["count"] for name, delays in report["hook_completion_s"].items()
+    }
+    # Only a resumed instance has a runner the bootstrap hook finds.
+    assert completed["bootstrap by lambda"] + completed["bootstrap by instance"] == 6
+    assert 0 < completed["bootstrap by lambda"] < 6
+    # The launches share one registration token.
+    assert (
+        report["github_requests"]["POST /orgs/{org}/actions/runners/registration-token"]
+        == 1
+    )
+    assert report["handler_ms"]["runner_registration"]["count"] == 12
+
+
+def test_controller_matches_record_metric():
+    record_metric = load_lambda("record_metric")
+    for current, busy, idle, queued, damping in product(
+        range(6), range(4), range(6), range(3), (0.5, 1.0)
+    ):
+        args = (current, 1, 8, busy, idle, queued, 1, damping)
+        assert autoscaling.desired_capacity(*args) == record_metric._desired_capacity(
+            *args
+        ), args
+
+
+def test_load_trace(tmp_path):
+    csv_trace = tmp_path / "jobs.csv"
+    csv_trace.write_text(
+        "created_at,started_at,completed_at\n"
+        "2025-01-01T10:01:00Z,2025-01-01T10:02:00Z,2025-01-01T10:07:00Z\n"
+        "2025-01-01T10:00:00Z,2025-01-01T10:00:30Z,2025-01-01T10:01:30Z\n"
+    )
+    assert autoscaling.load_trace(str(csv_trace)) == [(0.0, 60.0), (60.0, 300.0)]
+
+    github_export = tmp_path / "jobs.json"
+    github_export.write_text(
+        json.dumps(
+            [
+                {
+                    "total_count": 2,
+                    "jobs": [
+                        {
+                            "id": 1,
+                            "created_at": "2025-01-01T10:00:00Z",
+                            "started_at": "2025-01-01T10:00:10Z",
+                            "completed_at": "2025-01-01T10:02:10Z",
+                        },
+                        # Cancelled before it ran.
+                        {
+                            "id": 2,
+                            "created_at": "2025-01-01T10:00:05Z",
+                            "started_at": None,
+                            "completed_at": None,
+                        },
+                    ],
+                }
+            ]
+        )
+    )
+    assert autoscaling.load_trace(str(github_export)) == [(0.0, 120.0)]
+
+
+def test_warm_pool_shortens_job_waits():
+    # Bursts of 10 five-minute jobs every half an hour.
+    trace = [(1800.0 * burst, 300.0) for burst in range(1, 5) for _ in range(10)]
+    scenario = autoscaling.Scenario()
+    settings = autoscaling.PoolSettings(
+        asg_max_size=12, autoscaling_step=4, warm_pool_max_size=12
+    )
+
+    reports = autoscaling.sweep(scenario, settings, {"warm_pool": [False, True]}, trace)
+    cold, warm = reports
+    assert cold["warm_starts"] == 0 and cold["cold_starts"] > 0
+    assert warm["cold_starts"] < cold["cold_starts"] and warm["warm_starts"] > 0
+    assert warm["wait_s"]["p95"] < cold["wait_s"]["p95"]
+    assert cold["warm_pool_hours"] == 0 < warm["warm_pool_hours"]
+    assert all(report["jobs"] == report["wait_s"]["count"] == 40 for report in reports)
+    cheapest = min(reports, key=lambda report: report["instance_hours"])
+    assert autoscaling.recommend(reports, max_wait=3600) is cheapest
+    assert autoscaling.recommend(reports, max_wait=warm["wait_s"]["p95"]) is warm
+    # Nothing meets the wait: the shortest one is recommended.
+    assert autoscaling.recommend(reports, max_wait=0) is warm
+
+
+def test_idle_target_of_zero_scales_out_on_queued_jobs_only():
+    trace = [(600.0, 300.0)] * 5
+    scenario = autoscaling.Scenario()
+    settings = autoscaling.PoolSettings(idle_runners_target_count=0)
+
+    # IdleRunners can't drop below zero, so the alarm never fires.
+    report = autoscaling.simulate(scenario, settings, trace)
+    assert report["max_capacity"] == settings.asg_min_size
+    assert report["scale_outs"] == 0
+
+    settings.queued_jobs_source = "polling"
+    settings.queued_jobs_scaleout_threshold = 1
+    report = autoscaling.simulate(scenario, settings, trace)
+    assert report["max_capacity"] > settings.asg_min_size
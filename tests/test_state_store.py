@@ -0,0 +1,121 @@
+from filecmp import cmp
+from os import path as osp
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.conftest import LAMBDA_ROOT_DIR, load_lambda
+
+STATE_STORE_COPIES = [
+    osp.join(LAMBDA_ROOT_DIR, name, "lambda", "state_store.py")
+    for name in (
+        "runner_registration",
+        "runner_deregistration",
+        "record_metric",
+        "webhook_receiver",
+    )
+]
+STATE_TABLE = "test-asg-state"
+
+
+@pytest.fixture
+def state_store(monkeypatch):
+    monkeypatch.setenv("STATE_TABLE", STATE_TABLE)
+    with mock_aws():
+        boto3.client("dynamodb", region_name="us-east-1").create_table(
+            TableName=STATE_TABLE,
+            KeySchema=[{"AttributeName": "pk", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "pk", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        load_lambda("runner_registration")
+        import state_store
+
+        monkeypatch.setattr(
+            state_store, "_dynamodb", boto3.client("dynamodb", region_name="us-east-1")
+        )
+        yield state_store
+
+
+@pytest.mark.parametrize("copy", STATE_STORE_COPIES[1:])
+def test_state_store_copies_are_identical(copy):
+    assert cmp(
+        STATE_STORE_COPIES[0], copy, shallow=False
+    ), f"{copy} differs from {STATE_STORE_COPIES[0]}"
+
+
+def test_claim(state_store, monkeypatch):
+    clock = mock.Mock(return_value=1000.0)
+    monkeypatch.setattr(state_store, "time", clock)
+
+    assert state_store.claim("lifecycle#token#i-1", 60)
+    assert not state_store.claim("lifecycle#token#i-1", 60)
+    assert state_store.claim("lifecycle#token#i-2", 60)
+
+    # The claim has expired, but DynamoDB hasn't deleted it yet.
+    clock.return_value = 1061.0
+    assert state_store.claim("lifecycle#token#i-1", 60)
+
+
+def test_release(state_store):
+    assert state_store.claim("lifecycle#token#i-1", 60)
+    state_store.release("lifecycle#token#i-1")
+    assert state_store.claim("lifecycle#token#i-1", 60)
+
+
+def test_lifecycle_claim_is_extended_once_done(state_store, monkeypatch):
+    clock = mock.Mock(return_value=1000.0)
+    monkeypatch.setattr(state_store, "time", clock)
+    monkeypatch.setenv("LAMBDA_TIMEOUT", "60")
+
+    # The Lambda was killed while it held the lease: the retry isn't skipped.
+    assert state_store.claim("lifecycle#token#i-1", state_store.lifecycle_lease_ttl())
+    clock.return_value = 1061.0
+    assert state_store.claim("lifecycle#token#i-1", state_store.lifecycle_lease_ttl())
+
+    state_store.extend("lifecycle#token#i-1", state_store.LIFECYCLE_CLAIM_TTL)
+    clock.return_value = 1061.0 + 3600
+    assert not state_store.claim(
+        "lifecycle#token#i-1", state_store.lifecycle_lease_ttl()
+    )
+
+
+def test_claim_without_state_table(state_store, monkeypatch):
+    monkeypatch.delenv("STATE_TABLE")
+
+    assert state_store.claim("lifecycle#token#i-1", 60)
+    assert state_store.claim("lifecycle#token#i-1", 60)
+
+
+def test_get_many(state_store, monkeypatch):
+    clock = mock.Mock(return_value=1000.0)
+    monkeypatch.setattr(state_store, "time", clock)
+    # More keys than one BatchGetItem request reads.
+    for index in range(state_store.BATCH_GET_SIZE + 10):
+        state_store.put(f"launch#i-{index}", {"launch_type": "cold"}, 60)
+    state_store.put("launch#i-expired", {"launch_type": "cold"}, 10)
+    state_store.delete("launch#i-0")
+    clock.return_value = 1020.0
+
+    values = state_store.get_many(
+        [f"launch#i-{index}" for index in range(state_store.BATCH_GET_SIZE + 20)]
+        + ["launch#i-expired"]
+    )
+    assert sorted(values) == sorted(
+        f"launch#i-{index}" for index in range(1, state_store.BATCH_GET_SIZE + 10)
+    )
+    assert values["launch#i-1"] == state_store.get("launch#i-1")
+
+
+def test_get_counters(state_store):
+    assert state_store.get_counters("webhook#counters") == {}
+
+    state_store._dynamodb.update_item(
+        TableName=STATE_TABLE,
+        Key={"pk": {"S": "webhook#counters"}},
+        UpdateExpression="ADD queued :one",
+        ExpressionAttributeValues={":one": {"N": "1"}},
+    )
+    assert state_store.get_counters("webhook#counters") == {"queued": 1}
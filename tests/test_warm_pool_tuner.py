@@ -0,0 +1,165 @@
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+
+from tests.conftest import load_lambda
+
+DAY = 24 * 3600
+# Monday 2025-01-06 08:30 UTC.
+NOW = int(datetime(2025, 1, 6, 8, 30, tzinfo=timezone.utc).timestamp())
+PROFILES = [
+    {
+        "days": ["mon", "tue", "wed", "thu", "fri"],
+        "start_hour": 8,
+        "end_hour": 18,
+        "min_size": 3,
+        "max_size": 8,
+    },
+    {"days": [], "start_hour": 22, "end_hour": 6, "min_size": 0, "max_size": 1},
+]
+
+
+@pytest.fixture
+def tuner(monkeypatch):
+    monkeypatch.setenv("ASG_NAME", "test-asg")
+    monkeypatch.setenv("MIN_SIZE", "1")
+    monkeypatch.setenv("MAX_SIZE", "10")
+    monkeypatch.setenv("SIZE_PARAMETER", "/test-asg/warm-pool-size")
+    module = load_lambda("warm_pool_tuner")
+    monkeypatch.setattr(module, "time", mock.Mock(return_value=NOW + 10))
+    monkeypatch.setattr(module, "_autoscaling", mock.Mock())
+    monkeypatch.setattr(module, "_cloudwatch", mock.Mock())
+    monkeypatch.setattr(module, "_ssm", mock.Mock())
+    return module
+
+
+def _series(busy=None, cold=None, resume=None, warmed=None):
+    return {
+        "busy": busy or {},
+        "cold": cold or {},
+        "resume": resume or {},
+        "warmed": warmed or {},
+    }
+
+
+def _at(hour, minute=0, day=6):
+    return datetime(2025, 1, day, hour, minute, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "now, bounds",
+    [
+        (_at(8), (3, 8)),
+        (_at(17, 59), (3, 8)),
+        (_at(18), (1, 10)),
+        # Over midnight, every day.
+        (_at(23), (0, 1)),
+        (_at(5), (0, 1)),
+        # Saturday morning.
+        (_at(9, day=11), (1, 10)),
+    ],
+)
+def test_bounds(tuner, now, bounds):
+    assert tuner._bounds(now, PROFILES, 1, 10) == bounds
+
+
+def test_demand_looks_ahead_on_previous_days(tuner):
+    # Three days ago, busy runners went from 1 to 6 in ten minutes at 9:00,
+    # half an hour after the time of day of NOW.
+    burst_at = NOW - 3 * DAY + 1800
+    busy = {burst_at + minute * 60: min(1 + minute // 2, 6) for minute in range(20)}
+    assert tuner._demand(_series(busy=busy), NOW, 2) == 5
+
+    # A week ago is as far back as the tuner looks.
+    busy = {timestamp - 5 * DAY: value for timestamp, value in busy.items()}
+    assert tuner._demand(_series(busy=busy), NOW, 2) == 0
+
+
+def test_demand_counts_launches_and_cold_boots(tuner):
+    # Four launches within the burst window in the last hour, two of them cold.
+    launches = {"resume": {NOW - 600: 2}, "cold": {NOW - 540: 1, NOW - 480: 1}}
+    assert tuner._demand(_series(**launches), NOW, 2) == 4
+
+    # The warm pool of three ran dry: it was two instances short.
+    warmed = {NOW - 3000: 3, NOW - 540: 0}
+    assert tuner._demand(_series(warmed=warmed, **launches), NOW, 3) == 5
+
+
+def test_target_size(tuner):
+    # Grows at once, shrinks by one.
+    assert tuner._target_size(2, 5, 0, 10) == 5
+    assert tuner._target_size(5, 0, 0, 10) == 4
+    assert tuner._target_size(5, 0, 0, 3) == 3
+    assert tuner._target_size(0, 0, 2, 10) == 2
+
+
+def _metric_data(values):
+    return {
+        "MetricDataResults": [
+            {
+                "Id": name,
+                "Timestamps": [
+                    datetime.fromtimestamp(timestamp, tz=timezone.utc)
+                    for timestamp in series
+                ],
+                "Values": list(series.values()),
+            }
+            for name, series in values.items()
+        ]
+    }
+
+
+def test_handler_resizes_warm_pool(tuner, monkeypatch, capsys):
+    monkeypatch.setenv(
+        "PROFILES", '[{"start_hour": 8, "end_hour": 18, "min_size": 3, "max_size": 8}]'
+    )
+    tuner._autoscaling.describe_warm_pool.return_value = {
+        "WarmPoolConfiguration": {
+            "MinSize": 2,
+            "MaxGroupPreparedCapacity": 10,
+            "PoolState": "Hibernated",
+            "InstanceReusePolicy": {"ReuseOnScaleIn": False},
+        }
+    }
+    # A page of BusyRunners, then a page of launches.
+    tuner._cloudwatch.get_metric_data.side_effect = [
+        {**_metric_data({"busy": {NOW - 120: 1}}), "NextToken": "page-2"},
+        _metric_data({"resume": {NOW - 60: 4}}),
+    ]
+
+    tuner.lambda_handler({}, None)
+
+    assert tuner._cloudwatch.get_metric_data.call_args.kwargs["NextToken"] == "page-2"
+    tuner._autoscaling.put_warm_pool.assert_called_once_with(
+        AutoScalingGroupName="test-asg",
+        MinSize=4,
+        MaxGroupPreparedCapacity=4,
+        PoolState="Hibernated",
+        InstanceReusePolicy={"ReuseOnScaleIn": False},
+    )
+    # Terraform keeps the size the tuner set.
+    tuner._ssm.put_parameter.assert_called_once_with(
+        Name="/test-asg/warm-pool-size", Value="4", Type="String", Overwrite=True
+    )
+    assert '"WarmPoolTargetSize": 4' in capsys.readouterr().out
+
+    # Already that size.
+    tuner._autoscaling.describe_warm_pool.return_value["WarmPoolConfiguration"].update(
+        MinSize=4, MaxGroupPreparedCapacity=4
+    )
+    tuner._cloudwatch.get_metric_data.side_effect = [
+        _metric_data({"resume": {NOW - 60: 4}})
+    ]
+    tuner.lambda_handler({}, None)
+    tuner._autoscaling.put_warm_pool.assert_called_once()
+    tuner._ssm.put_parameter.assert_called_once()
+
+
+def test_handler_without_warm_pool(tuner):
+    tuner._autoscaling.describe_warm_pool.return_value = {"Instances": []}
+
+    tuner.lambda_handler({}, None)
+
+    tuner._cloudwatch.get_metric_data.assert_not_called()
+    tuner._autoscaling.put_warm_pool.assert_not_called()
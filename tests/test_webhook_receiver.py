@@ -0,0 +1,194 @@
+import hashlib
+import hmac
+import json
+from os import path as osp
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from tests.conftest import load_lambda
+
+WEBHOOKS_DIR = osp.join(osp.dirname(__file__), "data", "webhooks")
+WEBHOOK_SECRET = "It's a Secret to Everybody"
+STATE_TABLE = "test-asg-state"
+
+
+@pytest.fixture
+def webhook_receiver(monkeypatch):
+    monkeypatch.setenv(
+        "RUNNER_LABELS",
+        json.dumps(
+            [
+                "self-hosted",
+                "linux",
+                "x64",
+                "installation_id:4f2a5c1e-6c2b-4d3e-9a85-0f3b2f1a7c11",
+            ]
+        ),
+    )
+    monkeypatch.setenv("ASG_NAME", "test-asg")
+    monkeypatch.setenv("STATE_TABLE", STATE_TABLE)
+    monkeypatch.setenv("TRIGGER_DEBOUNCE", "10")
+    monkeypatch.setenv("RECORD_METRIC_FUNCTION", "test-asg_record_metric")
+    monkeypatch.setenv("WEBHOOK_SECRET", "webhook-secret")
+    with mock_aws():
+        dynamodb = boto3.client("dynamodb", region_name="us-east-1")
+        dynamodb.create_table(
+            TableName=STATE_TABLE,
+            KeySchema=[{"AttributeName": "pk", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "pk", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        secretsmanager = boto3.client("secretsmanager", region_name="us-east-1")
+        secretsmanager.create_secret(Name="webhook-secret", SecretString=WEBHOOK_SECRET)
+
+        module = load_lambda("webhook_receiver")
+        monkeypatch.setattr(module, "_lambda", mock.Mock())
+        yield module
+
+
+def _delivery(name, event="workflow_job", secret=WEBHOOK_SECRET, **job):
+    """
+    Build a function URL request that replays a recorded webhook delivery,
+    with the ``workflow_job`` attributes in ``job`` changed.
+    """
+    with open(osp.join(WEBHOOKS_DIR, f"{name}.json")) as fp:
+        body = fp.read()
+    if job:
+        payload = json.loads(body)
+        payload["workflow_job"].update(job)
+        body = json.dumps(payload)
+    signature = hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()
+    return {
+        "headers": {
+            "content-type": "application/json",
+            "x-github-delivery": f"{name}-delivery",
+            "x-github-event": event,
+            "x-hub-signature-256": f"sha256={signature}",
+        },
+        "body": body,
+        "isBase64Encoded": False,
+    }
+
+
+def _counters(module):
+    item = module._dynamodb.get_item(
+        TableName=STATE_TABLE, Key={"pk": {"S": module.COUNTERS_KEY}}
+    ).get("Item", {})
+    return {
+        name: int(item[name]["N"]) for name in module.COUNTED_STATUSES if name in item
+    }
+
+
+def test_invalid_signature_is_rejected(webhook_receiver):
+    response = webhook_receiver.lambda_handler(
+        _delivery("workflow_job_queued", secret="wrong"), None
+    )
+
+    assert response["statusCode"] == 401
+    assert _counters(webhook_receiver) == {}
+
+
+def test_ping(webhook_receiver):
+    response = webhook_receiver.lambda_handler(_delivery("ping", event="ping"), None)
+
+    assert response["statusCode"] == 200
+
+
+def test_job_lifecycle_updates_counters(webhook_receiver):
+    webhook_receiver.lambda_handler(_delivery("workflow_job_queued"), None)
+    assert _counters(webhook_receiver) == {"queued": 1, "in_progress": 0}
+    webhook_receiver._lambda.invoke.assert_called_once_with(
+        FunctionName="test-asg_record_metric",
+        InvocationType="Event",
+        Payload=json.dumps({"source": "webhook_receiver"}),
+    )
+
+    webhook_receiver.lambda_handler(_delivery("workflow_job_in_progress"), None)
+    assert _counters(webhook_receiver) == {"queued": 0, "in_progress": 1}
+
+    webhook_receiver.lambda_handler(_delivery("workflow_job_completed"), None)
+    assert _counters(webhook_receiver) == {"queued": 0, "in_progress": 0}
+
+
+def test_redelivery_and_out_of_order_deliveries_are_ignored(webhook_receiver):
+    webhook_receiver.lambda_handler(_delivery("workflow_job_queued"), None)
+    webhook_receiver.lambda_handler(_delivery("workflow_job_queued"), None)
+    assert _counters(webhook_receiver) == {"queued": 1, "in_progress": 0}
+
+    webhook_receiver.lambda_handler(_delivery("workflow_job_completed"), None)
+    # in_progress arrives after completed.
+    webhook_receiver.lambda_handler(_delivery("workflow_job_in_progress"), None)
+    assert _counters(webhook_receiver) == {"queued": 0, "in_progress": 0}
+
+
+def test_jobs_for_other_runners_are_ignored(webhook_receiver):
+    response = webhook_receiver.lambda_handler(
+        _delivery("workflow_job_queued_github_hosted"), None
+    )
+
+    assert response["statusCode"] == 202
+    assert _counters(webhook_receiver) == {}
+    webhook_receiver._lambda.invoke.assert_not_called()
+
+
+def test_record_metric_trigger_is_debounced(webhook_receiver, monkeypatch):
+    clock = mock.Mock(return_value=1000.0)
+    monkeypatch.setattr(webhook_receiver, "time", clock)
+
+    webhook_receiver._trigger_record_metric()
+    clock.return_value = 1005.0
+    webhook_receiver._trigger_record_metric()
+    assert webhook_receiver._lambda.invoke.call_count == 1
+
+    clock.return_value = 1010.0
+    webhook_receiver._trigger_record_metric()
+    assert webhook_receiver._lambda.invoke.call_count == 2
+
+
+def _job_timings(capsys):
+    """(JobWaitTime, JobDuration) of the published EMF records."""
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    return [(record["JobWaitTime"], record["JobDuration"]) for record in records]
+
+
+def test_completed_job_publishes_timing(webhook_receiver, capsys):
+    webhook_receiver.lambda_handler(_delivery("workflow_job_in_progress"), None)
+    assert _job_timings(capsys) == []
+
+    webhook_receiver.lambda_handler(_delivery("workflow_job_completed"), None)
+    webhook_receiver.lambda_handler(_delivery("workflow_job_completed"), None)
+    # The redelivery isn't published again.
+    assert _job_timings(capsys) == [(13.0, 197.0)]
+
+
+def test_job_timing_needs_installation_runner(webhook_receiver, capsys):
+    # Cancelled while queued: no runner ever picked it up.
+    webhook_receiver.lambda_handler(
+        _delivery("workflow_job_completed", id=1, runner_id=None, started_at=None),
+        None,
+    )
+    # Without the installation_id label, it may have run on another pool.
+    generic = {"labels": ["self-hosted", "linux"]}
+    webhook_receiver.lambda_handler(
+        _delivery("workflow_job_completed", id=2, **generic), None
+    )
+    assert _job_timings(capsys) == []
+
+    webhook_receiver.runner_snapshot.save(
+        [
+            webhook_receiver.runner_snapshot.SnapshotRunner(
+                1187, "ip-10-1-2-13", "i-1", "online", True, ()
+            )
+        ],
+        "4f2a5c1e-6c2b-4d3e-9a85-0f3b2f1a7c11",
+    )
+    webhook_receiver.lambda_handler(
+        _delivery("workflow_job_completed", id=3, **generic), None
+    )
+    webhook_receiver.lambda_handler(
+        _delivery("workflow_job_completed", id=4, runner_id=2000, **generic), None
+    )
+    assert _job_timings(capsys) == [(13.0, 197.0)]
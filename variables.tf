@@ -33,6 +33,49 @@ variable "asg_max_size" {
   default     = null
 }
 
+variable "autoscaling_mode" {
+  description = <<-EOT
+    How the ASG scales.
+    `alarms`: CloudWatch alarms on idle runners (and queued jobs) trigger step scaling
+    policies that add or remove `autoscaling_step` instances.
+    `controller`: the `record_metric` Lambda sets the desired capacity to busy runners
+    plus queued jobs plus `idle_runners_target_count` in one step,
+    and removes surplus idle runners gradually (see `autoscaling_scalein_damping`).
+  EOT
+  type        = string
+  default     = "alarms"
+  validation {
+    condition     = contains(["alarms", "controller"], var.autoscaling_mode)
+    error_message = "autoscaling_mode must be either 'alarms' or 'controller'."
+  }
+}
+
+variable "autoscaling_protect_busy_runners" {
+  description = <<-EOT
+    If true, the `record_metric` Lambda protects the instances of busy runners from scale-in
+    and removes the protection from idle ones every time it samples the runners.
+    Scale-in then only terminates idle runners instead of making a busy one drain its job
+    in `Terminating:Wait` for up to `allowed_drain_time`.
+    Instance refresh and `max_instance_lifetime_days` skip protected instances until their jobs finish.
+  EOT
+  type        = bool
+  default     = false
+}
+
+variable "autoscaling_scalein_damping" {
+  description = <<-EOT
+    In the `controller` autoscaling mode, the fraction of surplus idle runners
+    to remove per adjustment. 1 removes them all at once; smaller values scale in
+    more gradually and absorb the next burst better.
+  EOT
+  type        = number
+  default     = 0.5
+  validation {
+    condition     = var.autoscaling_scalein_damping > 0 && var.autoscaling_scalein_damping <= 1
+    error_message = "autoscaling_scalein_damping must be greater than 0 and at most 1."
+  }
+}
+
 variable "autoscaling_step" {
   description = "How many instances to add or remove when the autoscaling policy is triggered."
   type        = number
@@ -241,6 +284,105 @@ variable "python_version" {
   default     = "python3.12"
 }
 
+variable "queued_jobs_repositories" {
+  description = <<-EOT
+    Repositories in `github_org_name` whose queued jobs `record_metric` counts.
+    It publishes the QueuedJobs and OldestQueuedJobAge metrics for jobs that target
+    this installation's runner labels. Each repository costs a few GitHub API
+    calls per minute. The GitHub token must be able to read Actions.
+    Empty list disables the metrics.
+  EOT
+  type        = list(string)
+  default     = []
+}
+
+variable "queued_jobs_scaleout_threshold" {
+  description = <<-EOT
+    Scale out when at least this many jobs wait for a runner.
+    Requires `queued_jobs_repositories` or `webhook_secret_arn`. If null, queue depth doesn't trigger scaling.
+    Ignored in the `controller` autoscaling mode, which accounts for every queued job.
+  EOT
+  type        = number
+  default     = null
+  validation {
+    condition     = var.queued_jobs_scaleout_threshold == null ? true : var.queued_jobs_scaleout_threshold >= 1
+    error_message = "queued_jobs_scaleout_threshold must be at least 1"
+  }
+}
+
+variable "runner_bootstrap_poll_timeout" {
+  description = <<-EOT
+    How many seconds the registration Lambda waits for a launching instance's runner to come online
+    in GitHub before it completes the bootstrap lifecycle hook itself. Without it (0, the default),
+    only the instance completes the hook, and if that call fails, the instance waits in `Pending:Wait`
+    for the 20 minute hook timeout. Capped at `allowed_drain_time` minus 30 seconds.
+    Not applied with `runner_registration_sqs_buffer`.
+  EOT
+  type        = number
+  default     = 0
+  validation {
+    condition     = var.runner_bootstrap_poll_timeout >= 0 && var.runner_bootstrap_poll_timeout <= 900
+    error_message = "runner_bootstrap_poll_timeout must be between 0 and 900"
+  }
+}
+
+variable "runner_deregistration_concurrency" {
+  description = <<-EOT
+    How many stale runners the deregistration Lambda's scheduled sweep removes from GitHub
+    in parallel. After a spot reclaim or an instance refresh, dozens of runners go stale at once.
+    The sweep backs off when GitHub rate-limits the requests.
+  EOT
+  type        = number
+  default     = 4
+  validation {
+    condition     = var.runner_deregistration_concurrency >= 1 && var.runner_deregistration_concurrency <= 20
+    error_message = "runner_deregistration_concurrency must be between 1 and 20"
+  }
+}
+
+variable "runner_registration_sqs_buffer" {
+  description = <<-EOT
+    Deliver the launch lifecycle events to the registration Lambda through an SQS queue, in batches
+    of up to 10 gathered for up to 5 seconds. The Lambda lists the GitHub runners once per batch
+    instead of once per launching instance, which matters when the ASG launches many instances at once.
+  EOT
+  type        = bool
+  default     = false
+}
+
+variable "runner_metrics_emitter" {
+  description = <<-EOT
+    How `record_metric` publishes runner metrics.
+    `emf` writes them as CloudWatch Embedded Metric Format log lines, which CloudWatch Logs
+    turns into metrics asynchronously. `api` calls PutMetricData on every sample.
+    The metrics are the same either way.
+  EOT
+  type        = string
+  default     = "emf"
+  validation {
+    condition     = contains(["api", "emf"], var.runner_metrics_emitter)
+    error_message = "runner_metrics_emitter must be either 'api' or 'emf'."
+  }
+}
+
+variable "runner_metrics_period" {
+  description = <<-EOT
+    How often, in seconds, the record_metric Lambda samples BusyRunners and IdleRunners.
+
+    60 (the default) publishes one standard-resolution datapoint per minute.
+    10 or 30 makes each invocation take several samples over the minute and publish
+    them as high-resolution metrics, and the IdleRunnersTooLow scale-out alarm then
+    evaluates periods of the same length. Pair it with a shorter
+    autoscaling_scaleout_evaluation_period to react to bursts within seconds.
+  EOT
+  type        = number
+  default     = 60
+  validation {
+    condition     = contains([10, 30, 60], var.runner_metrics_period)
+    error_message = "runner_metrics_period must be one of 10, 30, or 60 seconds."
+  }
+}
+
 variable "role_name" {
   description = "IAM role name that will be created and used by EC2 instances"
   type        = string
@@ -297,6 +439,19 @@ variable "ubuntu_codename" {
   default     = "noble"
 }
 
+variable "webhook_secret_arn" {
+  description = <<-EOT
+    ARN of a Secrets Manager secret with a GitHub webhook secret.
+    If set, the module creates a Lambda function URL (see the `webhook_url` output)
+    that receives `workflow_job` webhooks. Configure an organization webhook with this URL
+    and secret, content type `application/json`, and the "Workflow jobs" event.
+    Queued jobs are then counted from webhooks instead of `queued_jobs_repositories`,
+    and a queued job triggers `record_metric` within seconds.
+  EOT
+  type        = string
+  default     = null
+}
+
 variable "warm_pool_min_size" {
   description = "How many instances to keep in the warm pool. By default, as many as idle runners count target plus one."
   type        = number
@@ -308,3 +463,58 @@ variable "warm_pool_max_size" {
   type        = number
   default     = null
 }
+
+variable "warm_pool_tuner_enabled" {
+  description = <<-EOT
+    Resize the warm pool every 15 minutes to the scale-out bursts of the last hour, and of the
+    next hour on each of the previous 7 days, within `warm_pool_tuner_min_size` and
+    `warm_pool_max_size` or the bounds of `warm_pool_tuner_profiles`. The tuner owns the warm pool's
+    size: `warm_pool_min_size` only seeds it, and `terraform apply` keeps the size the tuner set last.
+    Ignored without a warm pool, i.e. with `on_demand_base_capacity`.
+  EOT
+  type        = bool
+  default     = false
+}
+
+variable "warm_pool_tuner_min_size" {
+  description = "Smallest warm pool the tuner keeps outside `warm_pool_tuner_profiles`."
+  type        = number
+  default     = 0
+  validation {
+    condition     = var.warm_pool_tuner_min_size >= 0
+    error_message = "warm_pool_tuner_min_size must not be negative"
+  }
+}
+
+variable "warm_pool_tuner_profiles" {
+  description = <<-EOT
+    Warm pool size bounds of the tuner by time of day, e.g. a bigger pool on weekday mornings.
+    A profile applies from `start_hour` to `end_hour` UTC (over midnight if `start_hour` is later)
+    on its `days` (`mon` to `sun`, every day if empty). The first profile that applies wins;
+    outside the profiles, the bounds are `warm_pool_tuner_min_size` and `warm_pool_max_size`.
+    A profile's `min_size` and `max_size` are capped at `warm_pool_max_size`.
+  EOT
+  type = list(
+    object(
+      {
+        days       = optional(list(string), [])
+        start_hour = number
+        end_hour   = number
+        min_size   = number
+        max_size   = number
+      }
+    )
+  )
+  default = []
+  validation {
+    condition = alltrue([
+      for profile in var.warm_pool_tuner_profiles :
+      profile.start_hour >= 0 && profile.start_hour <= 23
+      && profile.end_hour >= 1 && profile.end_hour <= 24
+      && profile.start_hour != profile.end_hour
+      && profile.min_size >= 0 && profile.min_size <= profile.max_size
+      && alltrue([for day in profile.days : contains(["mon", "tue", "wed", "thu", "fri", "sat", "sun"], day)])
+    ])
+    error_message = "Every warm_pool_tuner_profiles entry needs hours within 0-24 that differ, 0 <= min_size <= max_size, and days among mon, tue, wed, thu, fri, sat, sun."
+  }
+}
@@ -0,0 +1,49 @@
+locals {
+  warm_pool_tuner_enabled = var.warm_pool_tuner_enabled && local.warm_pool_enabled
+  # The warm pool size the tuner set last, see aws_ssm_parameter.warm_pool_size.
+  warm_pool_tuned_size = local.warm_pool_tuner_enabled ? tonumber(aws_ssm_parameter.warm_pool_size[0].insecure_value) : null
+}
+
+# The tuner owns the warm pool size. Terraform seeds this parameter once and
+# then ignores its value; the tuner writes every size it sets to it, and the
+# ASG's warm pool reads it back. So a plan doesn't show drift, and an apply
+# doesn't undo the tuner.
+resource "aws_ssm_parameter" "warm_pool_size" {
+  #checkov:skip=CKV2_AWS_34:Holds the warm pool size, not a secret
+  count          = local.warm_pool_tuner_enabled ? 1 : 0
+  name           = "/${local.asg_name}/warm-pool-size"
+  description    = "Warm pool size the warm pool tuner set last"
+  type           = "String"
+  insecure_value = tostring(local.warm_pool_min)
+  tags           = local.default_module_tags
+  lifecycle {
+    ignore_changes = [insecure_value]
+  }
+}
+
+module "warm_pool_tuner" {
+  count                          = local.warm_pool_tuner_enabled ? 1 : 0
+  source                         = "./modules/warm_pool_tuner"
+  asg_name                       = aws_autoscaling_group.actions-runner.name
+  cloudwatch_log_group_retention = var.cloudwatch_log_group_retention
+  architecture                   = var.architecture
+  python_version                 = var.python_version
+
+  min_size = min(var.warm_pool_tuner_min_size, local.warm_pool_max)
+  max_size = local.warm_pool_max
+  # Like the bounds outside the profiles, a profile never grows the warm pool
+  # past warm_pool_max_size.
+  profiles = [
+    for profile in var.warm_pool_tuner_profiles : merge(profile, {
+      min_size = min(profile.min_size, local.warm_pool_max)
+      max_size = min(profile.max_size, local.warm_pool_max)
+    })
+  ]
+
+  size_parameter_name = aws_ssm_parameter.warm_pool_size[0].name
+
+  alarm_emails         = var.alarm_emails
+  error_rate_threshold = var.error_rate_threshold
+
+  tags = local.default_module_tags
+}
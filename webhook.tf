@@ -0,0 +1,19 @@
+module "webhook_receiver" {
+  count                          = local.webhook_enabled ? 1 : 0
+  source                         = "./modules/webhook_receiver"
+  asg_name                       = local.asg_name
+  cloudwatch_log_group_retention = var.cloudwatch_log_group_retention
+  architecture                   = var.architecture
+  python_version                 = var.python_version
+
+  webhook_secret_arn         = var.webhook_secret_arn
+  runner_labels              = concat(local.runner_default_labels, local.runner_labels)
+  state_table_name           = aws_dynamodb_table.state.name
+  state_table_arn            = aws_dynamodb_table.state.arn
+  record_metric_function_arn = module.record_metric.lambda_arn
+
+  alarm_emails         = var.alarm_emails
+  error_rate_threshold = var.error_rate_threshold
+
+  tags = local.default_module_tags
+}